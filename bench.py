@@ -0,0 +1,487 @@
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from manager import Manager, scan_dir
+
+
+SIZES = {'k': 1000, 'm': 1000_000}
+SUITES = ('listing', 'ops', 'thumbnails', 'ui')
+FANOUT = 100 # entries per directory of the deep trees
+DEPTH = 16 # deepest nesting of the deep trees, keeps paths short of PATH_MAX
+THRESHOLD = 0.10 # slower than the baseline by more than this is reported
+
+
+def legacy_listing(dir):
+    # what Manager.update_files did before the scandir engine
+    files = []
+    for f in os.listdir(dir):
+        fulldir = os.path.join(dir, f)
+        isfile = os.path.isfile(fulldir)
+        stat = os.stat(fulldir)
+        files.append((f, isfile, stat.st_size,
+                      dt.datetime.fromtimestamp(stat.st_ctime),
+                      dt.datetime.fromtimestamp(stat.st_mtime)))
+    return files
+
+
+def parse_count(text):
+    # '1000', '100k', '1m'
+    text = text.strip().lower()
+    if text[-1:] in SIZES:
+        return int(float(text[:-1]) * SIZES[text[-1]])
+    return int(text)
+
+
+def count_label(count):
+    for suffix, unit in reversed(SIZES.items()):
+        if count >= unit and count % unit == 0:
+            return f'{count // unit}{suffix}'
+    return str(count)
+
+
+# Synthetic trees. Each make_* fills an empty directory; tree() builds it
+# once per working directory, so big trees can be kept between runs.
+
+def make_tree(root, count):
+    # flat: count empty files in one directory
+    for i in range(count):
+        open(os.path.join(root, f'part-{i}'), 'a').close()
+
+
+def make_deep(root, count):
+    # count entries spread over nested directories, each one holding the
+    # next: FANOUT per directory until DEPTH levels, then the fan-out grows
+    # with count so a 1m tree stays DEPTH levels deep
+    depth = max(1, min(DEPTH, count // FANOUT))
+    per_level = -(-count // depth)
+    dir = root
+    for i in range(count):
+        if i and i % per_level == 0:
+            dir = os.path.join(dir, f'level-{i // per_level}')
+            os.mkdir(dir)
+        else:
+            open(os.path.join(dir, f'part-{i}'), 'a').close()
+
+
+def make_small(root, count, size=4096):
+    # many small files, FANOUT per subdirectory
+    data = os.urandom(size)
+    for i in range(count):
+        dir = os.path.join(root, f'dir-{i // FANOUT}')
+        if i % FANOUT == 0:
+            os.mkdir(dir)
+        with open(os.path.join(dir, f'file-{i}'), 'wb') as f:
+            f.write(data)
+
+
+def make_huge(root, count, size):
+    # a few big files of incompressible data
+    block = os.urandom(8 * 2**20)
+    for i in range(count):
+        with open(os.path.join(root, f'huge-{i}.bin'), 'wb') as f:
+            left = size
+            while left > 0:
+                f.write(block[:left])
+                left -= len(block)
+
+
+def make_jpegs(root, count, width=1920, height=1080):
+    from PIL import Image
+    for i in range(count):
+        img = Image.effect_noise((width, height), 32 + i % 64).convert('RGB')
+        img.save(os.path.join(root, f'photo-{i:04}.jpg'), quality=90)
+
+
+def tree(workdir, name, make, *args):
+    root = os.path.join(workdir, name)
+    marker = root + '.done'
+    if not os.path.exists(marker):
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.mkdir(root)
+        start = time.perf_counter()
+        make(root, *args)
+        open(marker, 'a').close()
+        print(f'  generated {name} in {time.perf_counter() - start:.1f} s',
+              file=sys.stderr)
+    return root
+
+
+def timeit(func, repeat, setup=None):
+    # best of repeat runs; setup runs before each one and is not timed
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class Results():
+    # named timings in seconds, printed as they come
+    def __init__(self):
+        self.timings = {}
+
+    def add(self, name, seconds):
+        self.timings[name] = seconds
+        print(f'{name:<52}{seconds * 1000:12.2f} ms')
+
+    def skip(self, suite, reason):
+        print(f'{suite}: skipped ({reason})')
+
+    def to_json(self, args):
+        return {'created': dt.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'args': {'sizes': args.sizes, 'repeat': args.repeat,
+                         'suites': args.suites},
+                'results': self.timings}
+
+
+def bench_listing(dir, label, repeat, results):
+    def listing(sorting_by):
+        def func():
+            manager = Manager(dir)
+            manager.set_sorting(sorting_by=sorting_by)
+        return func
+
+    manager = Manager(dir)
+
+    def cold():
+        manager.cache.invalidate(dir)
+        manager.update_files(dir)
+
+    def resort(**sorting):
+        def func():
+            manager.set_sorting(sorting_by='name', ascending=True,
+                                dirs_first=False)
+            manager.set_sorting(**sorting)
+        return func
+
+    files = list(manager.files)
+    results.add(f'{label}: legacy listdir+stat',
+                timeit(lambda: legacy_listing(dir), repeat))
+    results.add(f'{label}: scandir', timeit(lambda: scan_dir(dir), repeat))
+    results.add(f'{label}: update_files', timeit(cold, repeat))
+    results.add(f'{label}: update_files, cached',
+                timeit(lambda: manager.update_files(dir), repeat))
+    results.add(f'{label}: scandir, sort by ext',
+                timeit(listing('ext'), repeat))
+    results.add(f'{label}: scandir, sort by mtime',
+                timeit(listing('mtime'), repeat))
+    results.add(f'{label}: sort_files, new listing',
+                timeit(lambda: manager.set_files(list(files)), repeat))
+    results.add(f'{label}: sort_files, flip direction',
+                timeit(resort(ascending=False), repeat))
+    results.add(f'{label}: sort_files, natural name',
+                timeit(resort(sorting_by='natural'), repeat))
+    results.add(f'{label}: sort_files, dirs, ext, name',
+                timeit(resort(sorting_by=('ext', 'name'), dirs_first=True),
+                       repeat))
+
+
+def bench_walk(root, label, repeat, results):
+    # update_files on every directory of a tree, as when browsing through it
+    dirs = [dir for dir, _, _ in os.walk(root)]
+
+    def walk():
+        manager = Manager(root)
+        for dir in dirs:
+            manager.update_files(dir)
+
+    results.add(f'{label}: update_files on {len(dirs)} dirs',
+                timeit(walk, repeat))
+
+
+def bench_ops(workdir, src, label, repeat, results):
+    # paste_file, move_file and delete_file on copies of src; each run
+    # works on a fresh copy, made by the untimed setup
+    manager = Manager(workdir)
+    scratch = os.path.join(workdir, 'scratch')
+
+    def fresh():
+        if os.path.exists(scratch):
+            manager.delete_file(scratch)
+        os.mkdir(scratch)
+        os.mkdir(os.path.join(scratch, 'moved'))
+
+    def copied():
+        fresh()
+        manager.paste_file(src, scratch)
+
+    name = os.path.basename(src)
+    results.add(f'{label}: paste_file',
+                timeit(lambda: manager.paste_file(src, scratch), repeat,
+                       fresh))
+    results.add(f'{label}: move_file (rename)',
+                timeit(lambda: manager.move_file(os.path.join(scratch, name),
+                                                 os.path.join(scratch,
+                                                              'moved')),
+                       repeat, copied))
+    results.add(f'{label}: delete_file',
+                timeit(lambda: manager.delete_file(os.path.join(scratch,
+                                                                name)),
+                       repeat, copied))
+    shutil.rmtree(scratch)
+
+
+def bench_thumbnails(jpegs, repeat, results):
+    from thumbnails import ThumbnailCache
+    paths = sorted(os.path.join(jpegs, name) for name in os.listdir(jpegs))
+    store = tempfile.mkdtemp(prefix='pymanager-thumbs-')
+    try:
+        def cold():
+            cache = ThumbnailCache(root=store)
+            for path in paths:
+                cache.get(path, 128)
+
+        def clear():
+            shutil.rmtree(store)
+            os.mkdir(store)
+
+        warm = ThumbnailCache(root=store)
+        results.add(f'thumbnails: {len(paths)} jpegs, cold',
+                    timeit(cold, repeat, clear))
+        results.add(f'thumbnails: {len(paths)} jpegs, from disk',
+                    timeit(cold, repeat))
+        for path in paths:
+            warm.get(path, 128)
+        results.add(f'thumbnails: {len(paths)} jpegs, from memory',
+                    timeit(lambda: [warm.get(path, 128) for path in paths],
+                           repeat))
+    finally:
+        shutil.rmtree(store)
+
+
+def settle(gui, until=lambda: True):
+    # runs the Tk event loop until the listing has streamed in and until()
+    while gui.manager.stream is not None or not until():
+        gui.root.update()
+        time.sleep(0.001)
+    gui.root.update_idletasks()
+
+
+def bench_ui(dirs, jpegs, repeat, results):
+    # a real GUI with its root window withdrawn; needs a display (see
+    # --xvfb) and PIL
+    import tkinter as tk
+    try:
+        from interface import GUI
+        from thumbnails import ThumbnailCache
+    except ImportError as e:
+        results.skip('ui', e)
+        return
+    try:
+        gui = GUI()
+    except tk.TclError as e:
+        results.skip('ui', e)
+        return
+    gui.root.withdraw()
+    settle(gui)
+    home = os.path.dirname(dirs[0][1])
+
+    try:
+        for label, dir in dirs:
+            def cold():
+                gui.manager.cache.invalidate(dir)
+                gui.show_dir(dir=dir)
+                settle(gui)
+
+            def away():
+                gui.show_dir(dir=home)
+                settle(gui)
+
+            def cached():
+                gui.show_dir(dir=dir)
+                settle(gui)
+
+            results.add(f'{label}: show_dir', timeit(cold, repeat, away))
+            results.add(f'{label}: show_dir, cached',
+                        timeit(cached, repeat, away))
+
+            moves = min(1000, len(gui.rows) - 1)
+            if moves > 0:
+                def move():
+                    for _ in range(moves):
+                        gui.move_cursor(1)
+                    gui.root.update_idletasks()
+
+                def top():
+                    gui.show_dir(dir=dir)
+                    settle(gui)
+
+                results.add(f'{label}: move_cursor (per move)',
+                            timeit(move, repeat, top) / moves)
+
+        if jpegs is not None:
+            gui.show_dir(dir=jpegs)
+            settle(gui)
+            info = gui.infowindow
+            files = list(gui.rows)
+
+            def show_all():
+                for file in files:
+                    info.set_photo(file)
+                    settle(gui, lambda: info.preview_generation is None)
+
+            def clear():
+                info.thumbnails = ThumbnailCache(root=tempfile.mkdtemp(
+                    prefix='pymanager-thumbs-'))
+
+            results.add(f'set_photo, {len(files)} jpegs, first visit '
+                        '(per image)',
+                        timeit(show_all, repeat, clear) / len(files))
+            results.add(f'set_photo, {len(files)} jpegs, cached (per image)',
+                        timeit(show_all, repeat) / len(files))
+    finally:
+        gui.root.destroy()
+
+
+def start_xvfb():
+    # a private X server for the ui suite, None if Xvfb is not installed
+    display = f':{100 + os.getpid() % 400}'
+    try:
+        server = subprocess.Popen(['Xvfb', display, '-screen', '0',
+                                   '1280x800x24'],
+                                  stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return None
+    time.sleep(0.5)
+    os.environ['DISPLAY'] = display
+    return server
+
+
+def compare(timings, baseline, threshold):
+    # prints current against baseline timings, returns the regressions
+    regressions = []
+    print(f'\n{"benchmark":<52}{"baseline":>12}{"current":>12}{"change":>9}')
+    for name, seconds in timings.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:<52}{"-":>12}{seconds * 1000:10.2f}ms')
+            continue
+        change = seconds / before - 1 if before else 0.0
+        mark = ''
+        if change > threshold:
+            mark = '  slower'
+            regressions.append(name)
+        elif change < -threshold:
+            mark = '  faster'
+        print(f'{name:<52}{before * 1000:10.2f}ms{seconds * 1000:10.2f}ms'
+              f'{change:+9.1%}{mark}')
+    return regressions
+
+
+def run(args, results):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pymanager-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        sizes = [parse_count(size) for size in args.sizes.split(',')]
+        suites = args.suites.split(',')
+        flat = [(f'flat {count_label(count)}',
+                 tree(workdir, f'flat-{count}', make_tree, count))
+                for count in sizes]
+        jpegs = None
+        if 'thumbnails' in suites or 'ui' in suites:
+            try:
+                jpegs = tree(workdir, f'jpegs-{args.jpegs}', make_jpegs,
+                             args.jpegs)
+            except ImportError as e:
+                results.skip('jpeg corpus', e)
+
+        if 'listing' in suites:
+            for label, dir in flat:
+                bench_listing(dir, label, args.repeat, results)
+            for count in sizes:
+                deep = tree(workdir, f'deep-{count}', make_deep, count)
+                bench_walk(deep, f'deep {count_label(count)}', args.repeat,
+                           results)
+
+        if 'ops' in suites:
+            small = tree(workdir, f'small-{args.small}', make_small,
+                         args.small)
+            huge = tree(workdir, f'huge-{args.huge}x{args.huge_mb}',
+                        make_huge, args.huge, args.huge_mb * 2**20)
+            bench_ops(workdir, small, f'{count_label(args.small)} small files',
+                      args.repeat, results)
+            bench_ops(workdir, huge, f'{args.huge} x {args.huge_mb} MiB files',
+                      args.repeat, results)
+
+        if 'thumbnails' in suites and jpegs is not None:
+            bench_thumbnails(jpegs, args.repeat, results)
+
+        if 'ui' in suites:
+            bench_ui(flat, jpegs, args.repeat, results)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PyManager benchmarks')
+    parser.add_argument('-n', '--sizes', default='1k,100k',
+                        help='entries of the synthetic listings, e.g. '
+                        '1k,100k,1m')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-s', '--suites', default='listing,ops,thumbnails',
+                        help=f'comma separated, from {", ".join(SUITES)}')
+    parser.add_argument('--small', type=parse_count, default=10_000,
+                        help='small files copied by the ops suite')
+    parser.add_argument('--huge', type=int, default=2,
+                        help='big files copied by the ops suite')
+    parser.add_argument('--huge-mb', type=int, default=64)
+    parser.add_argument('--jpegs', type=int, default=20)
+    parser.add_argument('--workdir', help='generate the trees here and keep '
+                        'them for later runs')
+    parser.add_argument('--dir', help='benchmark listing an existing '
+                        'directory')
+    parser.add_argument('--xvfb', action='store_true',
+                        help='run the ui suite on a private Xvfb display')
+    parser.add_argument('-o', '--json', help='write the results here')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='compare with the results of an earlier --json')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    for suite in args.suites.split(','):
+        if suite not in SUITES:
+            parser.error(f'unknown suite {suite!r}')
+
+    results = Results()
+    server = start_xvfb() if args.xvfb else None
+    if args.xvfb and server is None:
+        print('Xvfb not found, using the current display', file=sys.stderr)
+    try:
+        if args.dir:
+            bench_listing(args.dir, os.path.basename(args.dir) or args.dir,
+                          args.repeat, results)
+        else:
+            run(args, results)
+    finally:
+        if server is not None:
+            server.terminate()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results.to_json(args), f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results.timings, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# python -m cli ls|du|cp|mv|rm|find ... (see --help): the file manager's
+# engine without the GUI. --json prints one JSON object per line.
+
+import argparse
+import datetime as dt
+import json
+import os
+import shutil
+import sys
+import time
+from threading import Thread
+
+from diskusage import DiskUsage
+from fileindex import DEFAULT_PATH, FileIndex, IndexSearch
+from manager import SORT_KEYS, Manager
+from operations import WORKERS, BatchJob, Cancelled, DeleteJob, POLICIES
+from search import Search, parse_query
+
+
+POLL_SECONDS = 0.05
+PROGRESS_SECONDS = 0.5
+
+
+def fail(error):
+    # Manager.on_error: errors end the command
+    raise error
+
+
+def emit(args, record, text):
+    print(json.dumps(record) if args.json else text)
+
+
+def describe(file):
+    try:
+        stat = file.stat
+    except OSError:
+        return {'path': file.fulldir, 'name': file.name, 'type': None,
+                'size': None, 'mtime': None}
+    return {'path': file.fulldir, 'name': file.name, 'type': file.type,
+            'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def ls(args):
+    fields = args.sort.split(',')
+    unknown = [field for field in fields if field not in SORT_KEYS]
+    if unknown:
+        print(f'Error: cannot sort by {", ".join(unknown)}', file=sys.stderr)
+        return 2
+    manager = Manager(os.path.abspath(args.dir), workers=args.workers,
+                      on_error=fail)
+    manager.set_sorting(sorting_by=fields[0] if len(fields) == 1
+                        else tuple(fields),
+                        ascending=not args.reverse,
+                        dirs_first=args.dirs_first)
+    for file in manager.files:
+        record = describe(file)
+        if record['type'] is None:
+            text = f'?            {"":16}  {file.name}'
+        else:
+            size = ('-' if record['type'] == 'directory'
+                    else Manager.sizeof_fmt(record['size']))
+            mtime = dt.datetime.fromtimestamp(record['mtime'])
+            text = (f'{record["type"][0]} {size:>10}  '
+                    f'{mtime:%Y-%m-%d %H:%M}  {file.name}')
+        emit(args, record, text)
+
+
+def du(args):
+    paths = [os.path.abspath(path) for path in args.paths]
+    dirs = [path for path in paths
+            if os.path.isdir(path) and not os.path.islink(path)]
+    usage = DiskUsage(workers=args.workers)
+    usage.request(dirs)
+    while usage.busy():
+        time.sleep(POLL_SECONDS)
+    status = 0
+    for path in paths:
+        if path in dirs:
+            total = usage.get(path)
+            size, files = total.bytes, total.files
+            for dir, error in total.errors:
+                # counted as empty
+                print(f'Error: {dir}: {error}', file=sys.stderr)
+                status = 1
+        else:
+            size, files = os.lstat(path).st_size, 1
+        emit(args, {'path': path, 'bytes': size, 'files': files},
+             f'{Manager.sizeof_fmt(size):>10}  {files:>9} files  {path}')
+    return status
+
+
+def run_task(args, task, summary):
+    # runs a job's task in a thread, with progress on stderr if asked;
+    # ctrl+c cancels it. Returns the exit status.
+    start = time.perf_counter()
+    errors = []
+
+    def run():
+        try:
+            task.run()
+        except shutil.Error as e:
+            errors.extend(e.args[0])
+        except Cancelled:
+            pass
+        except OSError as e:
+            errors.append((str(e),))
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(PROGRESS_SECONDS)
+            if args.progress and thread.is_alive():
+                print(f'{task.files_done} files, '
+                      f'{Manager.sizeof_fmt(task.bytes_done)}',
+                      file=sys.stderr)
+    except KeyboardInterrupt:
+        task.cancel()
+        thread.join()
+        return 130
+
+    record = summary(task)
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    record['errors'] = [list(error) for error in errors]
+    emit(args, record, ', '.join(f'{key}: {value}'
+                                 for key, value in record.items()
+                                 if key != 'errors'))
+    for error in errors:
+        print('Error:', ' '.join(map(str, error)), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def transfer(args, move):
+    dst = os.path.abspath(args.dst)
+    if not os.path.isdir(dst):
+        raise NotADirectoryError(f'{dst} is not a directory')
+    task = BatchJob([os.path.abspath(src) for src in args.src], dst,
+                    move=move, policy=args.policy, workers=args.workers)
+    return run_task(args, task, lambda task: {'files': task.files_done,
+                                              'bytes': task.bytes_done,
+                                              'names': task.names})
+
+
+def rm(args):
+    task = DeleteJob([os.path.abspath(path) for path in args.paths],
+                     workers=args.workers)
+    return run_task(args, task, lambda task: {'files': task.files_done,
+                                              'dirs': task.dirs_done,
+                                              'bytes': task.bytes_done})
+
+
+def find(args):
+    root = os.path.abspath(args.root)
+    try:
+        query = parse_query(' '.join(args.query))
+    except ValueError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 2
+    index = FileIndex(DEFAULT_PATH) if args.index else None
+    if index is not None and not query.content and index.root_of(root):
+        search = IndexSearch(index, root, query, max_results=args.max)
+    else:
+        search = Search(root, query, workers=args.workers,
+                        max_results=args.max)
+    search.start()
+    printed = 0
+    try:
+        while True:
+            finished = search.finished
+            search.drain()
+            for file in search.results[printed:]:
+                emit(args, {'path': file.fulldir, 'type': file.type},
+                     file.fulldir)
+            printed = len(search.results)
+            if finished:
+                break
+            time.sleep(POLL_SECONDS)
+    except KeyboardInterrupt:
+        search.cancel()
+        return 130
+    error = getattr(search, 'error', None) # IndexSearch: the query failed
+    if error is not None:
+        print(f'Error: {error}', file=sys.stderr)
+        return 1
+    if search.truncated:
+        print(f'Stopped after {args.max} results', file=sys.stderr)
+    return 0
+
+
+def parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', action='store_true',
+                        help='one JSON object per line')
+    common.add_argument('-j', '--workers', type=int, default=WORKERS,
+                        help='threads for the work (default %(default)s)')
+
+    parser = argparse.ArgumentParser(prog='python -m cli',
+                                     description='PyManager without the GUI')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('ls', parents=[common],
+                                  help='list a directory')
+    command.add_argument('dir', nargs='?', default='.')
+    command.add_argument('-s', '--sort', default='name',
+                         help='name, natural, ext, size or mtime; several '
+                         'comma separated, most significant first')
+    command.add_argument('-r', '--reverse', action='store_true')
+    command.add_argument('-d', '--dirs-first', action='store_true')
+    command.set_defaults(func=ls)
+
+    command = commands.add_parser('du', parents=[common],
+                                  help='recursive sizes')
+    command.add_argument('paths', nargs='+')
+    command.set_defaults(func=du)
+
+    for name, move in (('cp', False), ('mv', True)):
+        command = commands.add_parser(name, parents=[common],
+                                      help=('move' if move else 'copy')
+                                      + ' into a directory, as one job')
+        command.add_argument('src', nargs='+')
+        command.add_argument('dst')
+        command.add_argument('--policy', choices=POLICIES, default='rename',
+                             help='when the name is taken (default '
+                             '%(default)s)')
+        command.add_argument('--progress', action='store_true')
+        command.set_defaults(func=lambda args, move=move:
+                             transfer(args, move))
+
+    command = commands.add_parser('rm', parents=[common],
+                                  help='delete files and trees')
+    command.add_argument('paths', nargs='+')
+    command.add_argument('--progress', action='store_true')
+    command.set_defaults(func=rm)
+
+    command = commands.add_parser('find', parents=[common],
+                                  help='recursive search, same syntax as '
+                                  'the search bar')
+    command.add_argument('root')
+    command.add_argument('query', nargs='+',
+                         help="e.g. '*.pdf' 'size>1M' 'mtime<7d'")
+    command.add_argument('--max', type=int, default=100_000)
+    command.add_argument('--index', action='store_true',
+                         help='answer from the search index if the root '
+                         'is indexed')
+    command.set_defaults(func=find)
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    try:
+        status = args.func(args)
+    except BrokenPipeError:
+        status = 0
+    except OSError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        status = 1
+    sys.exit(status or 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import os
+import time
+from collections import OrderedDict, deque, namedtuple
+from threading import Condition, Thread
+
+
+# errors: (directory, message) of the directories that could not be read
+Total = namedtuple('Total', ['bytes', 'files', 'done', 'errors'])
+
+
+class Walk():
+    def __init__(self, root):
+        self.root = root
+        self.bytes = 0
+        self.files = 0
+        self.pending = 1
+        self.errors = []
+        self.cancelled = False
+
+
+class DiskUsage():
+    # Recursive directory sizes computed by a pool of scandir workers.
+    # Each directory's own contents (size and count of its files, list of
+    # subdirectories) are cached keyed by its inode/mtime, so re-measuring an
+    # unchanged tree only stats directories. Walks are requested as a set
+    # of roots: roots missing from a new request are cancelled, the first
+    # root is walked first. Callers read totals with get()/drain(), workers
+    # never call back into the UI. Finished totals are kept for the
+    # MAX_TOTALS roots used last.
+    MAX_DIRS = 1_000_000
+    MAX_TOTALS = 100_000
+    FRESH_SECONDS = 30
+
+    def __init__(self, workers=4):
+        self.complete = OrderedDict() # root -> (Total, time)
+        self.partial = {}
+        self._own = OrderedDict() # dir -> (signature, bytes, files, subdirs)
+        self._walks = {}
+        self._queue = deque()
+        self._changed = set()
+        self._cond = Condition()
+        self.workers = workers
+        self.threads = []
+
+    def request(self, roots):
+        now = time.monotonic()
+        roots = list(dict.fromkeys(roots))
+        wanted = set(roots)
+        with self._cond:
+            if roots and not self.threads:
+                self.threads = [Thread(target=self.work, daemon=True)
+                                for _ in range(self.workers)]
+                for thread in self.threads:
+                    thread.start()
+            for root in list(self._walks):
+                if root not in wanted:
+                    self._walks.pop(root).cancelled = True
+                    self.partial.pop(root, None)
+            for root in reversed(roots):
+                if root in self._walks or self.fresh(root, now):
+                    continue
+                walk = Walk(root)
+                self._walks[root] = walk
+                self._queue.appendleft((walk, root))
+            self._cond.notify_all()
+
+    def fresh(self, root, now):
+        complete = self.complete.get(root)
+        return complete is not None and now - complete[1] < self.FRESH_SECONDS
+
+    def known(self, root):
+        # measured recently or being measured: requesting it again is a no-op
+        now = time.monotonic()
+        with self._cond:
+            return root in self._walks or self.fresh(root, now)
+
+    def cancel(self):
+        self.request([])
+
+    def busy(self):
+        return bool(self._walks)
+
+    def get(self, root):
+        with self._cond:
+            if root in self.complete:
+                self.complete.move_to_end(root)
+                return self.complete[root][0]
+            return self.partial.get(root)
+
+    def drain(self):
+        # totals that changed since the last call, {root: Total}
+        with self._cond:
+            changed, self._changed = self._changed, set()
+            return {root: self.complete[root][0] if root in self.complete
+                    else self.partial[root]
+                    for root in changed
+                    if root in self.complete or root in self.partial}
+
+    def work(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                walk, dir = self._queue.popleft()
+            if walk.cancelled:
+                continue
+
+            bytes, files, subdirs, error = self.scan(dir)
+
+            with self._cond:
+                if walk.cancelled:
+                    continue
+                if error is not None:
+                    walk.errors.append((dir, error))
+                walk.bytes += bytes
+                walk.files += files
+                walk.pending += len(subdirs) - 1
+                # depth first keeps the queue small on huge trees
+                self._queue.extendleft((walk, subdir) for subdir in subdirs)
+                total = Total(walk.bytes, walk.files, walk.pending == 0,
+                              tuple(walk.errors))
+                if total.done:
+                    self._walks.pop(walk.root, None)
+                    self.partial.pop(walk.root, None)
+                    self.complete[walk.root] = (total, time.monotonic())
+                    self.complete.move_to_end(walk.root)
+                    if len(self.complete) > self.MAX_TOTALS:
+                        self.complete.popitem(last=False)
+                else:
+                    self.partial[walk.root] = total
+                self._changed.add(walk.root)
+
+    def scan(self, dir):
+        # (bytes, files, subdirectories, error) of dir's own entries; a
+        # directory that cannot be read is not cached
+        try:
+            stat = os.stat(dir, follow_symlinks=False)
+        except OSError as e:
+            return 0, 0, [], str(e)
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        with self._cond:
+            cached = self._own.get(dir)
+            if cached is not None and cached[0] == signature:
+                self._own.move_to_end(dir)
+                return cached[1:] + (None,)
+
+        bytes = files = 0
+        subdirs = []
+        try:
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        else:
+                            bytes += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except OSError:
+                        pass
+        except OSError as e:
+            return bytes, files, subdirs, str(e)
+
+        with self._cond:
+            self._own[dir] = (signature, bytes, files, subdirs)
+            if len(self._own) > self.MAX_DIRS:
+                self._own.popitem(last=False)
+        return bytes, files, subdirs, None
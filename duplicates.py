@@ -0,0 +1,203 @@
+import hashlib
+import multiprocessing
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from manager import File
+from operations import Cancelled
+
+
+EDGE = 16 * 1024 # bytes hashed at each end of a file in the second stage
+BLOCK = 8 * 1024 * 1024
+
+
+Group = namedtuple('Group', ['size', 'paths', 'reclaimable'])
+
+
+def hash_edges(path, size):
+    # digest of the first and last EDGE bytes, of the whole file when it is
+    # not bigger than that; None if it cannot be read
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            if size <= 2 * EDGE:
+                digest.update(f.read())
+            else:
+                digest.update(f.read(EDGE))
+                f.seek(-EDGE, os.SEEK_END)
+                digest.update(f.read(EDGE))
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def hash_full(path, size):
+    digest = hashlib.blake2b()
+    buffer = bytearray(BLOCK)
+    view = memoryview(buffer)
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                digest.update(view[:n])
+    except OSError:
+        return None
+    return digest.digest()
+
+
+class DuplicateFinder():
+    # Finds files with the same contents under root, in stages that each
+    # read more of fewer files: files are grouped by size (files of a
+    # unique size are never opened), then by a hash of their first and
+    # last EDGE bytes, then by a hash of their whole contents. Small files
+    # are read entirely by the second stage and skip the third. Hashing
+    # runs in a process pool. Hard links to one inode count as one file,
+    # removing them would not free anything. Runs as a scheduler task.
+    WINDOW = 256 # files in flight per worker process
+
+    def __init__(self, root, workers=None, min_size=1):
+        self.root = root
+        self.workers = workers or os.cpu_count() or 1
+        self.min_size = min_size
+        self.groups = [] # Group, most reclaimable first
+        self.results = [] # File of every group, kept file first
+        self.labels = {} # File -> group label
+        self.stage = None
+        self.files_done = 0
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    # the interface of search.Search, to show the groups in the left pane
+    @property
+    def finished(self):
+        return self.done
+
+    def drain(self):
+        return 0
+
+    def resume(self):
+        self.cancelled = False
+        self.run()
+
+    def run(self):
+        self.done = False
+        self.files_done = self.bytes_done = 0
+        self.bytes_total = None
+        self.stage = 'scanning'
+        by_size = self.scan()
+        candidates = [(path, size) for size, paths in by_size.items()
+                      if len(paths) > 1 for path in paths]
+
+        # spawned workers: forking a process with running threads (and Tk)
+        # is not safe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            self.stage = 'hashing ends'
+            self.bytes_total = sum(min(size, 2 * EDGE)
+                                   for _, size in candidates)
+            edges = self.group(pool, hash_edges, candidates)
+
+            final = [(size, paths) for (size, _), paths in edges.items()
+                     if size <= 2 * EDGE]
+            candidates = [(path, size) for (size, _), paths in edges.items()
+                          if size > 2 * EDGE for path in paths]
+            self.stage = 'hashing contents'
+            self.bytes_total += sum(size for _, size in candidates)
+            final += [(size, paths) for (size, _), paths 
+                      in self.group(pool, hash_full, candidates).items()]
+
+        self.stage = None
+        self.set_groups(final)
+        self.done = True
+
+    def scan(self):
+        # {size: [path]} of regular files, one path per inode
+        by_size = defaultdict(list)
+        seen = set()
+        stack = [self.root]
+        while stack:
+            if self.cancelled:
+                raise Cancelled(self.root)
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                                continue
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if stat.st_size < self.min_size:
+                            continue
+                        inode = (stat.st_dev, stat.st_ino)
+                        if inode in seen:
+                            continue
+                        seen.add(inode)
+                        by_size[stat.st_size].append(entry.path)
+            except OSError:
+                pass
+        return by_size
+
+    def group(self, pool, func, files):
+        # {(size, digest): [path]} of the groups with more than one file;
+        # work is submitted in windows so cancelling is quick
+        groups = defaultdict(list)
+        window = self.workers * self.WINDOW
+        for start in range(0, len(files), window):
+            futures = {pool.submit(func, path, size): (path, size)
+                       for path, size in files[start:start + window]}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2)
+                if self.cancelled:
+                    for future in pending:
+                        future.cancel()
+                    raise Cancelled(self.root)
+                for future in done:
+                    path, size = futures[future]
+                    digest = future.result()
+                    self.files_done += 1
+                    self.bytes_done += (size if func is hash_full
+                                        else min(size, 2 * EDGE))
+                    if digest is not None:
+                        groups[(size, digest)].append(path)
+        return {key: sorted(paths) for key, paths in groups.items()
+                if len(paths) > 1}
+
+    def set_groups(self, groups):
+        # the shallowest path of a group is the one to keep
+        self.groups = []
+        for size, paths in groups:
+            paths = sorted(paths, key=lambda path: (path.count(os.path.sep),
+                                                    path))
+            self.groups.append(Group(size, paths, size * (len(paths) - 1)))
+        self.groups.sort(key=lambda group: group.reclaimable, reverse=True)
+
+        self.results = []
+        self.labels = {}
+        for number, group in enumerate(self.groups, 1):
+            for i, path in enumerate(group.paths):
+                file = File(path)
+                file.type = 'file'
+                self.results.append(file)
+                self.labels[file] = f'#{number} ' + ('keep' if i == 0 
+                                                     else 'extra')
+
+    @property
+    def reclaimable(self):
+        return sum(group.reclaimable for group in self.groups)
+
+    def extras(self):
+        # every path but the first of each group
+        return [path for group in self.groups for path in group.paths[1:]]
@@ -0,0 +1,273 @@
+import os
+import queue
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import closing
+from threading import Thread
+
+from manager import File
+
+
+CACHE_HOME = (os.environ.get('XDG_CACHE_HOME')
+              or os.path.join(os.path.expanduser('~'), '.cache'))
+DEFAULT_PATH = os.path.join(CACHE_HOME, 'pymanager', 'index.sqlite3')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY, built REAL, seconds REAL,
+    dirs INTEGER, rescanned INTEGER, entries INTEGER);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY, dir TEXT NOT NULL, name TEXT NOT NULL,
+    ext TEXT, size INTEGER, mtime REAL, is_dir INTEGER);
+CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir);
+'''
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO names (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO names (names, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+'''
+COMMIT_EVERY = 1000 # directories per transaction
+GLOB_CLASS = re.compile(r'\[[^\]]*\]')
+GLOB_SPLIT = re.compile(r'[*?\[\]]')
+
+
+Timing = namedtuple('Timing', ['root', 'seconds', 'dirs', 'rescanned',
+                               'entries'])
+
+
+SUBTREE = '({0} = ? OR ({0} >= ? AND {0} < ?))'
+
+
+def subtree(path):
+    # arguments for SUBTREE: path itself, and everything starting with
+    # path + '/' (a range, so the index on the column is used)
+    prefix = path.rstrip(os.path.sep) + os.path.sep
+    return path, prefix, prefix[:-1] + chr(ord(os.path.sep) + 1)
+
+
+def literal(query):
+    # longest run of plain characters every match of a glob contains, for
+    # the trigram index (which needs at least 3 characters)
+    if query.pattern is None or query.regex:
+        return None
+    parts = GLOB_SPLIT.split(GLOB_CLASS.sub('*', query.pattern))
+    longest = max(parts, key=len)
+    return longest if len(longest) >= 3 else None
+
+
+class FileIndex():
+    # Opt-in persistent index of chosen roots in SQLite: one row per entry
+    # (directory, name, ext, size, mtime) plus each directory's mtime.
+    # A refresh walks the tree but only re-lists directories whose mtime
+    # changed; unchanged ones get their subdirectories from the index.
+    # Names are indexed with FTS5 trigrams when SQLite has them, so name
+    # queries do not scan the table. Every call opens its own connection,
+    # so the index can be used from any thread.
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fts = True
+        with closing(self.connect()) as db:
+            db.executescript(SCHEMA)
+            try:
+                db.executescript(FTS_SCHEMA)
+            except sqlite3.OperationalError:
+                # no fts5 or no trigram tokenizer, names are scanned
+                self.fts = False
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def roots(self):
+        # {root: Timing of its last refresh}
+        with closing(self.connect()) as db:
+            return {row[0]: Timing(*row) for row in db.execute(
+                'SELECT path, seconds, dirs, rescanned, entries FROM roots')}
+
+    def root_of(self, dir):
+        # the indexed root dir is in, or None
+        for root in self.roots():
+            if dir == root or dir.startswith(root.rstrip(os.path.sep)
+                                              + os.path.sep):
+                return root
+        return None
+
+    def refresh(self, root):
+        # indexes root (the first time) or brings its index up to date,
+        # returns the Timing
+        start = time.perf_counter()
+        dirs = rescanned = 0
+        with closing(self.connect()) as db:
+            stack = [root]
+            while stack:
+                dir = stack.pop()
+                dirs += 1
+                subdirs, changed = self.refresh_dir(db, dir)
+                stack.extend(subdirs)
+                if changed:
+                    rescanned += 1
+                    if rescanned % COMMIT_EVERY == 0:
+                        db.commit()
+            entries = db.execute(
+                'SELECT count(*) FROM entries WHERE ' + SUBTREE.format('dir'),
+                subtree(root)).fetchone()[0]
+            timing = Timing(root, time.perf_counter() - start, dirs,
+                            rescanned, entries)
+            db.execute('INSERT OR REPLACE INTO roots '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (root, time.time()) + timing[1:])
+            db.commit()
+        return timing
+
+    def refresh_dir(self, db, dir):
+        # returns the subdirectories to visit and whether dir was re-listed
+        try:
+            mtime_ns = os.stat(dir, follow_symlinks=False).st_mtime_ns
+        except OSError:
+            self.forget(db, dir)
+            return [], True
+        known = db.execute('SELECT mtime_ns FROM dirs WHERE path = ?',
+                           (dir,)).fetchone()
+        indexed = {name for name, in db.execute(
+            'SELECT name FROM entries WHERE dir = ? AND is_dir = 1', (dir,))}
+        if known is not None and known[0] == mtime_ns:
+            return [os.path.join(dir, name) for name in indexed], False
+
+        rows = []
+        try:
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    ext = '' if is_dir else entry.name[entry.name.rfind('.')
+                                                       + 1:]
+                    rows.append((dir, entry.name, ext, stat.st_size,
+                                 stat.st_mtime, is_dir))
+        except OSError:
+            pass
+        subdirs = {row[1] for row in rows if row[5]}
+        for name in indexed - subdirs:
+            self.forget(db, os.path.join(dir, name))
+        db.execute('DELETE FROM entries WHERE dir = ?', (dir,))
+        db.executemany('INSERT INTO entries (dir, name, ext, size, mtime, '
+                       'is_dir) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)',
+                   (dir, mtime_ns))
+        return [os.path.join(dir, name) for name in subdirs], True
+
+    def forget(self, db, dir):
+        # drops dir and everything below it
+        db.execute('DELETE FROM entries WHERE ' + SUBTREE.format('dir'),
+                   subtree(dir))
+        db.execute('DELETE FROM dirs WHERE ' + SUBTREE.format('path'),
+                   subtree(dir))
+
+    def remove_root(self, root):
+        with closing(self.connect()) as db:
+            self.forget(db, root)
+            db.execute('DELETE FROM roots WHERE path = ?', (root,))
+            db.commit()
+
+    def query(self, query, root, limit=100_000):
+        # entries below root matching a search.Query (content is not
+        # indexed and is ignored), as (path, is_dir, size, mtime) rows
+        sql = ('SELECT entries.dir, entries.name, entries.is_dir, '
+               'entries.size, entries.mtime FROM entries')
+        where = [SUBTREE.format('entries.dir')]
+        params = list(subtree(root))
+        hint = literal(query) if self.fts else None
+        if hint is not None:
+            sql += ' JOIN names ON names.rowid = entries.id'
+            where.append('names MATCH ?')
+            params.append('"' + hint.replace('"', '""') + '"')
+        if query.type is not None:
+            where.append('entries.is_dir = ?')
+            params.append(query.type == 'directory')
+        if query.sized:
+            where.append('entries.is_dir = 0')
+        for column, op, value in (('size', '>=', query.min_size),
+                                  ('size', '<=', query.max_size),
+                                  ('mtime', '>=', query.newer),
+                                  ('mtime', '<=', query.older)):
+            if value is not None:
+                where.append(f'entries.{column} {op} ?')
+                params.append(value)
+        sql += ' WHERE ' + ' AND '.join(where)
+
+        rows = []
+        with closing(self.connect()) as db:
+            for dir, name, is_dir, size, mtime in db.execute(sql, params):
+                if query.name is None or query.name(name):
+                    rows.append((os.path.join(dir, name), bool(is_dir),
+                                 size, mtime))
+                    if len(rows) >= limit:
+                        break
+        return rows
+
+
+class IndexSearch():
+    # A search.Search answered from the index: same interface, so the GUI
+    # shows both the same way. Runs the query in a background thread.
+    def __init__(self, index, root, query, max_results=100_000):
+        self.index = index
+        self.root = root
+        self.query = query
+        self.max_results = max_results
+        self.results = [] # filled by drain()
+        self.dirs = 0
+        self.seconds = None
+        self.done = False
+        self.cancelled = False
+        self.truncated = False
+        self.error = None
+        self._found = queue.SimpleQueue()
+        self.threads = [Thread(target=self.run, daemon=True)]
+
+    def start(self):
+        self.threads[0].start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    @property
+    def finished(self):
+        return not self.threads[0].is_alive()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            rows = self.index.query(self.query, self.root,
+                                    self.max_results + 1)
+        except sqlite3.Error as e:
+            self.error = e
+            return
+        self.truncated = len(rows) > self.max_results
+        files = [File.from_row(*row) for row in rows[:self.max_results]]
+        self.seconds = time.perf_counter() - start
+        if not self.cancelled:
+            self._found.put(files)
+        self.done = True
+
+    def drain(self):
+        count = 0
+        while True:
+            try:
+                batch = self._found.get_nowait()
+            except queue.Empty:
+                return count
+            self.results.extend(batch)
+            count += len(batch)
@@ -0,0 +1,70 @@
+import os
+from collections import OrderedDict
+
+
+ICONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icons')
+VIDEO_EXTS = ('mp4', 'ogg', 'avi', 'mov', 'mpg', 'flv')
+SPECIAL_ICONS = ('dir', 'loading', 'logo', 'nofile', 'video')
+
+
+class IconRegistry():
+    # Icons are decoded the first time they are shown (so PIL is not even
+    # imported before the first preview), then PhotoImages are kept scaled
+    # to each size in use (the most recent few). PhotoImages are created on
+    # the thread that asks for them, which must be the Tk thread.
+    MAX_SOURCE_SIZE = 512
+    MAX_SIZES = 2
+
+    def __init__(self, size=128, dir=ICONS_DIR):
+        self.size = size
+        self.paths = {} # name -> png file
+        for f in os.listdir(dir):
+            name, ext = os.path.splitext(f)
+            if ext.lower() == '.png':
+                self.paths[name] = os.path.join(dir, f)
+        self.sources = {} # name -> decoded image
+
+        self.exts = {name.lower(): name for name in self.paths
+                     if name not in SPECIAL_ICONS}
+        if 'video' in self.paths:
+            self.exts.update((ext, 'video') for ext in VIDEO_EXTS)
+
+        self._scaled = OrderedDict() # size -> {name: PhotoImage}
+
+    def set_size(self, size):
+        self.size = size
+
+    def source(self, name):
+        from PIL import Image
+        img = self.sources.get(name)
+        if img is None:
+            img = Image.open(self.paths[name]).convert('RGBA')
+            img.thumbnail((self.MAX_SOURCE_SIZE, self.MAX_SOURCE_SIZE),
+                          Image.Resampling.LANCZOS)
+            self.sources[name] = img
+        return img
+
+    def scaled(self):
+        icons = self._scaled.get(self.size)
+        if icons is None:
+            icons = self._scaled[self.size] = {}
+            while len(self._scaled) > self.MAX_SIZES:
+                self._scaled.popitem(last=False)
+        else:
+            self._scaled.move_to_end(self.size)
+        return icons
+
+    def get(self, name):
+        from PIL import Image, ImageTk
+        icons = self.scaled()
+        icon = icons.get(name)
+        if icon is None:
+            icon = icons[name] = ImageTk.PhotoImage(
+                self.source(name).resize([self.size, self.size],
+                                         Image.Resampling.LANCZOS))
+        return icon
+
+    def for_file(self, file):
+        if file.type == 'directory':
+            return self.get('dir')
+        return self.get(self.exts.get(file.ext.lower(), 'nofile'))
@@ -1,10 +1,22 @@
 import tkinter as tk
 import os
+import queue
 from threading import Thread
-import time
-from PIL import Image, ImageTk
+from tkinter.messagebox import askyesno, showerror
 
 from manager import Manager
+from iconregistry import ICONS_DIR, IconRegistry
+from jobs import (DONE, FAILED, FINISHED, PAUSED, QUEUED, RUNNING, Job, 
+                  Scheduler)
+from previews import PreviewPool
+from quickfilter import MODES, QuickFilter
+from search import Search, parse_query
+from fileindex import DEFAULT_PATH, FileIndex, IndexSearch
+from duplicates import DuplicateFinder
+from thumbnails import ThumbnailCache
+from watcher import watch
+import tracing
+from tracing import traced, untraced
 
 
 class ThemeConfigure():
@@ -40,7 +52,11 @@ class ThemeConfigure():
     def update_theme(self):
         self.gui.update_theme()
         self.gui.infowindow.update_theme()
+        self.gui.jobspanel.update_theme()
         self.gui.bar.update_theme()
+        self.gui.filterbar.update_theme()
+        self.gui.searchbar.update_theme()
+        self.gui.traceoverlay.update_theme()
 
 
 class ContextMenu(tk.Listbox):
@@ -55,7 +71,12 @@ class ContextMenu(tk.Listbox):
         self.draw()
 
     def draw(self):
+        if (self.gui.selection 
+                and self.cell.file.fulldir not in self.gui.selection):
+            self.gui.clear_selection()
         self.gui.set_cursor(self.cell.index)
+        count = len(self.gui.selection)
+        items = f' {count} items' if count > 1 else ''
 
         self.menu = tk.Menu(self, tearoff=0, bg=self.gui.second_color,
                             fg=self.gui.font_color, font=self.gui.font,
@@ -73,28 +94,22 @@ class ContextMenu(tk.Listbox):
         self.menu.add_command(label='Rename', 
                               command=lambda: 
                               self.gui.infowindow.title.focus())
-        self.menu.add_command(label='Delete', 
-                              command=lambda:
-                              Thread(target=self.gui.delete_file).start())
+        self.menu.add_command(label='Delete' + items, 
+                              command=lambda: self.gui.delete_file())
 
         self.menu.add_separator()
         
-        self.menu.add_command(label='Copy', 
-                              command=lambda: 
-                              Thread(target=self.gui.copy_file).start())
-        if self.gui.copied_file:
+        self.menu.add_command(label='Copy' + items, 
+                              command=lambda: self.gui.copy_file())
+        if self.gui.copied_files:
             self.menu.add_command(label='Paste', 
-                                  command=lambda: 
-                                  Thread(target=self.gui.paste_action).start())
+                                  command=lambda: self.gui.paste_action())
         
-        self.menu.add_command(label='Move', 
-                              command=lambda: 
-                              Thread(target=self.gui.move_file).start())
-        if self.gui.moving_file:
+        self.menu.add_command(label='Move' + items, 
+                              command=lambda: self.gui.move_file())
+        if self.gui.moving_files:
             self.menu.add_command(label='Move here', 
-                                  command=lambda: 
-                                  Thread(target=self.gui.move_complete).start()
-                                  )
+                                  command=lambda: self.gui.move_complete())
         
         self.menu.add_separator()
 
@@ -120,19 +135,31 @@ class Bar():
         self.ascending = not self.ascending
         self.b_sort_direction.configure(text=('⮬' if self.ascending else '⮯'))
         
-        self.gui.manager.sorting_ascending = self.ascending
-        self.gui.manager.update_files(self.gui.manager.current_dir)
+        self.gui.manager.set_sorting(ascending=self.ascending)
+        self.gui.sort_results()
         self.gui.show_dir()
 
-    def set_sorting_by(self, a):
-        self.gui.manager.sorting_by = self.menu_current.get()
-        self.gui.manager.update_files(self.gui.manager.current_dir)
+    def set_sorting_by(self):
+        self.gui.manager.set_sorting(sorting_by=self.menu_current.get(),
+                                     dirs_first=self.dirs_first.get())
+        self.gui.sort_results()
         self.gui.show_dir()
 
+    def reload(self):
+        self.gui.manager.cache.invalidate(self.gui.manager.current_dir)
+        self.gui.show_dir(force=True)
+
     def set_dir(self, dir):
         self.dir.delete(0, tk.END)
         self.dir.insert(tk.END, dir)
 
+    def set_loading(self, count):
+        if count is None:
+            self.loading.grid_remove()
+        else:
+            self.loading.configure(text=f'{count} entries loaded…')
+            self.loading.grid(row=0, column=8, **self.padding)
+
     def change_theme(self):
         self.gui.themeconfigure.next_theme()
         self.gui.themeconfigure.update_theme()
@@ -142,11 +169,13 @@ class Bar():
         self.b_back.configure(**self.button_options)
         self.b_forward.configure(**self.button_options)
         self.b_reload.configure(**self.button_options)
+        self.b_search.configure(**self.button_options)
         self.b_sort_direction.configure(**self.button_options)
         self.b_sort_by.configure(**self.button_options)
         self.b_change_theme.configure(**self.button_options)
         self.dir.configure(bg=self.gui.main_color, fg=self.gui.font_color, 
                            insertbackground=self.gui.font_color)
+        self.loading.configure(bg=self.gui.main_color, fg=self.gui.font_color)
         self.menu_sort_by.configure(bg=self.gui.second_color, 
                                     fg=self.gui.font_color, font=self.gui.font,
                                     activebackground=self.gui.highlight_color, 
@@ -175,13 +204,15 @@ class Bar():
                                    command=lambda: self.gui.forward())
 
         self.b_reload = tk.Button(self.frame, text="↻", **self.button_options,
-                                  command=lambda: 
-                                  self.gui.show_dir(force=True))
+                                  command=lambda: self.reload())
 
         self.dir = tk.Entry(self.frame, bd=0, bg=self.gui.main_color, 
                             fg=self.gui.font_color, font=self.gui.font,
                             insertbackground=self.gui.font_color)
 
+        self.b_search = tk.Button(self.frame, text="⌕", **self.button_options,
+                                  command=lambda: self.gui.searchbar.open())
+
         self.b_sort_direction = tk.Button(self.frame, text="⮬", 
                                           **self.button_options,
                                           command=lambda: 
@@ -201,27 +232,42 @@ class Bar():
                                           value='name', font=self.gui.font,
                                           command=lambda: 
                                           self.set_sorting_by())
+        self.menu_sort_by.add_radiobutton(label='name (natural)', 
+                                          variable=self.menu_current, 
+                                          value='natural', font=self.gui.font,
+                                          command=lambda: 
+                                          self.set_sorting_by())
         self.menu_sort_by.add_radiobutton(label='ext', 
                                           variable=self.menu_current, 
                                           value='ext', font=self.gui.font, 
                                           command=lambda: 
-                                          self.set_sorting_by('ext'))
+                                          self.set_sorting_by())
         self.menu_sort_by.add_radiobutton(label='size', 
                                           variable=self.menu_current, 
                                           value='size', font=self.gui.font, 
                                           command=lambda: 
-                                          self.set_sorting_by('size'))
+                                          self.set_sorting_by())
         self.menu_sort_by.add_radiobutton(label='time',
                                           variable=self.menu_current, 
                                           value='mtime', font=self.gui.font, 
                                           command=lambda: 
-                                          self.set_sorting_by('time'))
+                                          self.set_sorting_by())
+        self.menu_sort_by.add_separator()
+        self.dirs_first = tk.BooleanVar(value=False)
+        self.menu_sort_by.add_checkbutton(label='directories first',
+                                          variable=self.dirs_first,
+                                          font=self.gui.font,
+                                          command=lambda: 
+                                          self.set_sorting_by())
         self.b_sort_by['menu'] = self.menu_sort_by
 
         self.b_change_theme = tk.Button(self.frame, text="☽", 
                                         **self.button_options,
                                         command=lambda: self.change_theme())
 
+        self.loading = tk.Label(self.frame, bg=self.gui.main_color, 
+                                fg=self.gui.font_color, font=self.gui.font)
+
         self.padding = {'ipady': 5,
                         'ipadx': 5}
 
@@ -229,95 +275,136 @@ class Bar():
         self.b_forward.grid(row=0, column=1, **self.padding)
         self.b_reload.grid(row=0, column=2, **self.padding)
         self.dir.grid(row=0, column=3, sticky='ew', **self.padding)
-        self.b_sort_direction.grid(row=0, column=4, **self.padding)
-        self.b_sort_by.grid(row=0, column=5, **self.padding)
-        self.b_change_theme.grid(row=0, column=6, **self.padding)
+        self.b_search.grid(row=0, column=4, **self.padding)
+        self.b_sort_direction.grid(row=0, column=5, **self.padding)
+        self.b_sort_by.grid(row=0, column=6, **self.padding)
+        self.b_change_theme.grid(row=0, column=7, **self.padding)
 
 
 class InfoWindow():
+    IMAGE_EXTS = ('jpg', 'png', 'jpeg')
+    PREFETCH = 2 # rows above and below the cursor
+    POLL_MS = 20
+
     def __init__(self, frame, gui):
         self.frame = frame
         self.gui = gui
 
-        self.image_id = 0 # for multi threading
         self.image_size = 128
+        self.icons = IconRegistry(self.image_size)
+        self.thumbnails = ThumbnailCache()
+        self.previews = PreviewPool()
+        self.preview_generation = None
+        self.polling = False
 
         self.configure_frame()
         self.configure_layout()
 
-        self.img_dir = ImageTk.PhotoImage(Image.open('icons/dir.png')
-                                          .resize([128, 128]))
-        self.img_nofile = ImageTk.PhotoImage(Image.open('icons/nofile.png')
-                                             .resize([128, 128]))
-        self.img_loading = ImageTk.PhotoImage(Image.open('icons/loading.png')
-                                              .convert("RGBA")
-                                              .resize([128, 128]))
-
-    def copy_show(self, file):
+    def copy_show(self, text):
         self.copy_path.grid(row=5, column=0, rowspan=1, columnspan=3,
                             sticky='ew', **self.padding)
         self.b_paste.grid(row=5, column=3, rowspan=1, columnspan=1, 
                           sticky='ew', **self.padding)
 
-        self.copy_path['text'] = file
+        self.copy_path['text'] = text
 
     def copy_hide(self):
-        self.gui.copied_file = None
+        self.gui.copied_files = []
         self.copy_path.grid_remove()
         self.b_paste.grid_remove()
 
-    def move_show(self, file):
+    def move_show(self, text):
         self.move_path.grid(row=6, column=0, rowspan=1, columnspan=3, 
                             sticky='ew', **self.padding)
         self.b_move_complete.grid(row=6, column=3, rowspan=1, columnspan=1, 
                                   sticky='ew', **self.padding)
 
-        self.move_path['text'] = file
+        self.move_path['text'] = text
 
     def move_hide(self):
         self.move_path.grid_remove()
         self.b_move_complete.grid_remove()
 
+    @traced('ui.info_update')
     def update(self, cell):
-        self.image.configure(image=self.img_loading)
-        self.image.image = self.img_loading
-        self.image_id += 1
-        Thread(target=self.set_photo, args=(cell, self.image_id)).start()
+        self.set_photo(cell.file)
 
         self.title.delete(0, tk.END)
         self.title.insert(0, cell.file.name)
 
         self.type.configure(text=cell.file.type)
-        self.size.configure(text=Manager.sizeof_fmt(cell.file.size))
+        self.set_size(cell.file)
         self.ctime.configure(text=cell.file.ctime
                              .strftime("Created: %H:%M:%S, %Y/%m/%d"))
         self.mtime.configure(text=cell.file.mtime
                              .strftime("Modified: %H:%M:%S, %Y/%m/%d"))
 
-    def set_photo(self, cell, current_image_id):
-        if cell.file.type == 'directory':
-            img = self.img_dir
-        elif cell.file.ext.lower() in ('jpg', 'png', 'jpeg'):
-            img = Image.open(cell.file.fulldir)
-            hsize = self.image_size
-            wsize = hsize / img.size[1]
-            wsize = min(int(img.size[0] * wsize), hsize * 2)
-            img = img.resize([wsize, hsize], Image.Resampling.LANCZOS)
-            img = ImageTk.PhotoImage(img)
-        elif cell.file.ext.lower() in ('mp4', 'ogg', 'avi',
-                                       'mov', 'mpg', 'flv'):
-            img = Image.open('icons/video.png').resize([128, 128])
-            img = ImageTk.PhotoImage(img)
-        elif cell.file.ext.lower() in [file[:file.rfind('.')] 
-                                       for file in os.listdir('icons')]:
-            img = Image.open(f'icons/{cell.file.ext}.png').resize([128, 128])
-            img = ImageTk.PhotoImage(img)
+    def set_size(self, file):
+        if file.type == 'directory':
+            # recursive size, filled in by the disk usage service
+            total = self.gui.manager.du.get(file.fulldir)
+            if total is None:
+                text = '…'
+            else:
+                text = (f'{Manager.sizeof_fmt(total.bytes)}, ' 
+                        f'{total.files} files{"" if total.done else "…"}')
         else:
-            img = self.img_nofile
-        
-        if current_image_id == self.image_id:
-            self.image.configure(image=img)
-            self.image.image = img
+            text = Manager.sizeof_fmt(file.size)
+        self.size.configure(text=text)
+
+    def show_image(self, img):
+        self.image.configure(image=img)
+        self.image.image = img
+
+    @staticmethod
+    def is_image(file):
+        return (file.type == 'file' 
+                and file.ext.lower() in InfoWindow.IMAGE_EXTS)
+
+    def thumbnail_task(self, file):
+        size = self.image_size
+        return lambda: self.thumbnails.get(file.fulldir, size, file.stat)
+
+    def neighbours(self):
+        # nearest rows last, the pool runs them first; below before above
+        files = self.gui.rows
+        cursor = self.gui.cursor
+        rows = []
+        for distance in range(InfoWindow.PREFETCH, 0, -1):
+            rows += [cursor - distance, cursor + distance]
+        return [files[i] for i in rows if 0 <= i < len(files)]
+
+    @traced('ui.set_photo')
+    def set_photo(self, file):
+        prefetch = [self.thumbnail_task(f) for f in self.neighbours() 
+                    if self.is_image(f)]
+        if self.is_image(file):
+            self.show_image(self.icons.get('loading'))
+            self.preview_generation = self.previews.request(
+                self.thumbnail_task(file), prefetch)
+            if not self.polling:
+                self.polling = True
+                self.frame.after(InfoWindow.POLL_MS, self.poll_preview)
+        else:
+            self.preview_generation = None
+            self.previews.request(prefetch=prefetch)
+            self.show_image(self.icons.for_file(file))
+
+    def poll_preview(self):
+        result = self.previews.poll()
+        if result is not None:
+            if isinstance(result, Exception):
+                self.show_image(self.icons.get('nofile'))
+            else:
+                from PIL import ImageTk
+                with tracing.span('ui.photo_image'):
+                    self.show_image(ImageTk.PhotoImage(result))
+            self.preview_generation = None
+
+        if self.preview_generation is not None:
+            self.frame.after(InfoWindow.POLL_MS, self.poll_preview)
+        else:
+            self.polling = False
 
     def update_theme(self):
         self.update_button_options()
@@ -393,29 +480,23 @@ class InfoWindow():
                                   fg=self.gui.font_color)
         self.b_paste = tk.Button(self.frame, text='Paste', 
                                  **self.button_options,
-                                 command=lambda: 
-                                 Thread(target=self.gui.paste_action).start())
+                                 command=lambda: self.gui.paste_action())
         self.move_path = tk.Label(self.frame, bg=self.gui.main_color, 
                                   fg=self.gui.font_color)
         self.b_move_complete = tk.Button(self.frame, text='Move here', 
                                          **self.button_options, 
                                          command=lambda: 
-                                         Thread(target=
-                                                self.gui.move_complete).start()
-                                        )
+                                         self.gui.move_complete())
         
         self.b_open = tk.Button(self.frame, text='Open', **self.button_options,
                                 command=lambda: self.gui.move_to_dir())
         self.b_copy = tk.Button(self.frame, text='Copy', **self.button_options,
-                                command=lambda: 
-                                Thread(target=self.gui.copy_file).start())
+                                command=lambda: self.gui.copy_file())
         self.b_move = tk.Button(self.frame, text='Move', **self.button_options,
-                                command=lambda: 
-                                Thread(target=self.gui.move_file).start())
+                                command=lambda: self.gui.move_file())
         self.b_delete = tk.Button(self.frame, text='Delete', 
                                   **self.button_options,
-                                  command=lambda: 
-                                  Thread(target=self.gui.delete_file).start())
+                                  command=lambda: self.gui.delete_file())
         self.b_mkdir = tk.Button(self.frame, text='New directory...', 
                                  **self.button_options,
                                  command=lambda: self.gui.make_dir())
@@ -437,30 +518,402 @@ class InfoWindow():
                            **self.padding, sticky='ew')
         
 
+class JobsPanel():
+    MAX_ROWS = 5
+
+    def __init__(self, gui, frame):
+        self.gui = gui
+        self.frame = frame
+        self.jobs = []
+        self.lines = []
+        self.shown = False
+
+        self.configure_layout()
+
+    @staticmethod
+    def describe(job):
+        task = job.task
+        text = f'{job.title} [{job.state}]'
+        if job.state == FAILED:
+            return f'{text} {job.error}'
+        progress = job.progress()
+        if progress is not None:
+            text += f' {progress:.0%}'
+        else:
+            text += (f' {task.files_done} files, '
+                     f'{Manager.sizeof_fmt(task.bytes_done)}')
+        if job.state == RUNNING:
+            text += f' {Manager.sizeof_fmt(job.speed)}/s'
+            eta = job.eta()
+            if eta is not None:
+                text += f' ETA {int(eta // 60)}:{int(eta % 60):02d}'
+        return text
+
+    def refresh(self):
+        lines = [self.describe(job) for job in self.gui.scheduler.jobs]
+        if lines == self.lines:
+            return
+        self.jobs = list(self.gui.scheduler.jobs)
+        self.lines = lines
+
+        self.list.delete(0, tk.END)
+        self.list.insert(tk.END, *lines)
+        self.list.configure(height=min(len(lines), JobsPanel.MAX_ROWS))
+        if lines and not self.shown:
+            self.list.grid(row=9, column=0, rowspan=1, columnspan=4, 
+                           sticky='ew', **self.gui.infowindow.padding)
+            self.shown = True
+        elif not lines and self.shown:
+            self.list.grid_remove()
+            self.shown = False
+
+    def show_menu(self, e):
+        index = self.list.nearest(e.y)
+        if not 0 <= index < len(self.jobs):
+            return
+        job = self.jobs[index]
+        scheduler = self.gui.scheduler
+
+        menu = tk.Menu(self.list, tearoff=0, bg=self.gui.second_color,
+                       fg=self.gui.font_color, font=self.gui.font,
+                       activebackground=self.gui.highlight_color,
+                       activeforeground=self.gui.font_color)
+        if job.state in (RUNNING, QUEUED):
+            menu.add_command(label='Pause', 
+                             command=lambda: scheduler.pause(job))
+        if job.state == PAUSED:
+            menu.add_command(label='Resume', 
+                             command=lambda: scheduler.resume(job))
+        if job.state not in FINISHED:
+            menu.add_command(label='Cancel', 
+                             command=lambda: scheduler.cancel(job))
+        menu.add_command(label='Clear finished', 
+                         command=lambda: scheduler.clear_finished())
+        menu.tk_popup(e.x_root, e.y_root, 0)
+
+    def update_theme(self):
+        self.list.configure(bg=self.gui.main_color, fg=self.gui.font_color,
+                            selectbackground=self.gui.highlight_color)
+
+    def configure_layout(self):
+        self.list = tk.Listbox(self.frame, bg=self.gui.main_color, 
+                               fg=self.gui.font_color, font=self.gui.font, 
+                               selectbackground=self.gui.highlight_color,
+                               bd=0, highlightthickness=0, width=1, height=1,
+                               activestyle='none', takefocus=0)
+        self.list.bind('<Button-3>', self.show_menu)
+
+
+class FilterBar():
+    # Type-ahead quick filter under the bar. Lives in a frame of its own so
+    # that check_focus can tell its entry from Bar.dir.
+    def __init__(self, gui, frame):
+        self.gui = gui
+        self.frame = tk.Frame(frame, bg=self.gui.main_color)
+        self.dir = None # directory being filtered, None while closed
+
+        self.configure_layout()
+
+    def open(self, text=''):
+        if self.dir is None:
+            self.dir = self.gui.manager.current_dir
+            self.frame.grid(row=1, column=0, columnspan=9, sticky='ew')
+        self.entry.focus()
+        self.entry.insert(tk.END, text)
+
+    def close(self):
+        if self.dir is None:
+            return
+        self.dir = None
+        self.frame.grid_remove()
+        self.query.set('')
+        self.gui.quickfilter.set_query('')
+
+    def changed(self, *args):
+        if self.dir is not None:
+            self.gui.set_filter(self.query.get(), self.mode.get())
+
+    def set_count(self):
+        quickfilter = self.gui.quickfilter
+        if not quickfilter.query:
+            text = ''
+        else:
+            text = f'{len(quickfilter)} matches'
+            if not quickfilter.done:
+                text += '…'
+        self.count.configure(text=text)
+
+    def update_theme(self):
+        self.update_button_options()
+        self.frame.configure(bg=self.gui.main_color)
+        self.entry.configure(bg=self.gui.second_color, fg=self.gui.font_color,
+                             insertbackground=self.gui.font_color)
+        self.b_mode.configure(**self.button_options)
+        self.count.configure(bg=self.gui.main_color, fg=self.gui.font_color)
+        self.menu_mode.configure(bg=self.gui.second_color, 
+                                 fg=self.gui.font_color, font=self.gui.font,
+                                 activebackground=self.gui.highlight_color, 
+                                 activeforeground=self.gui.font_color)
+
+    def update_button_options(self):
+        self.button_options = {'bg': self.gui.main_color,
+                               'fg': self.gui.font_color,
+                               'font': self.gui.font,
+                               'borderwidth': 0,
+                               'activeforeground': self.gui.font_color,
+                               'activebackground': self.gui.highlight_color,
+                               'highlightthickness': 0,
+                               'relief': 'solid'}
+
+    def configure_layout(self):
+        self.update_button_options()
+        self.query = tk.StringVar()
+        self.mode = tk.StringVar(value=MODES[0])
+        self.query.trace_add('write', self.changed)
+
+        self.entry = tk.Entry(self.frame, bd=0, bg=self.gui.second_color, 
+                              fg=self.gui.font_color, font=self.gui.font,
+                              insertbackground=self.gui.font_color,
+                              textvariable=self.query)
+
+        self.b_mode = tk.Menubutton(self.frame, textvariable=self.mode, 
+                                    **self.button_options)
+        self.menu_mode = tk.Menu(self.b_mode, tearoff=0, 
+                                 bg=self.gui.second_color, 
+                                 fg=self.gui.font_color, font=self.gui.font,
+                                 activebackground=self.gui.highlight_color, 
+                                 activeforeground=self.gui.font_color)
+        for mode in MODES:
+            self.menu_mode.add_radiobutton(label=mode, variable=self.mode,
+                                           value=mode, font=self.gui.font,
+                                           command=self.changed)
+        self.b_mode['menu'] = self.menu_mode
+
+        self.count = tk.Label(self.frame, bg=self.gui.main_color, 
+                              fg=self.gui.font_color, font=self.gui.font)
+
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.entry.grid(row=0, column=0, sticky='ew', ipady=3, ipadx=5)
+        self.b_mode.grid(row=0, column=1, ipady=3, ipadx=5)
+        self.count.grid(row=0, column=2, ipady=3, ipadx=5)
+
+
+class SearchBar():
+    # Recursive search under the current directory, see search.py for the
+    # query syntax. Results replace the listing in the left pane until the
+    # bar is closed.
+    def __init__(self, gui, frame):
+        self.gui = gui
+        self.frame = tk.Frame(frame, bg=self.gui.main_color)
+        self.shown = False
+
+        self.configure_layout()
+
+    def open(self):
+        if not self.shown:
+            self.frame.grid(row=2, column=0, columnspan=9, sticky='ew')
+            self.shown = True
+        self.entry.focus()
+
+    def hide(self):
+        if self.shown:
+            self.frame.grid_remove()
+            self.shown = False
+        self.status.configure(text='')
+
+    def set_status(self, search=None, message=None):
+        if message is not None:
+            text = message
+        elif search is None:
+            text = ''
+        elif isinstance(search, DuplicateFinder):
+            text = (f'{len(search.groups)} groups of duplicates, '
+                    f'{Manager.sizeof_fmt(search.reclaimable)} reclaimable')
+        elif isinstance(search, IndexSearch):
+            text = f'{len(search.results)} found in the index'
+            if search.error is not None:
+                text = f'Index error: {search.error}'
+            elif search.seconds is not None:
+                text += f' in {search.seconds * 1000:.0f} ms'
+        else:
+            text = f'{len(search.results)} found in {search.dirs} dirs'
+            if search.truncated:
+                text += ', stopped at the limit'
+            elif search.cancelled:
+                text += ', stopped'
+            elif not search.done:
+                text += '…'
+        self.status.configure(text=text)
+
+    def set_mode(self, duplicates):
+        if duplicates:
+            self.b_delete_extras.grid(row=0, column=6, ipady=3, ipadx=5)
+        else:
+            self.b_delete_extras.grid_remove()
+
+    def set_timing(self, timing):
+        # result of indexing, or the exception it raised
+        if isinstance(timing, Exception):
+            text = f'Indexing failed: {timing}'
+        else:
+            text = (f'Indexed {timing.entries} entries in '
+                    f'{timing.seconds:.1f} s ({timing.rescanned} of '
+                    f'{timing.dirs} dirs re-listed)')
+        self.status.configure(text=text)
+
+    def update_theme(self):
+        self.update_button_options()
+        self.frame.configure(bg=self.gui.main_color)
+        self.entry.configure(bg=self.gui.second_color, fg=self.gui.font_color,
+                             insertbackground=self.gui.font_color)
+        self.status.configure(bg=self.gui.main_color, fg=self.gui.font_color)
+        self.b_stop.configure(**self.button_options)
+        self.b_close.configure(**self.button_options)
+        self.b_index.configure(**self.button_options)
+        self.b_duplicates.configure(**self.button_options)
+        self.b_delete_extras.configure(**self.button_options)
+        self.menu_index.configure(bg=self.gui.second_color, 
+                                  fg=self.gui.font_color, font=self.gui.font,
+                                  activebackground=self.gui.highlight_color, 
+                                  activeforeground=self.gui.font_color)
+
+    def update_button_options(self):
+        self.button_options = {'bg': self.gui.main_color,
+                               'fg': self.gui.font_color,
+                               'font': self.gui.font,
+                               'borderwidth': 0,
+                               'activeforeground': self.gui.font_color,
+                               'activebackground': self.gui.highlight_color,
+                               'highlightthickness': 0,
+                               'relief': 'solid'}
+
+    def configure_layout(self):
+        self.update_button_options()
+        self.entry = tk.Entry(self.frame, bd=0, bg=self.gui.second_color, 
+                              fg=self.gui.font_color, font=self.gui.font,
+                              insertbackground=self.gui.font_color)
+
+        self.status = tk.Label(self.frame, bg=self.gui.main_color, 
+                               fg=self.gui.font_color, font=self.gui.font)
+
+        self.b_stop = tk.Button(self.frame, text="■", **self.button_options,
+                                command=lambda: self.gui.stop_search())
+
+        self.b_close = tk.Button(self.frame, text="✕", **self.button_options,
+                                 command=lambda: self.gui.close_search())
+
+        self.b_index = tk.Menubutton(self.frame, text='Index', 
+                                     **self.button_options)
+        self.menu_index = tk.Menu(self.b_index, tearoff=0, 
+                                  bg=self.gui.second_color, 
+                                  fg=self.gui.font_color, font=self.gui.font,
+                                  activebackground=self.gui.highlight_color, 
+                                  activeforeground=self.gui.font_color)
+        self.menu_index.add_command(label='Index this directory', 
+                                    font=self.gui.font,
+                                    command=lambda: self.gui.refresh_index())
+        self.menu_index.add_command(label='Refresh index', font=self.gui.font,
+                                    command=lambda: 
+                                    self.gui.refresh_index(add=False))
+        self.menu_index.add_command(label='Remove from index', 
+                                    font=self.gui.font,
+                                    command=lambda: self.gui.remove_index())
+        self.b_index['menu'] = self.menu_index
+
+        self.b_duplicates = tk.Button(self.frame, text='Duplicates', 
+                                      **self.button_options,
+                                      command=lambda: 
+                                      self.gui.find_duplicates())
+
+        self.b_delete_extras = tk.Button(self.frame, text='Delete extras', 
+                                         **self.button_options,
+                                         command=lambda: 
+                                         self.gui.delete_extras())
+
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.entry.grid(row=0, column=0, sticky='ew', ipady=3, ipadx=5)
+        self.status.grid(row=0, column=1, ipady=3, ipadx=5)
+        self.b_index.grid(row=0, column=2, ipady=3, ipadx=5)
+        self.b_duplicates.grid(row=0, column=3, ipady=3, ipadx=5)
+        self.b_stop.grid(row=0, column=4, ipady=3, ipadx=5)
+        self.b_close.grid(row=0, column=5, ipady=3, ipadx=5)
+
+
+class TraceOverlay():
+    # Live table of the tracing spans (see tracing.py) in the bottom right
+    # corner: p50/p99/max per span, event loop stalls included. F12 shows
+    # or hides it, shift+F12 writes a Chrome trace file.
+    REFRESH_MS = 500
+    MAX_ROWS = 16
+
+    def __init__(self, gui):
+        self.gui = gui
+        self.shown = False
+        self.message = ''
+        self.pending = None # after() id of the next refresh
+        self.label = tk.Label(self.gui.root, justify=tk.LEFT, anchor='nw',
+                              font=('Courier', 9), bg=self.gui.second_color,
+                              fg=self.gui.font_color, padx=4, pady=2)
+
+    def toggle(self):
+        self.shown = not self.shown
+        if self.shown:
+            self.label.place(relx=1.0, rely=1.0, anchor='se')
+            self.refresh()
+        else:
+            self.label.place_forget()
+            self.gui.root.after_cancel(self.pending)
+
+    def dump(self):
+        if tracing.enabled():
+            self.message = f'trace written to {tracing.dump()}'
+            if not self.shown:
+                self.toggle()
+
+    @untraced
+    def refresh(self):
+        if not tracing.enabled():
+            lines = [f'tracing is off, start with {tracing.ENV}=1 '
+                     'or main.py --trace']
+        else:
+            lines = [f'{"span":<40}{"n":>7}{"p50":>9}{"p99":>9}{"max":>9}']
+            for name, count, p50, p99, worst in (tracing.tracer.stats()
+                                                 [:self.MAX_ROWS]):
+                lines.append(f'{name[-40:]:<40}{count:>7}{p50:>9.2f}'
+                             f'{p99:>9.2f}{worst:>9.2f}')
+            lines.append('ms; shift+F12 writes a Chrome trace')
+        if self.message:
+            lines.append(self.message)
+        self.label.configure(text='\n'.join(lines))
+        self.pending = self.gui.root.after(self.REFRESH_MS, self.refresh)
+
+    def update_theme(self):
+        self.label.configure(bg=self.gui.second_color, 
+                             fg=self.gui.font_color)
+
+
 class Cell():
-    def __init__(self, gui, frame, index, file):
+    # Row widget from the GUI's fixed pool: the tk.Text and its bindings
+    # are created once, drawing only rebinds the text and colours that
+    # changed since the last draw.
+    def __init__(self, gui, frame, index, file=None):
         self.gui = gui
         self.frame = frame
         self.index = index
         self.file = file
         self.color = self.gui.main_color
-        self.obj = None
 
-    def draw(self):
-        if self.obj:
-            self.obj.destroy()
+        self.text = None
+        self.drawn_color = None
+        self.theme = None
+        self.shown = False
+
         self.obj = tk.Text(self.frame, wrap='none', bg=self.color, bd=0, 
                            height=1, highlightthickness=2, 
                            highlightbackground=self.gui.main_color,
                            cursor='arrow', width=50, fg=self.gui.font_color, 
-                           font=self.gui.font, padx=2, pady=2, takefocus=0)
-        self.obj.grid(row=self.index, column=0)
-
-        name = self.file.name
-        if self.file.type == 'directory':
-            name = '● ' + name
-        self.obj.insert(tk.END, name)
-        self.obj.config(state=tk.DISABLED)
+                           font=self.gui.font, padx=2, pady=2, takefocus=0,
+                           state=tk.DISABLED)
 
         self.obj.bind('<Enter>', lambda e: 
                       self.obj.config(highlightbackground=
@@ -469,46 +922,134 @@ class Cell():
         self.obj.bind('<Leave>', lambda e: 
                       self.obj.config(highlightbackground=self.gui.main_color))
 
-        self.obj.bind('<Button-1>', lambda e: self.click())
+        self.obj.bind('<Button-1>', self.click)
 
         self.obj.bind('<Button-3>', lambda e: 
                       self.gui.create_contextmenu(self))
 
-    def click(self):
-        if self.gui.cursor - self.gui.current_row == self.index:
+    def draw(self):
+        if not self.shown:
+            self.obj.grid(row=self.index, column=0)
+            self.shown = True
+
+        if self.theme != self.gui.themeconfigure.current_theme:
+            self.theme = self.gui.themeconfigure.current_theme
+            self.obj.config(fg=self.gui.font_color, 
+                            highlightbackground=self.gui.main_color)
+            self.drawn_color = None
+
+        if self.color != self.drawn_color:
+            self.obj.config(bg=self.color)
+            self.drawn_color = self.color
+
+        name = self.file.name
+        if self.gui.search is not None:
+            name = os.path.relpath(self.file.fulldir, self.gui.search.root)
+            labels = getattr(self.gui.search, 'labels', None)
+            if labels:
+                name = f'{labels.get(self.file, "")}  {name}'
+        if self.file.type == 'directory':
+            name = '● ' + name
+        if self.file.fulldir in self.gui.selection:
+            name = '✓ ' + name
+        if name != self.text:
+            self.obj.config(state=tk.NORMAL)
+            self.obj.delete('1.0', tk.END)
+            self.obj.insert(tk.END, name)
+            self.obj.config(state=tk.DISABLED)
+            self.text = name
+
+    def hide(self):
+        if self.shown:
+            self.obj.grid_remove()
+            self.shown = False
+
+    def click(self, e):
+        # ctrl-click toggles an entry, shift-click selects up to it
+        row = self.gui.current_row + self.index
+        if e.state & 0x4: # Control
+            self.gui.toggle_selection(row)
+            self.gui.anchor = row
+        elif e.state & 0x1: # Shift
+            if self.gui.anchor is None:
+                self.gui.anchor = self.gui.cursor
+            self.gui.select_range(self.gui.anchor, row)
+        elif self.gui.cursor - self.gui.current_row == self.index:
             if self.gui.root.focus_get().master in (None, self.gui.left_frame):
                 self.gui.move_to_dir()
+            return
         else:
-            self.gui.set_cursor(self.index)
+            if self.gui.selection:
+                self.gui.clear_selection()
+            self.gui.anchor = row
+        self.gui.set_cursor(self.index)
 
 class GUI():
     WIDTH = 720
     HEIGHT = 480
-
-    def __init__(self):
+    STREAM_POLL_MS = 50
+    SIZES_POLL_MS = 250
+    PUMP_MS = 100
+    FILTER_MS = 16
+    SEARCH_POLL_MS = 100
+    WATCH_MS = 250 # changes arriving within this window are applied at once
+    RESIZE_MS = 50 # a resize is laid out once it has settled this long
+
+    def __init__(self, start_dir=None):
+        tracing.trace_tk()
         self.root = tk.Tk()
+        if tracing.enabled():
+            self.loopmonitor = tracing.LoopMonitor(self.root)
 
         self.themeconfigure = ThemeConfigure(self)
         self.font = ('Arial', 10)
+        self.scheduler = Scheduler()
+        self.quickfilter = QuickFilter()
+        self.filtering = False
+        self.search = None
+        self.search_cursor = (0, 0) # cursor and row to return to
+        self.fileindex = None # opened once something is indexed
+        self.indexing = queue.SimpleQueue()
+        self.focus_after_stream = None
 
         self.configure_screen()
         self.configure_layout()
         self.configure_binds()
 
-        self.manager = Manager(os.getcwd().split(os.path.sep)[0] + os.path.sep)
+        self.watched_stream = None
+        self.polling_sizes = False
+        self.watcher = None
+        # the first listing streams in, the window is up before it is done
+        if start_dir is None:
+            start_dir = os.getcwd().split(os.path.sep)[0] + os.path.sep
+        self.manager = Manager(start_dir, streaming=True,
+                               on_error=lambda e: showerror('Error', e))
 
         self.current_row = 0
         self.cursor = 0
         self.cells = []
-
-        self.editing_window = 0 # for multi threading
+        self.pool = [] # row widgets, reused by show_dir
+        self.selection = set() # full paths of the selected entries
+        self.selection_dir = None # None in search results
+        self.anchor = None # row shift-selection extends from
+        self.copied_files = []
+        self.moving_files = []
+        self.pending_moves = 0 # arrows and wheel not drawn yet
+        self.pending_extend = False
+        self.pending_top = None # where the scrollbar was dragged to
+        self.frame_pending = None # after_idle() id of the next render
+
+        self.resizing = {} # setter -> pending after() id
         self.max_rows = 0
-        Thread(target=self.set_max_rows, args=(GUI.HEIGHT,)).start()
+        self.set_max_rows(GUI.HEIGHT)
 
-        self.copied_file = None
-        self.moving_file = None
+        self.watch_stream()
+        self.watch_dir()
+        self.pump()
+        self.root.after(GUI.WATCH_MS, self.poll_watcher)
 
     def check_focus(self, e):
+        self.render_frame() # Return acts on where the arrows got to
         focus = self.root.focus_get().master
 
         if focus == self.top_frame:
@@ -519,6 +1060,21 @@ class GUI():
             elif e.keysym == 'Escape':
                 self.root.focus()
         
+        if focus == self.searchbar.frame:
+            if e.keysym == 'Return':
+                self.start_search(self.searchbar.entry.get())
+            elif e.keysym == 'Escape':
+                self.close_search()
+                self.root.focus()
+
+        if focus == self.filterbar.frame:
+            if e.keysym == 'Return':
+                self.root.focus()
+                self.move_to_dir()
+            elif e.keysym == 'Escape':
+                self.close_filter()
+                self.root.focus()
+
         if focus == self.left_frame:
             if e.keysym == 'Return':
                 self.show_dir(dir=self.bar.dir.get())
@@ -538,7 +1094,12 @@ class GUI():
             if e.keysym == 'Return':
                 self.move_to_dir()
             elif e.keysym == 'Escape':
-                self.return_to_dir()
+                if self.selection:
+                    self.clear_selection()
+                elif self.search is not None:
+                    self.close_search()
+                else:
+                    self.return_to_dir()
 
     def create_contextmenu(self, cell):
         x = self.root.winfo_pointerx()
@@ -548,97 +1109,510 @@ class GUI():
     def rename_file(self):
         name = self.infowindow.title.get()
         self.manager.rename_file(self.get_current_cell().file, name)
-        self.show_dir(force=True)
         self.focus_on_file(name)
-        self.update()
 
     def make_dir(self):
         name = self.manager.make_dir()
-        self.show_dir(force=True)
         self.focus_on_file(name)
-        self.update()
         self.infowindow.title.focus()
 
     def make_file(self):
         name = self.manager.make_file()
-        self.show_dir(force=True)
         self.focus_on_file(name)
-        self.update()
         self.infowindow.title.focus()
 
     def delete_file(self):
-        self.manager.delete_file(self.get_current_cell().file.fulldir)
-        self.show_dir(force=True)
+        paths = self.selected_paths()
+        if not paths:
+            return
+        self.delete_paths(paths, self.batch_title('Delete', paths))
+        self.clear_selection()
+
+    def delete_paths(self, paths, title):
+        task = self.manager.delete_job(paths)
+        self.scheduler.submit(Job(title, task, paths, 
+                                  on_update=self.delete_progress,
+                                  on_done=self.job_done))
+
+    def delete_progress(self, job):
+        paths = job.task.drain()
+        removed = [path for path in paths
+                   if os.path.dirname(path) == self.manager.current_dir]
+        if self.search is not None and paths:
+            gone = set(paths)
+            self.search.results[:] = [file for file in self.search.results
+                                      if file.fulldir not in gone]
+            removed = paths
+        if removed:
+            current = self.get_current_cell().file if self.cells else None
+            self.manager.remove_entries(removed)
+            if current is not None and current.fulldir not in removed:
+                self.keep_cursor_on(current)
+            self.clamp_cursor()
+            self.draw_rows()
+            self.update(bar=False)
 
     def copy_file(self):
-        self.copied_file = self.get_current_cell().file.fulldir
-        self.infowindow.copy_show(self.copied_file)
+        self.copied_files = self.selected_paths()
+        self.infowindow.copy_show(self.describe(self.copied_files))
 
     def paste_action(self):
-        name = self.manager.paste_file(self.copied_file, 
-                                       self.manager.current_dir)
-        self.show_dir(force=True)
-        self.focus_on_file(name)
-        self.update()
+        self.submit_batch(self.copied_files, move=False)
 
     def move_file(self):
-        self.moving_file = self.get_current_cell().file.fulldir
-        self.infowindow.move_show(self.moving_file)
+        self.moving_files = self.selected_paths()
+        self.infowindow.move_show(self.describe(self.moving_files))
 
     def move_complete(self):
-        name = self.manager.move_file(self.moving_file, 
-                                      self.manager.current_dir)
-        self.show_dir(force=True)
-        if self.moving_file == self.copied_file:
+        srcs = self.moving_files
+        if self.moving_files == self.copied_files:
             self.infowindow.copy_hide()
-        self.moving_file = None
+        self.moving_files = []
         self.infowindow.move_hide()
-        self.focus_on_file(name)
-        self.update()
+        self.submit_batch(srcs, move=True)
+
+    def submit_batch(self, srcs, move):
+        # the whole selection is one job, and one update of the listing
+        # when it is done
+        if not srcs:
+            return
+        dst = self.manager.current_dir
+        task = self.manager.batch_job(srcs, dst, move=move)
+        self.scheduler.submit(Job(self.batch_title('Move' if move 
+                                                   else 'Copy', srcs),
+                                  task, srcs + [dst], on_done=self.job_done))
+
+    @staticmethod
+    def batch_title(action, paths):
+        if len(paths) == 1:
+            return f'{action} {os.path.basename(paths[0])}'
+        return f'{action} {len(paths)} items'
+
+    @staticmethod
+    def describe(paths):
+        return paths[0] if len(paths) == 1 else f'{len(paths)} items'
+
+    def job_done(self, job):
+        # runs on the Tk thread, from the scheduler pump; only the entries
+        # the job touched are updated in the listing
+        task = job.task
+        names = {os.path.basename(path) for path in task.paths
+                 if os.path.dirname(path) == self.manager.current_dir}
+        if not names:
+            return
+        self.apply_changes(names)
+        created = getattr(task, 'names', [])
+        if (job.state == DONE and created
+                and task.dst_dir == self.manager.current_dir):
+            self.focus_on_file(created[0])
+
+    def pump(self):
+        # rescheduled first: a failing callback must not stop job reporting
+        self.root.after(GUI.PUMP_MS, self.pump)
+        self.scheduler.pump()
+        self.jobspanel.refresh()
 
     def get_current_cell(self):
         return self.cells[self.cursor - self.current_row]
 
     def focus_on_file(self, filename):
-        cursor = 0
-        for file in self.manager.files:
-            if file.name == filename:
-                break
-            cursor += 1
-        self.set_absolute_position(cursor)
+        row = self.row_of(filename)
+        if row is None and self.quickfilter.query:
+            # filtered out, show the whole listing again
+            self.filterbar.close()
+            row = self.row_of(filename)
+        if row is not None:
+            self.set_absolute_position(row)
+
+    @property
+    def rows(self):
+        # entries of the left pane: search results, the listing, or those of
+        # its entries that match the quick filter (which follows changes of
+        # the listing)
+        if self.search is not None:
+            return self.search.results
+        if not self.quickfilter.query:
+            return self.manager.files
+        if self.quickfilter.set_listing(self.manager.files, 
+                                        self.manager.version):
+            self.watch_filter()
+        return self.quickfilter
+
+    def row_of(self, name):
+        if self.search is not None:
+            return None
+        position = self.manager.position(name)
+        if position is None or self.rows is self.manager.files:
+            return position
+        return self.quickfilter.row_of(position)
+
+    def type_ahead(self, e):
+        # printable keys typed over the listing open the quick filter
+        if not self.listing_focused():
+            return
+        if self.search is not None:
+            return
+        if e.char and e.char.isprintable() and not e.state & 0x4: # Control
+            self.filterbar.open(e.char)
+
+    def set_filter(self, query, mode=None):
+        current = self.get_current_cell().file if self.cells else None
+        self.quickfilter.set_listing(self.manager.files, self.manager.version)
+        self.quickfilter.set_query(query, mode)
+        self.quickfilter.step()
+        self.cursor = 0
+        self.current_row = 0
+        self.keep_cursor_on(current)
+        self.draw_rows()
+        self.update(bar=False)
+        self.filterbar.set_count()
+        self.watch_filter()
+
+    def start_search(self, text):
+        try:
+            query = parse_query(text)
+        except ValueError as e:
+            self.searchbar.set_status(message=str(e))
+            return
+        index = self.file_index()
+        if (index is not None and not query.content 
+                and index.root_of(self.manager.current_dir) is not None):
+            search = IndexSearch(index, self.manager.current_dir, query)
+        else:
+            search = Search(self.manager.current_dir, query, 
+                            workers=self.manager.workers)
+        search.start()
+        self.show_search(search)
+
+    def show_search(self, search):
+        # shows the results of a Search (or anything with its interface)
+        # in the left pane
+        if self.search is None:
+            self.close_filter()
+            self.search_cursor = (self.cursor, self.current_row)
+        else:
+            self.search.cancel()
+        self.search = search
+        self.clear_selection(draw=False)
+        self.searchbar.open()
+        self.searchbar.set_mode(isinstance(search, DuplicateFinder))
+        self.cursor = 0
+        self.current_row = 0
+        self.draw_rows()
+        self.searchbar.set_status(self.search)
+        self.root.after(GUI.SEARCH_POLL_MS, self.poll_search, self.search)
+
+    def poll_search(self, search):
+        if search is not self.search:
+            return
+        finished = search.finished
+        if not finished:
+            self.root.after(GUI.SEARCH_POLL_MS, self.poll_search, search)
+        shown = len(self.cells)
+        if search.drain():
+            self.draw_rows()
+            if not shown:
+                self.update(bar=False)
+        if finished:
+            self.sort_results()
+            self.draw_rows()
+        self.searchbar.set_status(search)
+
+    def sort_results(self):
+        # finished results are sorted like the listing, duplicates stay
+        # grouped
+        if (self.search is None or not self.search.finished 
+                or isinstance(self.search, DuplicateFinder)):
+            return
+        current = self.get_current_cell().file if self.cells else None
+        self.manager.sort_list(self.search.results)
+        self.keep_cursor_on(current)
+
+    def find_duplicates(self):
+        dir = self.manager.current_dir
+        task = DuplicateFinder(dir)
+        self.scheduler.submit(Job(f'Duplicates in {os.path.basename(dir)}',
+                                  task, [dir], 
+                                  on_done=self.duplicates_done))
+        self.searchbar.set_status(message='Looking for duplicates…')
+
+    def duplicates_done(self, job):
+        if job.state == DONE:
+            self.show_search(job.task)
+        elif job.state == FAILED:
+            self.searchbar.set_status(message=f'Failed: {job.error}')
+
+    def delete_extras(self):
+        # one delete job for every file but the first of each group
+        if not isinstance(self.search, DuplicateFinder):
+            return
+        shown = {file.fulldir for file in self.search.results}
+        paths = [path for path in self.search.extras() if path in shown]
+        if not paths:
+            return
+        size = Manager.sizeof_fmt(sum(group.reclaimable 
+                                      for group in self.search.groups))
+        if askyesno('Delete duplicates', 
+                    f'Delete {len(paths)} duplicate files ({size})?'):
+            self.delete_paths(paths, f'Delete {len(paths)} duplicates')
+
+    def file_index(self, create=False):
+        if self.fileindex is None and (create 
+                                       or os.path.exists(DEFAULT_PATH)):
+            self.fileindex = FileIndex()
+        return self.fileindex
+
+    def refresh_index(self, add=True):
+        # indexes the current directory (add) or refreshes the indexed root
+        # it is in, in a background thread
+        index = self.file_index(create=add)
+        root = index.root_of(self.manager.current_dir) if index else None
+        if root is None:
+            if not add:
+                self.searchbar.set_status(message='Not in an indexed directory')
+                return
+            root = self.manager.current_dir
+        self.searchbar.set_status(message=f'Indexing {root}…')
+
+        def refresh():
+            try:
+                self.indexing.put(index.refresh(root))
+            except Exception as e:
+                self.indexing.put(e)
+        Thread(target=refresh, daemon=True).start()
+        self.root.after(GUI.SEARCH_POLL_MS, self.poll_index)
+
+    def poll_index(self):
+        try:
+            timing = self.indexing.get_nowait()
+        except queue.Empty:
+            self.root.after(GUI.SEARCH_POLL_MS, self.poll_index)
+            return
+        self.searchbar.set_timing(timing)
+
+    def remove_index(self):
+        index = self.file_index()
+        root = index.root_of(self.manager.current_dir) if index else None
+        if root is None:
+            self.searchbar.set_status(message='Not in an indexed directory')
+        else:
+            index.remove_root(root)
+            self.searchbar.set_status(message=f'Removed {root} from the index')
+
+    def stop_search(self):
+        # stops walking, the results found so far stay
+        if self.search is not None:
+            self.search.cancel()
+
+    def close_search(self):
+        self.searchbar.hide()
+        if self.search is None:
+            return
+        self.search.cancel()
+        self.search = None
+        self.cursor, self.current_row = self.search_cursor
+        self.clamp_cursor()
+        self.show_dir(reset_cursor=False)
+
+    def close_filter(self):
+        current = self.get_current_cell().file if self.cells else None
+        self.filterbar.close()
+        self.keep_cursor_on(current)
+        self.show_dir(reset_cursor=False)
+
+    def watch_filter(self):
+        if not self.quickfilter.done and not self.filtering:
+            self.filtering = True
+            self.root.after(GUI.FILTER_MS, self.poll_filter)
+
+    def poll_filter(self):
+        self.filtering = False
+        if not self.quickfilter.query:
+            return
+        rows = self.rows
+        shown = len(self.cells)
+        rows.step()
+        self.draw_rows()
+        if not shown:
+            self.update(bar=False)
+        self.filterbar.set_count()
+        self.watch_filter()
+
+    def listing_focused(self):
+        focus = self.root.focus_get()
+        return focus in (None, self.root) or focus.master == self.left_frame
+
+    def cell_color(self, file):
+        if file.fulldir in self.selection:
+            return self.second_color
+        return self.main_color
+
+    def selected_paths(self):
+        # the selection in the order of the rows, or the entry under the
+        # cursor if nothing is selected
+        if self.selection:
+            paths = [file.fulldir for file in self.rows 
+                     if file.fulldir in self.selection]
+            if paths:
+                return paths
+        return [self.get_current_cell().file.fulldir] if self.cells else []
+
+    def toggle_selection(self, row):
+        path = self.rows[row].fulldir
+        if path in self.selection:
+            self.selection.discard(path)
+        else:
+            self.selection.add(path)
+        self.show_selection()
+
+    def select_range(self, start, end):
+        start, end = sorted((start, end))
+        self.selection = {file.fulldir for file in self.rows[start:end + 1]}
+        self.show_selection()
+
+    def select_all(self):
+        if not self.listing_focused():
+            return
+        self.selection = {file.fulldir for file in self.rows}
+        self.show_selection()
+
+    def clear_selection(self, draw=True):
+        self.selection = set()
+        self.anchor = None
+        self.root.title('PyManager')
+        if draw:
+            self.draw_rows()
+
+    def show_selection(self):
+        self.selection_dir = (None if self.search is not None 
+                              else self.manager.current_dir)
+        count = len(self.selection)
+        self.root.title(f'PyManager ({count} selected)' if count 
+                        else 'PyManager')
+        self.draw_rows()
+
+    def nudge(self, direction, extend=False):
+        # arrows and the wheel only add up here, held keys queue events
+        # faster than rows can be drawn: the cursor moves once per frame,
+        # by all of them
+        if self.pending_moves and extend != self.pending_extend:
+            self.render_frame()
+        self.pending_moves += direction
+        self.pending_extend = extend
+        self.request_frame()
+
+    def page(self, pages, extend=False):
+        if self.listing_focused():
+            self.nudge(pages * max(self.max_rows - 1, 1), extend)
+
+    def jump_to_edge(self, end, extend=False):
+        # home / end
+        if self.listing_focused():
+            self.render_frame()
+            target = len(self.rows) - 1 if end else 0
+            self.move_cursor(target - self.cursor, extend)
+
+    def scroll(self, action, amount, unit=None):
+        # scrollbar command: ('moveto', fraction) when dragged,
+        # ('scroll', n, 'units' or 'pages') for the arrows and the trough
+        if action == 'moveto':
+            top = int(float(amount) * len(self.rows))
+        else:
+            step = max(self.max_rows - 1, 1) if unit == 'pages' else 1
+            top = (self.current_row if self.pending_top is None 
+                   else self.pending_top) + int(amount) * step
+        self.pending_top = top
+        self.request_frame()
+
+    def request_frame(self):
+        if self.frame_pending is None:
+            self.frame_pending = self.root.after_idle(self.render_frame)
+
+    def render_frame(self):
+        if self.frame_pending is not None:
+            self.root.after_cancel(self.frame_pending)
+            self.frame_pending = None
+        top, self.pending_top = self.pending_top, None
+        moves, self.pending_moves = self.pending_moves, 0
+        if top is not None:
+            self.scroll_to(top)
+        if moves:
+            self.move_cursor(moves, self.pending_extend)
+
+    def scroll_to(self, top):
+        # shows the rows from top, the cursor follows if it would go off
+        # screen
+        rows = len(self.rows)
+        if not self.cells or rows <= self.max_rows:
+            return
+        top = min(max(top, 0), rows - self.max_rows)
+        if top == self.current_row:
+            return
+        first = top + 1 if top > 0 else top
+        last = top + self.max_rows - 1
+        self.anchor = None
+        self.cursor = min(max(self.cursor, first), last)
+        self.current_row = top
+        self.draw_rows()
+        self.update(bar=False)
 
     def set_absolute_position(self, position):
         self.current_row = max(position - self.max_rows + 1, 0)
         self.cursor = position
-        self.show_dir(force=True, reset_cursor=False)
+        self.show_dir(reset_cursor=False)
 
     def set_cursor(self, position):
-        self.get_current_cell().color = self.main_color
-        self.get_current_cell().draw()
+        cell = self.get_current_cell()
+        cell.color = self.cell_color(cell.file)
+        cell.draw()
         self.cursor = position + self.current_row
         self.get_current_cell().color = self.highlight_color
         self.get_current_cell().draw()
         self.update(bar=False)
 
-    def move_cursor(self, direction):
-        if 0 <= self.cursor + direction < self.manager.dirlen:
-            self.get_current_cell().color = self.main_color
-            self.get_current_cell().draw()
-            self.cursor += direction
-            if ((self.cursor - self.current_row >= len(self.cells) - 1) 
-                and (self.cursor + 1 < self.manager.dirlen)):
-                self.current_row += 1
-                self.show_dir(reset_cursor=False)
-            if ((self.cursor - self.current_row <= 0) 
-                and (self.cursor - 1 >= 0)):
-                self.current_row -= 1
-                self.show_dir(reset_cursor=False)
+    @traced('ui.move_cursor')
+    def move_cursor(self, direction, extend=False):
+        # any distance, stopping at the first and last rows; the window is
+        # placed straight at the target, keeping a row of context around the
+        # cursor. extend: shift+keys, selects from the anchor to the cursor
+        if not extend:
+            self.anchor = None
+        elif self.anchor is None:
+            self.anchor = self.cursor
+        rows = len(self.rows)
+        position = min(max(self.cursor + direction, 0), rows - 1)
+        if not self.cells or position == self.cursor:
+            return
+        above = max(position - 1, 0)
+        below = min(position + 1, rows - 1)
+        top = min(max(self.current_row, below - self.max_rows), above)
+        if top == self.current_row:
+            cell = self.get_current_cell()
+            cell.color = self.cell_color(cell.file)
+            cell.draw()
+            self.cursor = position
             self.get_current_cell().color = self.highlight_color
             self.get_current_cell().draw()
+        else:
+            self.cursor = position
+            self.current_row = top
+            self.draw_rows()
+        if extend:
+            self.select_range(self.anchor, self.cursor)
 
-            self.update(bar=False)
+        self.update(bar=False)
 
     def move_to_dir(self):
+        if self.search is not None:
+            # a search result: go to the directory it is in
+            file = self.get_current_cell().file
+            self.close_search()
+            self.show_dir(dir=file.dir)
+            if self.manager.stream is None:
+                self.focus_on_file(file.name)
+            else:
+                self.focus_after_stream = file.name
+            return
         isfile = self.manager.change_dir(self.get_current_cell().file.fulldir,
                                 self.current_row, self.cursor)
         self.show_dir(reset_cursor=not(isfile))
@@ -665,6 +1639,7 @@ class GUI():
             self.show_dir(cursor=self.cursor,
                           current_row=self.current_row)
 
+    @traced('ui.show_dir')
     def show_dir(self, dir=None, reset_cursor=True, cursor=0, current_row=0, 
                  force=False):
         if dir is not None:
@@ -673,48 +1648,209 @@ class GUI():
         if force:
             self.manager.change_dir(self.manager.current_dir)
 
-        for c in self.cells:
-            c.obj.destroy()
-        self.cells = []
+        if self.manager.current_dir != self.filterbar.dir:
+            self.filterbar.close()
+        if (self.selection and self.search is None 
+                and self.manager.current_dir != self.selection_dir):
+            self.clear_selection(draw=False)
 
-        if len(self.manager.files) > 0:
-            if reset_cursor:
-                self.cursor = cursor
-                self.current_row = current_row
-            if self.cursor - self.current_row >= len(self.manager.files):
-                self.cursor = 0
-                self.current_row = 0
-
-            current_files = (self.manager
-                             .files[self.current_row: 
-                                    self.current_row + self.max_rows + 1])
-            for i, file in enumerate(current_files):
-                self.cells.append(Cell(self, self.left_frame, i, file))
-                self.cells[-1].draw()
+        if reset_cursor:
+            self.cursor = cursor
+            self.current_row = current_row
+            self.pending_moves = 0
+            self.pending_top = None
 
-            self.get_current_cell().color = self.highlight_color
-            self.get_current_cell().draw()
-        
+        self.draw_rows()
+        self.measure_dirs(listing=True)
         self.update()
+        self.watch_stream()
+        self.watch_dir()
+
+    @traced('ui.draw_rows')
+    def draw_rows(self):
+        rows = self.rows
+        if self.cursor - self.current_row >= len(rows):
+            self.cursor = 0
+            self.current_row = 0
+
+        current_files = rows[self.current_row: 
+                             self.current_row + self.max_rows + 1]
+        while len(self.pool) < len(current_files):
+            self.pool.append(Cell(self, self.left_frame, len(self.pool)))
+        for cell, file in zip(self.pool, current_files):
+            cell.file = file
+            cell.color = self.cell_color(file)
+        self.cells = self.pool[:len(current_files)]
+
+        if self.cells:
+            self.get_current_cell().color = self.highlight_color
+        for cell in self.cells:
+            cell.draw()
+        for cell in self.pool[len(self.cells):]:
+            cell.hide()
+        self.set_scrollbar(len(rows))
+
+    def set_scrollbar(self, total):
+        # the thumb is the share of the listing on screen, hidden when it
+        # all fits
+        if total <= self.max_rows:
+            self.scrollbar.grid_remove()
+            return
+        self.scrollbar.set(self.current_row / total, 
+                           min(self.current_row + self.max_rows, total) 
+                           / total)
+        self.scrollbar.grid()
+
+    def watch_stream(self):
+        stream = self.manager.stream
+        if stream is not None and stream is not self.watched_stream:
+            self.watched_stream = stream
+            self.bar.set_loading(self.manager.loaded)
+            self.root.after(GUI.STREAM_POLL_MS, self.poll_stream, stream)
+
+    def poll_stream(self, stream):
+        if stream is not self.manager.stream:
+            # navigated away, the stream has been cancelled
+            if self.manager.stream is None:
+                self.bar.set_loading(None)
+            return
+
+        current = None
+        if 0 < self.cursor < len(self.rows):
+            current = self.rows[self.cursor]
+
+        try:
+            if self.manager.drain_stream():
+                # keep the cursor on the same file while entries merge in
+                self.keep_cursor_on(current)
+                self.show_dir(reset_cursor=False)
+        finally:
+            if self.manager.stream is stream:
+                self.root.after(GUI.STREAM_POLL_MS, self.poll_stream, stream)
+        if self.manager.stream is stream:
+            self.bar.set_loading(self.manager.loaded)
+        elif self.manager.stream is None:
+            self.bar.set_loading(None)
+            if self.focus_after_stream is not None:
+                self.focus_on_file(self.focus_after_stream)
+                self.focus_after_stream = None
+
+    def watch_dir(self):
+        dir = self.manager.current_dir
+        if self.watcher is not None:
+            if self.watcher.path == dir:
+                return
+            self.watcher.close()
+        self.watcher = watch(dir)
+
+    def poll_watcher(self):
+        # rescheduled first, so one failed reload (the watched tree was
+        # removed meanwhile...) does not stop watching for good
+        self.root.after(GUI.WATCH_MS, self.poll_watcher)
+        watcher = self.watcher
+        # changes keep piling up in the watcher while a listing streams in
+        if watcher is not None and self.manager.stream is None:
+            names, reload = watcher.drain()
+            if reload:
+                self.manager.cache.invalidate(watcher.path)
+                if os.path.isdir(watcher.path):
+                    self.show_dir(force=True, reset_cursor=False)
+                else:
+                    # the directory itself was removed or renamed
+                    self.show_dir(dir=os.path.dirname(watcher.path))
+            elif names:
+                self.apply_changes(names)
+
+    def apply_changes(self, names):
+        current = self.get_current_cell().file if self.cells else None
+        changed = self.manager.apply_changes(names)
+        if not changed:
+            return
+        if current is not None and current.name in changed:
+            # replaced or removed: follow the name if it is still there
+            current = self.manager.index.get(current.name)
+            self.keep_cursor_on(current)
+            info = True
+        else:
+            self.keep_cursor_on(current)
+            info = False
+        self.clamp_cursor()
+        # cells only redraw the rows whose text or colour changed
+        self.draw_rows()
+        self.update(bar=False, info=info or current is None)
+
+    def keep_cursor_on(self, file):
+        row = None
+        if file is None:
+            pass
+        elif self.search is not None:
+            try:
+                row = self.search.results.index(file)
+            except ValueError:
+                pass
+        elif self.manager.index.get(file.name) is file:
+            row = self.row_of(file.name)
+        if row is not None:
+            self.cursor = row
+            self.current_row = min(max(self.current_row, 
+                                       self.cursor - self.max_rows + 1),
+                                   self.cursor)
+
+    def clamp_cursor(self):
+        self.cursor = max(min(self.cursor, len(self.rows) - 1), 0)
+        self.current_row = max(min(self.current_row, self.cursor), 0)
+
+    def measure_dirs(self, listing=False):
+        # listing: the listing or its sort changed, every directory of it
+        # may be needed; otherwise only the one under the cursor
+        current = None
+        if self.cells and self.get_current_cell().file.type == 'directory':
+            current = self.get_current_cell().file.fulldir
+        if listing:
+            self.manager.measure_dirs(current)
+        elif current is not None:
+            self.manager.measure_dir(current)
+        if self.manager.du.busy() and not self.polling_sizes:
+            self.polling_sizes = True
+            self.root.after(GUI.SIZES_POLL_MS, self.poll_dir_sizes)
+
+    def poll_dir_sizes(self):
+        current = self.get_current_cell().file if self.cells else None
+        busy = self.manager.du.busy()
+        if busy:
+            self.root.after(GUI.SIZES_POLL_MS, self.poll_dir_sizes)
+        else:
+            self.polling_sizes = False
+        changes = self.manager.drain_dir_sizes()
+        if changes and 'size' in self.manager.sort_fields():
+            self.keep_cursor_on(current)
+            self.draw_rows()
+        if current is not None and current.fulldir in changes:
+            self.infowindow.set_size(current)
 
     def update(self, bar=True, info=True):
         if bar:
             self.bar.set_dir(self.manager.current_dir)
         if info and len(self.cells):
             self.infowindow.update(self.get_current_cell())
+            self.measure_dirs()
     
     def update_theme(self):
         self.root.configure(bg=self.main_color)
         self.left_frame.configure(bg=self.main_color)
         self.right_frame.configure(bg=self.main_color)
         self.top_frame.configure(bg=self.main_color)
+        self.scrollbar.configure(bg=self.second_color, 
+                                 troughcolor=self.main_color,
+                                 activebackground=self.highlight_color)
         self.show_dir(reset_cursor=False)
 
     def configure_screen(self):
         self.root.title('PyManager')
         self.root.geometry(f'{GUI.WIDTH}x{GUI.HEIGHT}')
         self.root.configure(bg=self.main_color)
-        self.root.iconphoto(False, tk.PhotoImage(file="icons/logo.png"))
+        logo = tk.PhotoImage(file=os.path.join(ICONS_DIR, 'logo.png'))
+        self.root.iconphoto(False, logo)
         self.root.minsize(480, 360)
 
     def configure_layout(self):
@@ -723,13 +1859,22 @@ class GUI():
         self.top_frame = tk.Frame(self.root, bg=self.main_color,
                                   borderwidth=1, relief=tk.RIDGE)
 
+        self.scrollbar = tk.Scrollbar(self.root, orient=tk.VERTICAL, 
+                                      command=self.scroll, takefocus=0,
+                                      bg=self.second_color, 
+                                      troughcolor=self.main_color,
+                                      activebackground=self.highlight_color)
+
         self.left_frame.grid(row=1, column=0, sticky='nsew', padx=2)
-        self.right_frame.grid(row=1, column=1, sticky='n', padx=5, pady=5)
-        self.top_frame.grid(row=0, column=0, columnspan=2, sticky='ew')
+        self.scrollbar.grid(row=1, column=1, sticky='ns')
+        self.scrollbar.grid_remove()
+        self.right_frame.grid(row=1, column=2, sticky='n', padx=5, pady=5)
+        self.top_frame.grid(row=0, column=0, columnspan=3, sticky='ew')
 
         self.root.grid_rowconfigure(1, weight=1)
         self.root.grid_columnconfigure(0, weight=1)
         self.root.grid_columnconfigure(1, weight=0)
+        self.root.grid_columnconfigure(2, weight=0)
 
         self.right_frame.grid_rowconfigure(0, weight=1)
         self.right_frame.grid_columnconfigure(0, weight=1)
@@ -741,40 +1886,74 @@ class GUI():
 
         self.infowindow = InfoWindow(self.right_frame, self)
 
+        self.jobspanel = JobsPanel(self, self.right_frame)
+
+        self.filterbar = FilterBar(self, self.top_frame)
+
+        self.searchbar = SearchBar(self, self.top_frame)
+
         self.bar = Bar(self, self.top_frame)
 
+        self.traceoverlay = TraceOverlay(self)
+
     def configure_binds(self):
-        self.root.bind_all('<Up>', lambda e: self.move_cursor(-1))
-        self.root.bind_all('<Down>', lambda e: self.move_cursor(1))
+        self.root.bind_all('<Up>', lambda e: self.nudge(-1))
+        self.root.bind_all('<Down>', lambda e: self.nudge(1))
+        self.root.bind_all('<Shift-Up>', lambda e: 
+                           self.nudge(-1, extend=True))
+        self.root.bind_all('<Shift-Down>', lambda e: 
+                           self.nudge(1, extend=True))
+        self.root.bind_all('<Prior>', lambda e: self.page(-1))
+        self.root.bind_all('<Next>', lambda e: self.page(1))
+        self.root.bind_all('<Shift-Prior>', lambda e: 
+                           self.page(-1, extend=True))
+        self.root.bind_all('<Shift-Next>', lambda e: 
+                           self.page(1, extend=True))
+        self.root.bind_all('<Home>', lambda e: self.jump_to_edge(False))
+        self.root.bind_all('<End>', lambda e: self.jump_to_edge(True))
+        self.root.bind_all('<Shift-Home>', lambda e: 
+                           self.jump_to_edge(False, extend=True))
+        self.root.bind_all('<Shift-End>', lambda e: 
+                           self.jump_to_edge(True, extend=True))
+        self.root.bind_all('<Control-a>', lambda e: self.select_all())
+        self.root.bind_all('<F12>', lambda e: self.traceoverlay.toggle())
+        self.root.bind_all('<Shift-F12>', lambda e: self.traceoverlay.dump())
         self.root.bind_all('<Return>', lambda e: self.check_focus(e))
         self.root.bind_all('<Escape>', lambda e: self.check_focus(e))
+        self.root.bind_all('<Key>', self.type_ahead, add='+')
         self.root.bind_all('<Button-4>', lambda e: self.backward())
         self.root.bind_all('<Button-5>', lambda e: self.forward())
         self.root.bind_all('<MouseWheel>', lambda e: 
-                           self.move_cursor(-1 if e.delta > 0 else 1))
+                           self.nudge(-1 if e.delta > 0 else 1))
 
         self.left_frame.bind("<Configure>", lambda e: 
-                             Thread(target=self.set_max_rows, 
-                                    args=(e.height, )).start())
+                             self.resized(self.set_max_rows, e.height))
         self.right_frame.bind("<Configure>", lambda e: 
-                              Thread(target=self.set_info_width, 
-                                     args=(e.x, )).start())
+                              self.resized(self.set_info_width, e.x))
 
     def run(self):
         self.root.mainloop()
             
+    def resized(self, setter, value):
+        # a window drag sends a burst of <Configure>, only the last counts
+        pending = self.resizing.get(setter)
+        if pending is not None:
+            self.root.after_cancel(pending)
+        self.resizing[setter] = self.root.after(
+            GUI.RESIZE_MS, lambda: self.resize(setter, value))
+
+    def resize(self, setter, value):
+        del self.resizing[setter]
+        setter(value)
+
     def set_max_rows(self, height):
-        current = self.editing_window
-        self.editing_window += 1
-        time.sleep(0.05)
-        if self.editing_window == current + 1:
-            old_max_rows = self.max_rows
-            new_max_rows = height // 25
-            if self.max_rows != new_max_rows:
-                reset = self.cursor - self.current_row >= new_max_rows
-                self.max_rows = new_max_rows
-                if old_max_rows < self.manager.dirlen:
-                    self.show_dir(reset_cursor=reset)
+        old_max_rows = self.max_rows
+        new_max_rows = height // 25
+        if self.max_rows != new_max_rows:
+            reset = self.cursor - self.current_row >= new_max_rows
+            self.max_rows = new_max_rows
+            if old_max_rows < len(self.rows):
+                self.show_dir(reset_cursor=reset)
 
     def set_info_width(self, width):
         new_width = 10 + width // 10
@@ -782,3 +1961,4 @@ class GUI():
                                                        new_width + 2):
             self.infowindow.title.configure(width=new_width)
             self.infowindow.image_size = self.right_frame.winfo_width() // 2
+            self.infowindow.icons.set_size(self.infowindow.image_size)
@@ -0,0 +1,177 @@
+import queue
+import time
+from threading import Lock, Thread
+
+from operations import Cancelled, device_of
+from tracing import span
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job():
+    # A file operation (CopyJob, MoveJob or DeleteJob) as seen by the
+    # scheduler: state, devices it uses, measured throughput. on_update and
+    # on_done are called on the thread that runs Scheduler.pump().
+    def __init__(self, title, task, paths, on_update=None, on_done=None):
+        self.title = title
+        self.task = task
+        self.devices = {device_of(path) for path in paths}
+        self.on_update = on_update
+        self.on_done = on_done
+        self.state = QUEUED
+        self.error = None
+        self.started = False
+        self.active = False # a worker thread is running the task
+        self.reported = False # on_done has been called
+        self.speed = 0.0 # bytes per second, smoothed
+        self._sample = None
+
+    @property
+    def bytes_total(self):
+        return getattr(self.task, 'bytes_total', None)
+
+    def progress(self):
+        if self.bytes_total:
+            return self.task.bytes_done / self.bytes_total
+        return None
+
+    def eta(self):
+        if self.bytes_total and self.speed > 0:
+            return (self.bytes_total - self.task.bytes_done) / self.speed
+        return None
+
+    def sample(self, now):
+        done = self.task.bytes_done
+        if self._sample is not None:
+            then, before = self._sample
+            if now > then:
+                speed = (done - before) / (now - then)
+                self.speed = 0.7 * self.speed + 0.3 * speed
+        self._sample = (now, done)
+
+
+class Scheduler():
+    # Runs jobs in submission order, at most per_device jobs at a time on
+    # any device. Workers only change job states and queue finished jobs;
+    # pump() must be called periodically from the UI thread, it samples
+    # throughput and runs the jobs' callbacks there.
+    def __init__(self, per_device=2, keep_finished=50):
+        self.per_device = per_device
+        self.keep_finished = keep_finished
+        self.jobs = []
+        self.running = {} # device -> running jobs
+        self._finished = queue.SimpleQueue()
+        self._lock = Lock()
+
+    def submit(self, job):
+        with self._lock:
+            job.state = QUEUED
+            self.jobs.append(job)
+        self.dispatch()
+        return job
+
+    def dispatch(self):
+        with self._lock:
+            for job in self.jobs:
+                if job.state != QUEUED or job.active:
+                    continue
+                if all(self.running.get(device, 0) < self.per_device
+                       for device in job.devices):
+                    for device in job.devices:
+                        self.running[device] = self.running.get(device, 0) + 1
+                    resuming = job.started
+                    job.state = RUNNING
+                    job.started = job.active = True
+                    Thread(target=self.run, args=(job, resuming), 
+                           daemon=True).start()
+
+    def run(self, job, resuming=False):
+        try:
+            with span(f'job.{type(job.task).__name__}'):
+                if resuming:
+                    job.task.resume()
+                else:
+                    job.task.run()
+            job.state = DONE
+        except Cancelled:
+            if job.state != PAUSED:
+                job.state = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.state = FAILED
+        finally:
+            with self._lock:
+                for device in job.devices:
+                    self.running[device] -= 1
+                job.active = False
+            self._finished.put(job)
+            self.dispatch()
+
+    def pause(self, job):
+        if job.state == RUNNING:
+            job.state = PAUSED
+            job.task.cancel()
+        elif job.state == QUEUED:
+            job.state = PAUSED
+
+    def resume(self, job):
+        if job.state == PAUSED:
+            job.state = QUEUED
+            self.dispatch()
+
+    def cancel(self, job):
+        # a job that still has a worker thread (running, or paused but not
+        # unwound yet) is queued as finished by run() when it stops
+        with self._lock:
+            if job.state not in (QUEUED, PAUSED, RUNNING):
+                return
+            if job.state == RUNNING:
+                job.task.cancel()
+            job.state = CANCELLED
+            if job.active:
+                return
+        self._finished.put(job)
+
+    def clear_finished(self):
+        with self._lock:
+            self.jobs = [job for job in self.jobs
+                         if job.state not in FINISHED]
+
+    def active(self):
+        return any(job.state not in FINISHED for job in self.jobs)
+
+    def pump(self):
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.state == RUNNING:
+                job.sample(now)
+                if job.on_update:
+                    job.on_update(job)
+
+        while True:
+            try:
+                job = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            job.speed = 0.0
+            if job.on_update:
+                job.on_update(job)
+            if job.state in FINISHED and not job.reported:
+                # a paused job cancelled right after its worker queued it
+                # comes out twice
+                job.reported = True
+                if job.on_done:
+                    job.on_done(job)
+
+        finished = [job for job in self.jobs if job.state in FINISHED]
+        if len(finished) > self.keep_finished:
+            drop = set(map(id, finished[:-self.keep_finished]))
+            with self._lock:
+                self.jobs = [job for job in self.jobs if id(job) not in drop]
@@ -1,10 +1,69 @@
-from interface import GUI
+import time
+STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+import tracing
+
+
+def profile_startup(gui, imported):
+    # prints when the window first painted and when the first listing was
+    # complete (ms since the process started), then quits
+    marks = {'imports': imported, 'window': time.perf_counter()}
+
+    def mark(name):
+        marks.setdefault(name, time.perf_counter())
+
+    def painted(e):
+        mark('first paint')
+
+    def check():
+        if gui.manager.stream is None:
+            mark('listing')
+        if 'first paint' in marks and 'listing' in marks:
+            for name, at in sorted(marks.items(), key=lambda item: item[1]):
+                print(f'{name:>12}: {(at - STARTED) * 1000:8.1f} ms',
+                      file=sys.stderr)
+            print(f'{len(gui.manager.files)} entries, PIL '
+                  f'{"loaded" if "PIL" in sys.modules else "not loaded"}',
+                  file=sys.stderr)
+            gui.root.destroy()
+        else:
+            gui.root.after(5, check)
+
+    gui.root.bind('<Expose>', painted, add='+')
+    gui.root.after(5, check)
 
 
 def main():
-    gui = GUI()
+    parser = argparse.ArgumentParser(description='PyManager')
+    parser.add_argument('dir', nargs='?',
+                        help='directory to open (default: the root of the '
+                        'current drive)')
+    parser.add_argument('--trace', nargs='?', const='', metavar='FILE',
+                        help='time the hot paths (F12 shows them) and write '
+                        'a Chrome trace to FILE on exit')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print the time to first paint and to the '
+                        'first complete listing, then quit')
+    args = parser.parse_args()
+    if args.trace is not None:
+        tracing.enable()
+    if args.dir is not None and not os.path.isdir(args.dir):
+        parser.error(f'{args.dir} is not a directory')
+
+    # imported once tracing is set up, the hot paths are wrapped on import
+    from interface import GUI
+    imported = time.perf_counter()
+    gui = GUI(args.dir and os.path.abspath(args.dir))
+    if args.profile_startup:
+        profile_startup(gui, imported)
     gui.run()
 
+    if args.trace:
+        tracing.dump(args.trace)
 
 if __name__ == "__main__":
     main()
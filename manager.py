@@ -1,56 +1,610 @@
 import os
-import shutil
+import bisect
 import datetime as dt
 import sys
+import queue
+import re
+import subprocess
+from collections import OrderedDict
+from operator import attrgetter
+from threading import Thread
+
+from diskusage import DiskUsage
+from operations import BatchJob, CopyJob, DeleteJob, MoveJob
+from tracing import traced
 
 
 class File():
-    def __init__(self, dir):
+    # Slotted record filled lazily: name and path come from the directory
+    # entry, everything that needs a stat() or a datetime is computed on
+    # first access (see __getattr__).
+    __slots__ = ('fulldir', 'name', '_entry', '_stat',
+                 'dir', 'type', 'ext', 'size', 'ctime', 'mtime', 'st_mtime')
+
+    def __init__(self, dir, entry=None):
         self.fulldir = dir
-        self.dir = os.path.dirname(self.fulldir)
-        self.name = os.path.basename(self.fulldir)
-        self.type = 'file' if os.path.isfile(self.fulldir) else 'directory'
+        self.name = entry.name if entry is not None else os.path.basename(dir)
+        self._entry = entry
+        self._stat = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(entry.path, entry)
+
+    @classmethod
+    def from_row(cls, path, is_dir, size, mtime):
+        # an entry whose type, size and mtime are already known (the file
+        # index), so sorting by them does not stat it
+        file = cls(path)
+        file.type = 'directory' if is_dir else 'file'
+        file.size = size
+        file.st_mtime = mtime
+        return file
+
+    @property
+    def stat(self):
+        if self._stat is None:
+            try:
+                if self._entry is not None:
+                    self._stat = self._entry.stat()
+                else:
+                    self._stat = os.stat(self.fulldir)
+            except FileNotFoundError:
+                # broken symlink
+                self._stat = os.lstat(self.fulldir)
+        return self._stat
+
+    def is_file(self):
+        if self._entry is not None:
+            try:
+                return self._entry.is_file()
+            except OSError:
+                return False
+        return os.path.isfile(self.fulldir)
 
-        if self.type == 'file':
-            self.ext = self.name[self.name.rfind(".") + 1:]
+    def __getattr__(self, attr):
+        # only called for slots that have not been filled yet
+        if attr == 'dir':
+            value = os.path.dirname(self.fulldir)
+        elif attr == 'type':
+            value = 'file' if self.is_file() else 'directory'
+        elif attr == 'ext':
+            if self.type == 'file':
+                value = self.name[self.name.rfind(".") + 1:]
+            else:
+                value = '←' # because '←' is first in 
+                            # char table (need for sorting)
+        elif attr == 'size':
+            value = self.stat.st_size
+        elif attr == 'ctime':
+            value = dt.datetime.fromtimestamp(self.stat.st_ctime)
+        elif attr == 'mtime':
+            value = dt.datetime.fromtimestamp(self.st_mtime)
+        elif attr == 'st_mtime':
+            value = self.stat.st_mtime
         else:
-            self.ext = '←' # because '←' is first in 
-                           # char table (need for sorting)
-        
-        stat = os.stat(self.fulldir)
-        self.size = stat.st_size
-        self.ctime = dt.datetime.fromtimestamp(stat.st_ctime)
-        self.mtime = dt.datetime.fromtimestamp(stat.st_mtime)
-        
+            raise AttributeError(attr)
+        setattr(self, attr, value)
+        return value
+
+
+def scan_dir(dir):
+    with os.scandir(dir) as entries:
+        return [File.from_entry(entry) for entry in entries]
+
+
+def open_file(path):
+    # opens path with the system's default application
+    if sys.platform == 'win32':
+        os.startfile(path)
+    else:
+        command = 'open' if sys.platform == 'darwin' else 'xdg-open'
+        subprocess.Popen([command, path], stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def print_error(error):
+    print(f'Error: {error}', file=sys.stderr)
+
+
+class ListingCache():
+    # LRU of directory listings, validated against the directory's
+    # device/inode/mtime. Evicts by number of directories and by the total
+    # number of cached entries. Listings are stored as snapshots, with the
+    # order they were sorted in, and handed out as new lists, so callers
+    # can edit theirs without the cache drifting.
+    def __init__(self, max_dirs=64, max_entries=1_000_000):
+        self.max_dirs = max_dirs
+        self.max_entries = max_entries
+        self.entries = 0
+        self.hits = 0
+        self.misses = 0
+        self._listings = OrderedDict()
+
+    @staticmethod
+    def signature(dir):
+        stat = os.stat(dir)
+        return (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+
+    def lookup(self, dir, signature):
+        # (files, order) or None
+        cached = self._listings.get(dir)
+        if cached is not None and cached[0] == signature:
+            self._listings.move_to_end(dir)
+            self.hits += 1
+            return list(cached[1]), cached[2]
+        self.misses += 1
+        return None
+
+    def get(self, dir):
+        signature = self.signature(dir)
+        cached = self.lookup(dir, signature)
+        if cached is None:
+            files = scan_dir(dir)
+            self.put(dir, signature, files)
+            return files
+        return cached[0]
+
+    def put(self, dir, signature, files, order=None):
+        # order: how files are sorted (Manager.sorted_as), None if not
+        self.invalidate(dir)
+        if len(files) > self.max_entries:
+            return
+        self._listings[dir] = (signature, tuple(files), order)
+        self.entries += len(files)
+        while (len(self._listings) > self.max_dirs 
+               or self.entries > self.max_entries):
+            _, (_, evicted, _) = self._listings.popitem(last=False)
+            self.entries -= len(evicted)
+
+    def invalidate(self, dir=None):
+        if dir is None:
+            self._listings.clear()
+            self.entries = 0
+        elif dir in self._listings:
+            self.entries -= len(self._listings.pop(dir)[1])
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'dirs': len(self._listings),
+                'entries': self.entries}
+
+
+class ListingStream():
+    # Lists a directory in a background thread and hands out batches
+    # through a queue, so the caller can show the first entries before the
+    # enumeration is finished.
+    def __init__(self, dir, signature, first_batch=128, batch_size=4096,
+                 need_stat=False):
+        self.dir = dir
+        self.signature = signature
+        self.first_batch = first_batch
+        self.batch_size = batch_size
+        self.need_stat = need_stat
+        self.batches = queue.SimpleQueue()
+        self.cancelled = False
+        self.done = False
+        self.error = None
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            with os.scandir(self.dir) as entries:
+                batch = []
+                size = self.first_batch
+                for entry in entries:
+                    if self.cancelled:
+                        return
+                    file = File.from_entry(entry)
+                    if self.need_stat:
+                        try:
+                            file.stat
+                        except OSError:
+                            pass
+                    batch.append(file)
+                    if len(batch) >= size:
+                        self.batches.put(batch)
+                        batch = []
+                        size = self.batch_size
+                self.batches.put(batch)
+        except OSError as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    def drain(self):
+        files = []
+        while True:
+            try:
+                files.extend(self.batches.get_nowait())
+            except queue.Empty:
+                return files
+
+
+NATURAL_SPLIT = re.compile(r'(\d+)', re.ASCII)
+
+
+def natural_key(name):
+    # 'part-2' < 'part-10'; digits are always at odd positions after split
+    parts = NATURAL_SPLIT.split(name.casefold())
+    parts[1::2] = map(int, parts[1::2])
+    return parts
+
+
+SORT_KEYS = {
+    'name': attrgetter('name'),
+    'natural': lambda x: natural_key(x.name),
+    'ext': attrgetter('ext'),
+    'type': lambda x: x.type != 'directory',
+    # computed without building datetime objects
+    'size': attrgetter('size'),
+    'mtime': attrgetter('st_mtime'),
+}
+STAT_FIELDS = ('size', 'mtime')
+
+
+class SortKey():
+    # Composite key of an entry in a sorted listing, for bisecting: fields
+    # compare most significant first, each in its own direction.
+    __slots__ = ('keys', 'reverse')
+
+    def __init__(self, keys, reverse):
+        self.keys = keys
+        self.reverse = reverse
+
+    def __lt__(self, other):
+        for key, other_key, reverse in zip(self.keys, other.keys, 
+                                           self.reverse):
+            if key != other_key:
+                return key > other_key if reverse else key < other_key
+        return False
+
 
 class Manager():
-    def __init__(self, current_dir):
+    # Everything the file manager does, without any UI: errors that do not
+    # belong to a single call (listing a directory, streamed listings) go
+    # to on_error, files are opened with opener. Both are callables taking
+    # an exception / a path.
+    MUTATION_LIMIT = 256 # more changes at once are merged by re-sorting
+
+    def __init__(self, current_dir, streaming=False, workers=8, 
+                 on_error=print_error, opener=open_file):
         self.current_dir = current_dir
+        self.workers = workers
+        self.on_error = on_error
+        self.opener = opener
         self.history = [[self.current_dir, 0, 0]]
         self.history_cursor = 0
         self.sorting_by = 'name'
         self.sorting_ascending = True
+        self.dirs_first = False
+        self.columns = {} # sort field -> {File: key}
+        self.sorted_as = None
+        self.directories = None
+        self.du = DiskUsage()
+        self.measured = [] # directories of the listing given to self.du
+        self.cache = ListingCache()
+        self.streaming = streaming
+        self.stream = None
+        self.pending = []
+        self.files = []
+        self.index = {} # name -> File of self.files
+        self.suffixes = {} # basename -> last number used by unique_name
+        self.version = 0 # changes whenever self.files is reordered or edited
+        self.dirlen = 0
         self.update_files(self.current_dir)
 
+    @traced('listing.update_files')
     def update_files(self, dir):
+        self.cancel_stream()
         try:
-            self.files = [
-                File(os.path.join(dir, f))
-                for f in os.listdir(dir)
-            ]
-            self.sort_files()
-            self.dirlen = len(self.files)
+            signature = self.cache.signature(dir)
+            cached = self.cache.lookup(dir, signature)
+            if cached is not None:
+                files, order = cached
+            elif self.streaming:
+                self.start_stream(dir, signature)
+                files, order = [], None
+            else:
+                files, order = scan_dir(dir), None
+            self.set_files(files, order)
+            if files and order != self.sorted_as:
+                # cached sorted, so coming back does not sort again
+                self.cache.put(dir, signature, self.files, self.sorted_as)
         except PermissionError as e:
-            from tkinter.messagebox import showerror
-            showerror('Error', e)
+            self.on_error(e)
 
+    def set_files(self, files, order=None):
+        # order: how files are already sorted (a sorted_as), if known
+        self.files = files
+        self.index = {file.name: file for file in files}
+        self.suffixes = {}
+        self.columns = {}
+        self.sorted_as = order
+        self.directories = None
+        self.sort_files()
+        self.dirlen = len(self.files)
+
+    @property
+    def loaded(self):
+        return len(self.files) + len(self.pending)
+
+    def start_stream(self, dir, signature):
+        self.stream = ListingStream(dir, signature, 
+                                    need_stat=any(field in STAT_FIELDS 
+                                                  for field in
+                                                  self.sort_fields()))
+        self.stream.start()
+
+    def cancel_stream(self):
+        if self.stream is not None:
+            self.stream.cancel()
+            self.stream = None
+        self.pending = []
+
+    @traced('listing.drain_stream')
+    def drain_stream(self):
+        # Merges streamed entries into self.files. Merges are done when the
+        # pending part is at least as big as the sorted part, so a listing
+        # of n entries is re-sorted O(log n) times. Returns True if
+        # self.files changed.
+        stream = self.stream
+        if stream is None:
+            return False
+        done = stream.done
+        self.pending.extend(stream.drain())
+
+        merged = False
+        if self.pending and (done or len(self.pending) >= 
+                             max(len(self.files), stream.first_batch)):
+            # entries created meanwhile (make_dir...) are already listed
+            self.files.extend(file for file in self.pending 
+                              if file.name not in self.index)
+            self.pending = []
+            self.set_files(self.files)
+            merged = True
+
+        if done:
+            self.stream = None
+            if stream.error is not None:
+                self.on_error(stream.error)
+            else:
+                self.cache.put(stream.dir, stream.signature, self.files,
+                               self.sorted_as)
+        return merged
+
+    def set_sorting(self, sorting_by=None, ascending=None, dirs_first=None):
+        if sorting_by is not None:
+            self.sorting_by = sorting_by
+        if ascending is not None:
+            self.sorting_ascending = ascending
+        if dirs_first is not None:
+            self.dirs_first = dirs_first
+        self.sort_files()
+
+    def sort_fields(self):
+        # sorting_by is a field name or a tuple of them, most significant
+        # first. Names are unique in a directory, so ending on 'name'
+        # makes the order total and bisecting finds the exact entry.
+        if isinstance(self.sorting_by, str):
+            fields = (self.sorting_by,)
+        else:
+            fields = tuple(self.sorting_by)
+        if self.dirs_first and fields[0] != 'type':
+            fields = ('type',) + fields
+        if 'name' not in fields:
+            fields += ('name',)
+        return fields
+
+    def key_function(self, field):
+        if field == 'size':
+            return self.size_key
+        return SORT_KEYS.get(field, attrgetter(field))
+
+    def key_column(self, field):
+        column = self.columns.get(field)
+        if column is None:
+            key = self.key_function(field)
+            column = {file: key(file) for file in self.files}
+            self.columns[field] = column
+        return column
+
+    def size_key(self, file):
+        if file.type == 'directory':
+            total = self.du.get(file.fulldir)
+            return total.bytes if total is not None else 0
+        return file.size
+
+    @traced('listing.sort_files')
     def sort_files(self):
-        self.files.sort(key=lambda x: x.__getattribute__(self.sorting_by), 
-                        reverse=not self.sorting_ascending)
+        # Reuses the in-memory listing: keys are computed once per field,
+        # a direction flip is a linear reverse, and multi-key sorts are
+        # successive stable sorts from the least significant field.
+        # 'type' (directories first) keeps its order in both directions.
+        fields = self.sort_fields()
+        if self.sorted_as == (fields, self.sorting_ascending):
+            return
+        if self.sorted_as is not None and self.sorted_as[0] == fields:
+            self.reverse_files(fields)
+        else:
+            reverse = not self.sorting_ascending
+            for field in reversed(fields):
+                self.files.sort(key=self.key_column(field).__getitem__,
+                                reverse=reverse and field != 'type')
+        self.sorted_as = (fields, self.sorting_ascending)
+        self.version += 1
+
+    def sort_list(self, files):
+        # sorts entries that are not the listing (search results) the way
+        # the listing is sorted; entries gone from disk sort as 0
+        reverse = not self.sorting_ascending
+        for field in reversed(self.sort_fields()):
+            key = self.key_function(field)
+            keys = {}
+            for file in files:
+                try:
+                    keys[file] = key(file)
+                except OSError:
+                    keys[file] = 0
+            files.sort(key=keys.__getitem__, 
+                       reverse=reverse and field != 'type')
+
+    def reverse_files(self, fields):
+        if fields[0] == 'type':
+            column = self.key_column('type')
+            dirs = sum(1 for file in self.files if not column[file])
+            self.files[:dirs] = self.files[:dirs][::-1]
+            self.files[dirs:] = self.files[dirs:][::-1]
+        else:
+            self.files.reverse()
+
+    def sort_key(self, file):
+        fields, ascending = self.sorted_as
+        return SortKey(tuple(self.key_column(field)[file] for field in fields),
+                       tuple(not ascending and field != 'type' 
+                             for field in fields))
+
+    def position(self, name):
+        # index of the entry called name in self.files, or None
+        file = self.index.get(name)
+        if file is None:
+            return None
+        lo = bisect.bisect_left(self.files, self.sort_key(file), 
+                                key=self.sort_key)
+        if lo < len(self.files) and self.files[lo] is file:
+            return lo
+        # a listing sorted before its keys changed (a cached listing whose
+        # directory sizes were measured since)
+        return self.files.index(file)
+
+    def insert(self, file):
+        # puts a new entry at its sorted position, returns the position
+        for field in self.sorted_as[0]:
+            self.key_column(field)
+        for field, column in self.columns.items():
+            column[file] = self.key_function(field)(file)
+        position = bisect.bisect_right(self.files, self.sort_key(file), 
+                                       key=self.sort_key)
+        self.files.insert(position, file)
+        self.index[file.name] = file
+        self.version += 1
+        self.dirlen = len(self.files)
+        self.directories = None
+        return position
+
+    def remove(self, file):
+        del self.files[self.position(file.name)]
+        for column in self.columns.values():
+            column.pop(file, None)
+        del self.index[file.name]
+        self.suffixes = {}
+        self.version += 1
+        self.dirlen = len(self.files)
+        self.directories = None
+
+    @traced('listing.update_entries')
+    def update_entries(self, removed, added):
+        # Single-entry mutations at their sorted positions for a few
+        # entries; many are merged with one filter and a re-sort of the
+        # almost sorted list.
+        removed = [file for file in removed 
+                   if self.index.get(file.name) is file]
+        if len(removed) + len(added) <= self.MUTATION_LIMIT:
+            for file in removed:
+                self.remove(file)
+            for file in added:
+                if file.name in self.index:
+                    self.remove(self.index[file.name])
+                self.insert(file)
+            return
+
+        gone = set(removed)
+        gone.update(self.index[file.name] for file in added 
+                    if file.name in self.index)
+        self.files[:] = [file for file in self.files if file not in gone]
+        self.files.extend(added)
+        for file in gone:
+            del self.index[file.name]
+        self.index.update((file.name, file) for file in added)
+        for field, column in self.columns.items():
+            for file in gone:
+                column.pop(file, None)
+            key = self.key_function(field)
+            for file in added:
+                column[file] = key(file)
+        self.suffixes = {}
+        self.sorted_as = None
+        self.directories = None
+        self.sort_files()
+        self.dirlen = len(self.files)
+
+    def list_directories(self):
+        if self.directories is None:
+            self.directories = [file.fulldir for file in self.files 
+                                if file.type == 'directory']
+        return self.directories
+
+    def measure_dirs(self, current=None):
+        # For a new listing or sort: the directory under the cursor first,
+        # then every directory of the listing when sorting by size
+        self.measured = []
+        if 'size' in self.sort_fields():
+            self.measured = self.list_directories()
+        dirs = [current] if current is not None else []
+        self.du.request(dirs + self.measured)
+
+    def measure_dir(self, dir):
+        # For a cursor move: the directory under it, unless it is already
+        # measured, without dropping the listing's walks
+        if not self.du.known(dir):
+            self.du.request([dir] + self.measured)
+
+    def drain_dir_sizes(self):
+        # Picks up totals measured since the last call and re-sorts if the
+        # listing is sorted by size. Returns the changed totals.
+        changes = self.du.drain()
+        if changes:
+            if 'size' in self.sort_fields():
+                self.columns.pop('size', None)
+                self.sorted_as = None
+                self.sort_files()
+        return changes
+
+    @traced('listing.apply_changes')
+    def apply_changes(self, names):
+        # Brings the listing up to date for entries of current_dir that
+        # were reported as changed: each name is looked up on disk and its
+        # entry inserted, replaced or removed. Returns the set of names
+        # whose entry changed.
+        if self.stream is not None or not names:
+            return set()
+        removed = []
+        added = []
+        for name in names:
+            old = self.index.get(name)
+            if old is not None:
+                removed.append(old)
+            file = File(os.path.join(self.current_dir, name))
+            try:
+                file.stat
+            except OSError:
+                continue # missing, or gone again
+            added.append(file)
+        if not removed and not added:
+            return set()
+        self.update_entries(removed, added)
+        return {file.name for file in removed} | {file.name for file in added}
 
     def change_dir(self, dir, current_row=0, cursor=0):
         if os.path.isfile(dir):
-            os.startfile(dir)
+            self.opener(dir)
             return True
         else:
             self.update_history(dir, current_row, cursor)
@@ -80,57 +634,80 @@ class Manager():
             self.update_files(self.current_dir)
             return self.history[self.history_cursor][1:]
         
+    def unique_name(self, basename):
+        # 'name', 'name (1)', 'name (2)', ... checked against the name
+        # index, numbering goes on from the last number handed out
+        num = self.suffixes.get(basename, 0)
+        name = basename if num == 0 else f'{basename} ({num})'
+        while name in self.index:
+            num += 1
+            name = f'{basename} ({num})'
+        self.suffixes[basename] = num
+        return name
+
+    def create(self, basename, create):
+        # the listing may lag behind the disk (streaming, other programs),
+        # so the name is only taken once create() succeeded
+        while True:
+            name = self.unique_name(basename)
+            path = os.path.join(self.current_dir, name)
+            try:
+                create(path)
+            except FileExistsError:
+                self.suffixes[basename] += 1
+                continue
+            self.insert(File(path))
+            return name
+
     def make_dir(self):
-        basename = 'New Directory'
-        if os.path.exists(os.path.join(self.current_dir, basename)):
-            num = 1
-            while os.path.exists(os.path.join(self.current_dir, 
-                                              f"{basename} ({num})")):
-                num += 1
-            basename = f"{basename} ({num})"
-        
-        os.mkdir(os.path.join(self.current_dir, basename))
-        return basename
+        return self.create('New Directory', os.mkdir)
     
     def make_file(self):
-        basename = 'New File'
-        if os.path.exists(os.path.join(self.current_dir, basename)):
-            num = 1
-            while os.path.exists(os.path.join(self.current_dir, 
-                                              f"{basename} ({num})")):
-                num += 1
-            basename = f"{basename} ({num})"
-        
-        open(os.path.join(self.current_dir, basename), 'a').close()
-        return basename
+        return self.create('New File', lambda path: open(path, 'x').close())
+
+    def delete_job(self, paths):
+        return DeleteJob(paths, workers=self.workers)
 
+    @traced('ops.delete_file')
     def delete_file(self, path):
-        if os.path.isfile(path):
-            os.remove(path)
-        else:
-            shutil.rmtree(path)
+        self.delete_job([path]).run()
+
+    def remove_entries(self, paths):
+        # drops deleted entries from the listing, keeping its order
+        paths = set(paths)
+        removed = [self.index[os.path.basename(path)] for path in paths
+                   if os.path.basename(path) in self.index]
+        self.update_entries([file for file in removed 
+                             if file.fulldir in paths], [])
 
     def rename_file(self, file, new_name):
         new_file = os.path.join(file.dir, new_name)
         if not os.path.exists(new_file):
-            os.rename(file.fulldir, os.path.join(file.dir, new_name))
+            os.rename(file.fulldir, new_file)
+            if file.dir == self.current_dir:
+                self.update_entries([file], [File(new_file)])
 
-    def paste_file(self, src, dst):
-        if os.path.isfile(src):
-            shutil.copy2(src, dst)
-            return src.split(os.path.sep)[-1]
-        else:
-            shutil.copytree(src, os.path.join(dst, src.split(os.path.sep)[-1]))
-            return src.split(os.path.sep)[-1]
+    def copy_job(self, src, dst, policy='rename'):
+        return CopyJob(src, dst, policy=policy, workers=self.workers)
 
-    def move_file(self, src, dst):
-        if os.path.isfile(src):
-            shutil.move(src, os.path.join(dst, src.split(os.path.sep)[-1]))
-            return src.split(os.path.sep)[-1]
-        else:
-            shutil.move(src, os.path.join(dst, src.split(os.path.sep)[-1]), 
-                        copy_function=shutil.copytree)
-            return src.split(os.path.sep)[-1]
+    @traced('ops.paste_file')
+    def paste_file(self, src, dst, policy='rename'):
+        job = self.copy_job(src, dst, policy)
+        job.run()
+        return job.name
+
+    def move_job(self, src, dst, policy='rename'):
+        return MoveJob(src, dst, policy=policy, workers=self.workers)
+
+    def batch_job(self, srcs, dst, move=False, policy='rename'):
+        return BatchJob(srcs, dst, move=move, policy=policy, 
+                        workers=self.workers)
+
+    @traced('ops.move_file')
+    def move_file(self, src, dst, policy='rename'):
+        job = self.move_job(src, dst, policy)
+        job.run()
+        return job.name
         
     @staticmethod
     def sizeof_fmt(num, suffix="B"):
@@ -0,0 +1,825 @@
+import errno
+import os
+import queue
+import shutil
+from threading import Lock, Thread
+
+
+BLOCK = 8 * 2**20
+WORKERS = 8
+POLICIES = ('rename', 'overwrite', 'skip', 'error')
+
+
+class Cancelled(Exception):
+    pass
+
+
+def unique_name(dir, basename, taken=()):
+    # 'name', 'name (1)', 'name (2)', ...; names in taken count as existing
+    def exists(name):
+        return name in taken or os.path.lexists(os.path.join(dir, name))
+
+    if not exists(basename):
+        return basename
+    num = 1
+    while exists(f"{basename} ({num})"):
+        num += 1
+    return f"{basename} ({num})"
+
+
+def part_path(path):
+    head, tail = os.path.split(path)
+    return os.path.join(head, f'.{tail}.part')
+
+
+def copy_data(infd, outfd, offset, size, progress):
+    # Kernel-side copies first (copy_file_range, then sendfile), plain
+    # large-block reads/writes when neither works for this pair of files.
+    # A method that stops short of size (some FUSE and proc-like files, a
+    # source that shrank) hands over to the next one; if reads also end
+    # early, raises rather than leave a copy padded with zeros.
+    # progress(n) is called after each block and may raise Cancelled.
+    pos = offset
+    if pos < size and hasattr(os, 'copy_file_range'):
+        try:
+            while pos < size:
+                n = os.copy_file_range(infd, outfd, min(BLOCK, size - pos),
+                                       pos, pos)
+                if n == 0:
+                    break
+                pos += n
+                progress(n)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                               errno.EOPNOTSUPP, errno.EBADF):
+                raise
+
+    if pos < size and hasattr(os, 'sendfile') and os.name == 'posix':
+        try:
+            os.lseek(outfd, pos, os.SEEK_SET)
+            while pos < size:
+                n = os.sendfile(outfd, infd, pos, min(BLOCK, size - pos))
+                if n == 0:
+                    break
+                pos += n
+                progress(n)
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    if pos < size:
+        os.lseek(infd, pos, os.SEEK_SET)
+        os.lseek(outfd, pos, os.SEEK_SET)
+        buffer = bytearray(min(BLOCK, size - pos))
+        view = memoryview(buffer)
+        with open(infd, 'rb', buffering=0, closefd=False) as fsrc:
+            while pos < size:
+                n = fsrc.readinto(view[:min(len(buffer), size - pos)])
+                if not n:
+                    break
+                written = 0
+                while written < n:
+                    written += os.write(outfd, view[written:n])
+                pos += n
+                progress(n)
+
+    if pos < size:
+        raise OSError(errno.EIO, f'Source ended after {pos} of {size} bytes')
+
+
+class CopyJob():
+    # Copies a file or a whole tree into dst_dir. The source is walked once
+    # into a plan, then files are copied by a pool of threads. Files are
+    # written to hidden '.name.part' files and renamed when complete, so a
+    # cancelled or failed job can be resumed with resume():
+    # finished files are skipped, partial ones continue from where they
+    # stopped. policy says what to do when dst_dir already has an entry
+    # with the source's name: 'rename' to 'name (1)', 'overwrite' (merging
+    # directories), 'skip' or 'error'.
+    def __init__(self, src, dst_dir, policy='rename', workers=WORKERS):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown conflict policy {policy!r}')
+        self.src = os.path.normpath(src)
+        self.dst_dir = dst_dir
+        self.policy = policy
+        self.workers = workers
+
+        self.name = None
+        self.dst = None
+        self.dirs = []
+        self.links = []
+        self.files = [] # (relative path, size)
+        self.reserved = set() # names taken by other jobs of a batch
+        # what earlier runs of this job left, trusted by resume(): relative
+        # paths of files copied, .part files written
+        self.completed = set()
+        self.started = set()
+
+        self.files_total = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.errors = []
+        self.cancelled = False
+        self.done = False
+        self._resolved = False
+        self._planned = False
+        self._lock = Lock()
+
+    @property
+    def names(self):
+        # name taken in dst_dir, once resolved
+        return [self.name] if self.name is not None else []
+
+    @property
+    def paths(self):
+        # source and destination
+        return [self.src] + ([self.dst] if self.dst is not None else [])
+
+    def cancel(self):
+        self.cancelled = True
+
+    def resolve_destination(self):
+        name = os.path.basename(self.src)
+        target = os.path.join(self.dst_dir, name)
+        if name in self.reserved or os.path.lexists(target):
+            if self.policy == 'error':
+                raise FileExistsError(errno.EEXIST, 'File exists', target)
+            if self.policy == 'skip':
+                return None
+            if self.policy == 'rename':
+                name = unique_name(self.dst_dir, name, self.reserved)
+        return name
+
+    def resolve(self):
+        if not self._resolved:
+            self.name = self.resolve_destination()
+            if self.name is not None:
+                self.dst = os.path.join(self.dst_dir, self.name)
+                self.check_overwrite()
+            self._resolved = True
+        return self.name
+
+    def check_overwrite(self):
+        # 'overwrite' replaces files and merges directories, it does not
+        # turn one into the other
+        if (self.policy != 'overwrite' or not os.path.lexists(self.dst)
+                or os.path.normpath(self.dst) == self.src):
+            return
+        dst_is_dir = os.path.isdir(self.dst) and not os.path.islink(self.dst)
+        if os.path.isdir(self.src) and not dst_is_dir:
+            raise OSError(errno.ENOTDIR,
+                          'Cannot overwrite a file with a directory',
+                          self.dst)
+        if not os.path.isdir(self.src) and dst_is_dir:
+            raise OSError(errno.EISDIR,
+                          'Cannot overwrite a directory with a file',
+                          self.dst)
+
+    def plan(self):
+        self._planned = True
+        self.dirs = []
+        self.links = []
+        self.files = []
+        if self.resolve() is None:
+            return
+
+        if not os.path.isdir(self.src):
+            self.files.append(('', os.stat(self.src).st_size))
+        else:
+            real_src = os.path.realpath(self.src)
+            real_dst = os.path.realpath(self.dst)
+            if (real_dst + os.path.sep).startswith(real_src + os.path.sep):
+                raise OSError(errno.EINVAL,
+                              'Cannot copy a directory into itself',
+                              self.src)
+            stack = ['']
+            while stack:
+                rel = stack.pop()
+                self.dirs.append(rel)
+                with os.scandir(os.path.join(self.src, rel)) as entries:
+                    for entry in entries:
+                        path = os.path.join(rel, entry.name)
+                        if entry.is_symlink():
+                            self.links.append(path)
+                        elif entry.is_dir(follow_symlinks=False):
+                            stack.append(path)
+                        elif entry.is_file(follow_symlinks=False):
+                            self.files.append(
+                                (path, entry.stat(follow_symlinks=False)
+                                 .st_size))
+
+        self.files_total = len(self.files)
+        self.bytes_total = sum(size for _, size in self.files)
+
+    def source(self, rel):
+        return os.path.join(self.src, rel) if rel else self.src
+
+    def target(self, rel):
+        return os.path.join(self.dst, rel) if rel else self.dst
+
+    def resume(self):
+        self.cancelled = False
+        self.run()
+
+    def reset(self):
+        # before each run
+        self.done = False
+        self.errors = []
+        self.files_done = 0
+        self.bytes_done = 0
+
+    def run(self):
+        self.reset()
+        try:
+            self.execute()
+        finally:
+            self.done = True
+
+    def execute(self):
+        if not self.prepare():
+            return
+        files = iter(self.files)
+        workers = min(self.workers, max(len(self.files), 1))
+        threads = [Thread(target=self.work, args=(files,))
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.finish()
+
+    def prepare(self):
+        # plans and creates the directories and links, returns False if
+        # there is nothing left to copy
+        if not self._planned:
+            self.plan()
+        if self.name is None:
+            return False
+
+        for rel in self.dirs:
+            os.makedirs(self.target(rel), exist_ok=True)
+        for rel in self.links:
+            try:
+                self.copy_link(rel)
+            except OSError as e:
+                self.errors.append((self.source(rel), self.target(rel),
+                                    str(e)))
+        return True
+
+    def finish(self):
+        if self.cancelled:
+            raise Cancelled(self.src)
+        for rel in reversed(self.dirs):
+            try:
+                shutil.copystat(self.source(rel), self.target(rel))
+            except OSError:
+                pass
+        if self.errors:
+            raise shutil.Error(self.errors)
+
+    def work(self, files):
+        while not self.cancelled:
+            with self._lock:
+                item = next(files, None)
+            if item is None:
+                return
+            if not self.copy_item(*item):
+                return
+
+    def copy_item(self, rel, size):
+        # returns False if the job was cancelled
+        src, dst = self.source(rel), self.target(rel)
+        try:
+            if rel in self.completed:
+                # finished by an earlier run of this job
+                self.progress(size)
+                with self._lock:
+                    self.files_done += 1
+                return True
+            self.copy_file(src, dst, size)
+            with self._lock:
+                self.completed.add(rel)
+        except Cancelled:
+            return False
+        except OSError as e:
+            with self._lock:
+                self.errors.append((src, dst, str(e)))
+        return True
+
+    def progress(self, n):
+        with self._lock:
+            self.bytes_done += n
+        if self.cancelled:
+            raise Cancelled()
+
+    def copy_file(self, src, dst, size):
+        stat = os.stat(src)
+        part = part_path(dst)
+        offset = 0
+        if part in self.started:
+            # partly written by an earlier run of this job
+            try:
+                offset = min(os.stat(part).st_size, stat.st_size)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.started.add(part)
+        self.progress(offset)
+
+        infd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            outfd = os.open(part, os.O_WRONLY | os.O_CREAT
+                            | (0 if offset else os.O_TRUNC)
+                            | getattr(os, 'O_BINARY', 0), 0o600)
+            try:
+                copy_data(infd, outfd, offset, stat.st_size, self.progress)
+                os.ftruncate(outfd, stat.st_size)
+            finally:
+                os.close(outfd)
+        finally:
+            os.close(infd)
+
+        try:
+            shutil.copystat(src, part)
+            os.replace(part, dst)
+        except OSError:
+            # e.g. dst is a directory inside a merged tree
+            try:
+                os.unlink(part)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self.files_done += 1
+
+    def copy_link(self, rel):
+        dst = self.target(rel)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.symlink(os.readlink(self.source(rel)), dst)
+
+
+def same_device(src, dst_dir):
+    return os.lstat(src).st_dev == os.stat(dst_dir).st_dev
+
+
+class MoveJob(CopyJob):
+    # Moves src into dst_dir. On the same filesystem this is one atomic
+    # os.rename. Across filesystems the tree is streamed file by file: a
+    # file's source is unlinked only once its copy is complete, so extra
+    # disk usage is bounded by the files in flight and an interrupted move
+    # leaves every file whole on one side or the other. resume() re-walks
+    # whatever is left in the source.
+    def __init__(self, src, dst_dir, policy='rename', workers=WORKERS):
+        CopyJob.__init__(self, src, dst_dir, policy, workers)
+        self.same_device = None
+        self.runs = 0
+
+    def resolve_destination(self):
+        if os.path.samefile(os.path.dirname(self.src), self.dst_dir):
+            return os.path.basename(self.src) # already there
+        return CopyJob.resolve_destination(self)
+
+    def reset(self):
+        # whatever is left in the source is walked again
+        CopyJob.reset(self)
+        self._planned = False
+        self.runs += 1
+
+    def prepare(self):
+        # a move within a filesystem is done here, returns False
+        if not os.path.lexists(self.src):
+            if self.runs > 1:
+                return False # moved by an earlier run
+            raise FileNotFoundError(errno.ENOENT, 'No such file or directory',
+                                    self.src)
+        if self.resolve() is None:
+            return False
+        if os.path.normpath(self.dst) == self.src:
+            return False
+        if self.same_device is None:
+            self.same_device = same_device(self.src, self.dst_dir)
+        if self.same_device and not os.path.isdir(self.dst):
+            if os.path.isdir(self.src):
+                real_src = os.path.realpath(self.src)
+                real_dst = os.path.realpath(self.dst)
+                if (real_dst + os.path.sep).startswith(real_src + os.path.sep):
+                    raise OSError(errno.EINVAL,
+                                  'Cannot move a directory into itself',
+                                  self.src)
+            try:
+                os.rename(self.src, self.dst)
+            except OSError as e:
+                # bind mounts and some overlay volumes share st_dev but
+                # refuse renames between them: copy instead
+                if e.errno != errno.EXDEV:
+                    raise
+                self.same_device = False
+            else:
+                self.files_total = self.files_done = 1
+                return False
+        return CopyJob.prepare(self)
+
+    def finish(self):
+        CopyJob.finish(self)
+        for rel in reversed(self.dirs):
+            try:
+                os.rmdir(self.source(rel))
+            except OSError:
+                pass
+
+    def copy_file(self, src, dst, size):
+        if self.same_device:
+            try:
+                os.replace(src, dst)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                self.same_device = False
+            else:
+                self.progress(size)
+                with self._lock:
+                    self.files_done += 1
+                return
+        CopyJob.copy_file(self, src, dst, size)
+        os.unlink(src)
+
+    def copy_link(self, rel):
+        CopyJob.copy_link(self, rel)
+        os.unlink(self.source(rel))
+
+
+class BatchJob():
+    # Copies or moves many sources into dst_dir as one job. Every source is
+    # prepared first, one after the other: moves within a filesystem are
+    # plain renames and are finished right there, the rest are planned
+    # with the names they will take reserved, so sources with the same
+    # name do not collide. The files of all of them are then copied by one
+    # shared pool of threads, ordered by source device, so a batch of
+    # small sources keeps every worker busy. Progress and errors are summed
+    # over the sources, resume() picks up each one where it stopped.
+    def __init__(self, srcs, dst_dir, move=False, policy='rename',
+                 workers=WORKERS):
+        job = MoveJob if move else CopyJob
+        self.jobs = [job(src, dst_dir, policy, workers) for src in srcs]
+        self.reserved = set()
+        for job in self.jobs:
+            job.reserved = self.reserved
+        self.dst_dir = dst_dir
+        self.move = move
+        self.workers = workers
+        self.errors = []
+        self.cancelled = False
+        self.done = False
+        self._lock = Lock()
+
+    @property
+    def files_total(self):
+        return sum(job.files_total for job in self.jobs)
+
+    @property
+    def files_done(self):
+        return sum(job.files_done for job in self.jobs)
+
+    @property
+    def bytes_total(self):
+        return sum(job.bytes_total for job in self.jobs)
+
+    @property
+    def bytes_done(self):
+        return sum(job.bytes_done for job in self.jobs)
+
+    @property
+    def names(self):
+        # names taken in dst_dir so far
+        return [job.name for job in self.jobs if job.name is not None]
+
+    @property
+    def paths(self):
+        # sources and destinations
+        return ([job.src for job in self.jobs]
+                + [job.dst for job in self.jobs if job.dst is not None])
+
+    def cancel(self):
+        self.cancelled = True
+        for job in self.jobs:
+            job.cancel()
+
+    def resume(self):
+        self.cancelled = False
+        for job in self.jobs:
+            job.cancelled = False
+        self.run()
+
+    def run(self):
+        self.done = False
+        self.errors = []
+        try:
+            self.execute()
+        finally:
+            self.done = True
+
+    def execute(self):
+        prepared = []
+        for job in self.jobs:
+            if self.cancelled:
+                raise Cancelled(job.src)
+            job.reset()
+            try:
+                if job.prepare():
+                    prepared.append(job)
+            except OSError as e:
+                self.errors.append((job.src, job.dst_dir, str(e)))
+            if job.name is not None:
+                self.reserved.add(job.name)
+
+        prepared.sort(key=lambda job: device_of(job.src))
+        files = iter([(job, rel, size) for job in prepared 
+                      for rel, size in job.files])
+        workers = min(self.workers, max(sum(len(job.files) 
+                                            for job in prepared), 1))
+        threads = [Thread(target=self.work, args=(files,))
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.cancelled:
+            raise Cancelled(self.dst_dir)
+        for job in prepared:
+            try:
+                job.finish()
+            except shutil.Error as e:
+                self.errors.extend(e.args[0])
+        for job in self.jobs:
+            job.done = True
+        if self.errors:
+            raise shutil.Error(self.errors)
+
+    def work(self, files):
+        while not self.cancelled:
+            with self._lock:
+                item = next(files, None)
+            if item is None:
+                return
+            job, rel, size = item
+            if not job.copy_item(rel, size):
+                return
+
+
+def device_of(path):
+    try:
+        return os.lstat(path).st_dev
+    except OSError:
+        return -1
+
+
+DIR_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
+FD_RELATIVE = (os.unlink in os.supports_dir_fd 
+               and os.rmdir in os.supports_dir_fd
+               and os.scandir in os.supports_fd)
+
+
+class DeleteJob():
+    # Deletes paths (files or trees). Trees are split into sibling subtrees
+    # (expanding the first levels when there are only a few of them) which
+    # a pool of threads deletes in parallel, each one walking its subtree
+    # with os.scandir and dir_fd-relative unlink/rmdir. Files met while
+    # expanding are handed to the pool in batches as the scan goes, so a
+    # huge flat directory is deleted in parallel too. Paths that are gone
+    # are queued in self.removed as they finish.
+    EXPAND_DEPTH = 3
+    BATCH = 1024 # files of an expanded directory per pool task
+
+    def __init__(self, paths, workers=WORKERS):
+        self.paths = [os.path.normpath(path) for path in paths]
+        self.workers = workers
+        self.files_done = 0
+        self.dirs_done = 0
+        self.bytes_done = 0 # freed
+        self.errors = []
+        self.cancelled = False
+        self.done = False
+        self.removed = queue.SimpleQueue()
+        self._lock = Lock()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def resume(self):
+        self.cancelled = False
+        self.paths = [path for path in self.paths if os.path.lexists(path)]
+        self.run()
+
+    def drain(self):
+        paths = []
+        while True:
+            try:
+                paths.append(self.removed.get_nowait())
+            except queue.Empty:
+                return paths
+
+    def run(self):
+        self.done = False
+        self.errors = []
+        try:
+            self.execute()
+        finally:
+            self.done = True
+
+    def error(self, path, e):
+        with self._lock:
+            self.errors.append((path, str(e)))
+
+    def execute(self):
+        # expanded directories are removed by this thread once the
+        # subtrees and files under them are gone, deepest first
+        expanded = []
+        frontier = []
+        for path in self.paths:
+            if os.path.isdir(path) and not os.path.islink(path):
+                frontier.append((path, path))
+            elif self.delete_file(path):
+                self.removed.put(path)
+
+        tasks = queue.SimpleQueue()
+        threads = []
+
+        def submit(task):
+            # one more worker per task, up to the pool size
+            tasks.put(task)
+            if len(threads) < self.workers:
+                thread = Thread(target=self.work, args=(tasks,))
+                threads.append(thread)
+                thread.start()
+
+        fds = []
+        try:
+            depth = 0
+            while (frontier and len(frontier) < self.workers * 2
+                   and depth < self.EXPAND_DEPTH):
+                next_frontier = []
+                for path, top in frontier:
+                    expanded.append((path, top))
+                    next_frontier += self.expand(path, top, submit, fds)
+                frontier = next_frontier
+                depth += 1
+            for task in frontier:
+                submit(task)
+        finally:
+            for _ in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+            for fd in fds:
+                os.close(fd)
+
+        if self.cancelled:
+            raise Cancelled(self.paths[0])
+        for path, top in reversed(expanded):
+            try:
+                os.rmdir(path)
+                with self._lock:
+                    self.dirs_done += 1
+            except OSError as e:
+                self.error(path, e)
+            if path == top and not os.path.lexists(path):
+                self.removed.put(path)
+        if self.errors:
+            raise shutil.Error(self.errors)
+
+    def expand(self, path, top, submit, fds):
+        # Hands the files of path to the pool in batches, returns its
+        # subdirectories. The directory's fd stays open in fds until the
+        # pool is done with it.
+        subdirs = []
+        try:
+            fd = os.open(path, DIR_FLAGS) if FD_RELATIVE else None
+        except OSError as e:
+            self.error(path, e)
+            return subdirs
+        if fd is not None:
+            fds.append(fd)
+        batch = []
+        try:
+            with os.scandir(fd if fd is not None else path) as entries:
+                for entry in entries:
+                    if self.cancelled:
+                        raise Cancelled(path)
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append((os.path.join(path, entry.name), top))
+                        continue
+                    batch.append(entry)
+                    if len(batch) >= self.BATCH:
+                        submit((path, fd, batch))
+                        batch = []
+        except OSError as e:
+            self.error(path, e)
+        if batch:
+            submit((path, fd, batch))
+        return subdirs
+
+    def work(self, tasks):
+        # tasks are subtrees (path, top) and batches of files (directory,
+        # its fd or None, entries); None stops the worker
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            if self.cancelled:
+                continue
+            if len(task) == 3:
+                dir, fd, entries = task
+                for entry in entries:
+                    if self.cancelled:
+                        break
+                    self.delete_file(os.path.join(dir, entry.name), entry,
+                                     dir_fd=fd)
+                continue
+            path, top = task
+            try:
+                if FD_RELATIVE:
+                    self.delete_tree(path)
+                else:
+                    shutil.rmtree(path)
+            except Cancelled:
+                continue
+            except OSError as e:
+                self.error(path, e)
+            if path == top and not os.path.lexists(path):
+                self.removed.put(path)
+
+    def delete_file(self, path, entry=None, dir_fd=None):
+        # with dir_fd, the entry's name is unlinked relative to it and path
+        # is only used for error reports; returns True if it was unlinked
+        target = entry.name if dir_fd is not None else path
+        try:
+            if entry is not None:
+                size = entry.stat(follow_symlinks=False).st_size
+            else:
+                size = os.lstat(path).st_size
+            os.unlink(target, dir_fd=dir_fd)
+        except OSError as e:
+            self.error(path, e)
+            return False
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+        return True
+
+    def delete_tree(self, path):
+        # Iterative, so depth is not limited by the recursion limit; keeps
+        # one open fd per level of the current branch. A directory that
+        # cannot be opened or removed is recorded in self.errors and the
+        # rest of the tree is still deleted.
+        root_parent = os.open(os.path.dirname(path), DIR_FLAGS)
+        # [parent fd, name, path, fd, subdirectory names left]
+        stack = [[root_parent, os.path.basename(path), path, None, None]]
+        try:
+            while stack:
+                frame = stack[-1]
+                parent_fd, name, dir_path, fd, subdirs = frame
+                if fd is None:
+                    try:
+                        fd = frame[3] = os.open(name, DIR_FLAGS 
+                                                | getattr(os, 'O_NOFOLLOW', 0),
+                                                dir_fd=parent_fd)
+                        with os.scandir(fd) as entries:
+                            entries = list(entries)
+                    except OSError as e:
+                        self.error(dir_path, e)
+                        stack.pop()
+                        if fd is not None:
+                            os.close(fd)
+                        continue
+                    subdirs = frame[4] = []
+                    for entry in entries:
+                        if self.cancelled:
+                            raise Cancelled(path)
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        else:
+                            self.delete_file(os.path.join(dir_path, 
+                                                          entry.name),
+                                             entry, dir_fd=fd)
+                if subdirs:
+                    subdir = subdirs.pop()
+                    stack.append([fd, subdir, os.path.join(dir_path, subdir),
+                                  None, None])
+                else:
+                    stack.pop()
+                    os.close(fd)
+                    try:
+                        os.rmdir(name, dir_fd=parent_fd)
+                    except OSError as e:
+                        self.error(dir_path, e)
+                        continue
+                    with self._lock:
+                        self.dirs_done += 1
+        finally:
+            for frame in stack:
+                if frame[3] is not None:
+                    os.close(frame[3])
+            os.close(root_parent)
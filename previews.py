@@ -0,0 +1,56 @@
+import queue
+from threading import Condition, Thread
+
+
+class PreviewPool():
+    # Fixed-size worker pool for preview decoding. Every request supersedes
+    # the ones before it: queued work of older generations is dropped and
+    # results of older generations are never delivered. Results go into a
+    # queue that the Tk thread drains, workers never touch widgets.
+    def __init__(self, workers=2):
+        self.generation = 0
+        self.results = queue.SimpleQueue()
+        self._tasks = []
+        self._cond = Condition()
+        self.threads = [Thread(target=self.work, daemon=True)
+                        for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def request(self, func=None, prefetch=()):
+        # func's result is delivered with the returned generation,
+        # prefetch functions only run for their side effects (warming
+        # caches) and only if workers are idle before the next request
+        with self._cond:
+            self.generation += 1
+            self._tasks = [(self.generation, f, False) for f in prefetch]
+            if func is not None:
+                self._tasks.append((self.generation, func, True))
+            self._cond.notify_all()
+            return self.generation
+
+    def work(self):
+        while True:
+            with self._cond:
+                while not self._tasks:
+                    self._cond.wait()
+                generation, func, deliver = self._tasks.pop()
+            if generation != self.generation:
+                continue
+            try:
+                result = func()
+            except Exception as e:
+                result = e
+            if deliver and generation == self.generation:
+                self.results.put((generation, result))
+
+    def poll(self):
+        # latest delivered result of the current generation, or None
+        latest = None
+        while True:
+            try:
+                generation, result = self.results.get_nowait()
+            except queue.Empty:
+                return latest
+            if generation == self.generation:
+                latest = result
@@ -0,0 +1,151 @@
+import bisect
+import fnmatch
+import operator
+import re
+import time
+from itertools import compress, repeat
+from operator import attrgetter
+
+
+MODES = ('substring', 'prefix', 'glob', 'fuzzy')
+
+
+def is_subsequence(part, whole):
+    it = iter(whole)
+    return all(char in it for char in part)
+
+
+class QuickFilter():
+    # Narrows a sorted listing to the entries whose name matches a query.
+    # Names are case folded once per listing, into a list parallel to a
+    # snapshot of it, and matches are kept as positions in that snapshot.
+    # A query that narrows the previous one only rescans its matches, the
+    # results of recent queries are kept for backspacing, and scanning is
+    # done in time-boxed steps so that a keystroke never blocks the UI.
+    # Behaves as a sequence of the matching entries, in listing order.
+    CHUNK = 8192
+    MAX_KEPT = 32
+
+    def __init__(self, mode='substring'):
+        self.mode = mode
+        self.query = ''
+        self.files = [] # snapshot of the listing
+        self.names = [] # case folded names of files[:len(names)]
+        self.version = None
+        self.kept = {} # (mode, query) -> matches of finished scans
+        self.start()
+
+    def set_listing(self, files, version):
+        # returns True if the listing changed and the scan started over
+        if version == self.version:
+            return False
+        self.files = list(files)
+        self.names = []
+        self.version = version
+        self.kept = {}
+        self.start()
+        return True
+
+    def set_query(self, query, mode=None):
+        if mode is not None:
+            self.mode = mode
+        self.query = query
+        self.start()
+
+    def start(self):
+        self.pos = 0
+        self.candidates = None # positions to scan, None for all
+        if not self.query:
+            self.matches = None
+            self.done = True
+            return
+        kept = self.kept.get((self.mode, self.query))
+        if kept is not None:
+            self.matches = kept
+            self.done = True
+            return
+        # the most selective earlier result this query narrows down
+        for (mode, query), matches in self.kept.items():
+            if mode == self.mode and self.narrows(query):
+                if (self.candidates is None
+                        or len(matches) < len(self.candidates)):
+                    self.candidates = matches
+        self.matches = []
+        self.predicate = self.compile()
+        self.done = False
+
+    def narrows(self, query):
+        # True if every name matching self.query also matches query
+        if self.mode == 'substring':
+            return query in self.query
+        if self.mode == 'prefix':
+            return self.query.startswith(query)
+        if self.mode == 'fuzzy':
+            return is_subsequence(query, self.query)
+        return False
+
+    def compile(self):
+        # function mapping an iterable of folded names to match flags, all
+        # of it runs in C
+        query = self.query.casefold()
+        if self.mode == 'prefix':
+            return lambda names: map(str.startswith, names, repeat(query))
+        if self.mode == 'glob':
+            match = re.compile(fnmatch.translate(query), re.S).match
+            return lambda names: map(match, names)
+        if self.mode == 'fuzzy':
+            search = re.compile('.*?'.join(map(re.escape, query)),
+                                re.S).search
+            return lambda names: map(search, names)
+        return lambda names: map(operator.contains, names, repeat(query))
+
+    def fold(self, end):
+        if end > len(self.names):
+            self.names.extend(map(str.casefold,
+                                  map(attrgetter('name'),
+                                      self.files[len(self.names):end])))
+
+    def step(self, budget=0.008):
+        # scans for at most budget seconds, returns True when done
+        deadline = time.perf_counter() + budget
+        while not self.done and time.perf_counter() < deadline:
+            if self.candidates is None:
+                end = min(self.pos + self.CHUNK, len(self.files))
+                self.fold(end)
+                positions = range(self.pos, end)
+                names = self.names[self.pos:end]
+                total = len(self.files)
+            else:
+                end = min(self.pos + self.CHUNK, len(self.candidates))
+                positions = self.candidates[self.pos:end]
+                names = map(self.names.__getitem__, positions)
+                total = len(self.candidates)
+            self.matches.extend(compress(positions, self.predicate(names)))
+            self.pos = end
+            if self.pos >= total:
+                self.done = True
+                self.kept[(self.mode, self.query)] = self.matches
+                while len(self.kept) > self.MAX_KEPT:
+                    del self.kept[next(iter(self.kept))]
+        return self.done
+
+    def row_of(self, position):
+        # row of the entry at position in the listing, None if filtered out
+        if self.matches is None:
+            return position
+        row = bisect.bisect_left(self.matches, position)
+        if row < len(self.matches) and self.matches[row] == position:
+            return row
+        return None
+
+    def __len__(self):
+        if self.matches is None:
+            return len(self.files)
+        return len(self.matches)
+
+    def __getitem__(self, row):
+        if self.matches is None:
+            return self.files[row]
+        if isinstance(row, slice):
+            return list(map(self.files.__getitem__, self.matches[row]))
+        return self.files[self.matches[row]]
@@ -0,0 +1,245 @@
+import fnmatch
+import os
+import queue
+import re
+import shlex
+import time
+from collections import deque
+from threading import Condition, Thread
+
+from manager import File
+
+
+UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+AGES = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+GLOB_CHARS = set('*?[')
+TOKEN = re.compile(r'(size|mtime)([<>])(\d+(?:\.\d+)?)([a-z]*)$', re.I)
+
+
+class Query():
+    # What to look for. name is a case insensitive glob, or a regex if
+    # regex is set; sizes are in bytes and only match files; newer/older
+    # are timestamps; content is searched for in files, literally.
+    def __init__(self, name=None, regex=False, min_size=None, max_size=None,
+                 newer=None, older=None, type=None, content=None):
+        self.pattern = name
+        self.regex = regex
+        self.name = None
+        if name is not None:
+            if regex:
+                self.name = re.compile(name, re.I).search
+            else:
+                self.name = re.compile(fnmatch.translate(name), re.I).match
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer = newer
+        self.older = older
+        self.type = type
+        if isinstance(content, str):
+            content = content.encode()
+        self.content = content
+        self.sized = min_size is not None or max_size is not None
+        self.timed = newer is not None or older is not None
+
+    def matches(self, entry, is_dir):
+        # cheapest checks first, the content is read last
+        if self.type is not None and (self.type == 'directory') != is_dir:
+            return False
+        if self.name is not None and not self.name(entry.name):
+            return False
+        if (self.sized or self.content) and is_dir:
+            return False
+        if self.sized or self.timed:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                return False
+            if self.min_size is not None and stat.st_size < self.min_size:
+                return False
+            if self.max_size is not None and stat.st_size > self.max_size:
+                return False
+            if self.newer is not None and stat.st_mtime < self.newer:
+                return False
+            if self.older is not None and stat.st_mtime > self.older:
+                return False
+        if self.content:
+            return grep(entry.path, self.content)
+        return True
+
+
+def grep(path, needle, block=1024 * 1024):
+    # stops reading at the first occurrence; blocks overlap by
+    # len(needle) - 1 bytes so matches across block boundaries are found
+    tail = b''
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(block)
+                if not data:
+                    return False
+                if needle in tail + data[:len(needle) - 1] or needle in data:
+                    return True
+                tail = data[-(len(needle) - 1):] if len(needle) > 1 else b''
+    except OSError:
+        return False
+
+
+def parse_query(text, now=None):
+    # 'report*.pdf size>1M mtime<7d type:file grep:invoice re:^\d+$'
+    # A word without glob characters matches names containing it.
+    # Raises ValueError for words it does not understand.
+    now = time.time() if now is None else now
+    args = {}
+    # quotes group words, backslashes are kept for regexes
+    words = shlex.shlex(text, posix=True)
+    words.whitespace_split = True
+    words.escape = ''
+    for word in words:
+        token = TOKEN.match(word)
+        if token:
+            field, op, number, unit = token.groups()
+            field = field.lower()
+            unit = unit.lower()
+            if field == 'size':
+                if unit.rstrip('ib') not in UNITS:
+                    raise ValueError(f'Unknown size unit in {word!r}')
+                value = float(number) * UNITS[unit.rstrip('ib')]
+                args['min_size' if op == '>' else 'max_size'] = value
+            else:
+                if unit not in AGES:
+                    raise ValueError(f'Unknown age unit in {word!r}')
+                # mtime<7d: modified less than 7 days ago
+                value = now - float(number) * AGES[unit]
+                args['newer' if op == '<' else 'older'] = value
+        elif word.startswith('type:'):
+            kind = word[5:]
+            if kind in ('f', 'file'):
+                args['type'] = 'file'
+            elif kind in ('d', 'dir', 'directory'):
+                args['type'] = 'directory'
+            else:
+                raise ValueError(f'Unknown type in {word!r}')
+        elif word.startswith(('grep:', 'content:')):
+            args['content'] = word.split(':', 1)[1]
+        elif word.startswith('re:'):
+            args['name'] = word[3:]
+            args['regex'] = True
+        elif 'name' in args:
+            raise ValueError(f'More than one name pattern: {word!r}')
+        elif GLOB_CHARS & set(word):
+            args['name'] = word
+        else:
+            args['name'] = f'*{word}*'
+    if not args:
+        raise ValueError('Empty search')
+    try:
+        return Query(**args)
+    except re.error as e:
+        raise ValueError(f'Bad regex: {e}')
+
+
+class Search():
+    # Walks the tree under root with a pool of scandir workers and streams
+    # matching entries (File objects) through a queue. Directories are
+    # walked depth first, so the queue of pending directories stays small
+    # on huge trees, and the search stops by itself after max_results
+    # matches. Symlinks to directories are not followed. Workers never
+    # touch the UI, the caller collects matches with drain().
+    def __init__(self, root, query, workers=8, max_results=100_000):
+        self.root = root
+        self.query = query
+        self.max_results = max_results
+        self.results = [] # filled by drain()
+        self.found = 0
+        self.dirs = 0
+        self.done = False
+        self.cancelled = False
+        self.truncated = False
+        self._found = queue.SimpleQueue()
+        self._queue = deque([root])
+        self._pending = 1
+        self._cond = Condition()
+        self.threads = [Thread(target=self.work, daemon=True)
+                        for _ in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def cancel(self):
+        with self._cond:
+            self.cancelled = True
+            self._queue.clear()
+            self._cond.notify_all()
+
+    @property
+    def running(self):
+        return not self.done and not self.cancelled
+
+    @property
+    def finished(self):
+        # no worker left, everything found is in the queue
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def work(self):
+        while True:
+            with self._cond:
+                while not self._queue and self.running:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                dir = self._queue.popleft()
+
+            subdirs, matches = self.scan(dir)
+
+            with self._cond:
+                self.dirs += 1
+                self._pending += len(subdirs) - 1
+                if not self.cancelled:
+                    self._queue.extendleft(subdirs)
+                if matches:
+                    matches = matches[:self.max_results - self.found]
+                    self.found += len(matches)
+                    self._found.put(matches)
+                    if self.found >= self.max_results:
+                        self.truncated = True
+                        self.cancelled = True
+                        self._queue.clear()
+                if self._pending == 0:
+                    self.done = True
+                if not self.running:
+                    self._cond.notify_all()
+                elif subdirs:
+                    self._cond.notify_all()
+
+    def scan(self, dir):
+        subdirs = []
+        matches = []
+        try:
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    if self.cancelled:
+                        break
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir:
+                        subdirs.append(entry.path)
+                    if self.query.matches(entry, is_dir):
+                        matches.append(File.from_entry(entry))
+        except OSError:
+            pass
+        return subdirs, matches
+
+    def drain(self):
+        # moves matches found since the last call to self.results, returns
+        # how many there were
+        count = 0
+        while True:
+            try:
+                batch = self._found.get_nowait()
+            except queue.Empty:
+                return count
+            self.results.extend(batch)
+            count += len(batch)
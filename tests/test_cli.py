@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import cli
+from fileindex import FileIndex
+
+
+def run(*argv):
+    # exit status of python -m cli argv
+    with pytest.raises(SystemExit) as info:
+        cli.main(list(map(str, argv)))
+    return info.value.code
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'tree'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'report.pdf').write_bytes(b'x' * 2048)
+    (root / 'notes.txt').write_bytes(b'invoice')
+    (root / 'sub' / 'report-2.pdf').write_bytes(b'x' * 10)
+    return root
+
+
+def records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+class TestLs:
+    def test_sorted_listing(self, tree, capsys):
+        assert run('ls', tree, '--sort', 'size', '-r', '--json') == 0
+        assert [record['name'] for record in records(capsys)] == [
+            'report.pdf', 'notes.txt', 'sub']
+
+    def test_unknown_sort_field(self, tree, capsys):
+        assert run('ls', tree, '--sort', 'colour') == 2
+        assert 'colour' in capsys.readouterr().err
+
+    def test_missing_directory(self, tmp_path):
+        assert run('ls', tmp_path / 'missing') == 1
+
+
+class TestDu:
+    def test_totals(self, tree, capsys):
+        assert run('du', tree, tree / 'notes.txt', '--json') == 0
+        assert [(record['bytes'], record['files'])
+                for record in records(capsys)] == [(2065, 3), (7, 1)]
+
+    def test_unreadable_directory(self, tree, capsys, monkeypatch):
+        scandir = os.scandir
+
+        def refuse_sub(path):
+            if path == str(tree / 'sub'):
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        monkeypatch.setattr(os, 'scandir', refuse_sub)
+        assert run('du', tree) == 1
+        assert str(tree / 'sub') in capsys.readouterr().err
+
+
+class TestTransfers:
+    def test_copy(self, tree, tmp_path):
+        (tmp_path / 'dst').mkdir()
+        assert run('cp', tree / 'notes.txt', tree / 'sub',
+                   tmp_path / 'dst') == 0
+        assert sorted(os.listdir(tmp_path / 'dst')) == ['notes.txt', 'sub']
+
+    def test_move(self, tree, tmp_path):
+        (tmp_path / 'dst').mkdir()
+        assert run('mv', tree / 'sub', tmp_path / 'dst') == 0
+        assert os.listdir(tmp_path / 'dst') == ['sub']
+        assert not os.path.exists(tree / 'sub')
+
+    def test_missing_source(self, tree, tmp_path, capsys):
+        assert run('mv', tree / 'missing', tmp_path) == 1
+        assert 'missing' in capsys.readouterr().err
+
+    def test_destination_is_not_a_directory(self, tree):
+        assert run('cp', tree / 'sub', tree / 'notes.txt') == 1
+
+    def test_error_policy(self, tree):
+        assert run('cp', tree / 'notes.txt', tree, '--policy', 'error') == 1
+
+    def test_remove(self, tree):
+        assert run('rm', tree / 'sub', tree / 'notes.txt') == 0
+        assert os.listdir(tree) == ['report.pdf']
+
+    def test_remove_missing(self, tree):
+        assert run('rm', tree / 'missing') == 1
+
+
+class TestFind:
+    def test_query(self, tree, capsys):
+        assert run('find', tree, 'report*', 'Size>1k') == 0
+        assert capsys.readouterr().out.split() == [str(tree / 'report.pdf')]
+
+    def test_bad_query(self, tree, capsys):
+        assert run('find', tree, 'size>1q') == 2
+        assert 'size>1q' in capsys.readouterr().err
+
+    def test_index(self, tree, tmp_path, capsys, monkeypatch):
+        path = str(tmp_path / 'index.db')
+        FileIndex(path).refresh(str(tree))
+        monkeypatch.setattr(cli, 'DEFAULT_PATH', path)
+        assert run('find', tree, 'report*', '--index') == 0
+        assert sorted(capsys.readouterr().out.split()) == [
+            str(tree / 'report.pdf'), str(tree / 'sub' / 'report-2.pdf')]
+
+    def test_index_error(self, tree, tmp_path, capsys, monkeypatch):
+        path = str(tmp_path / 'index.db')
+        FileIndex(path).refresh(str(tree))
+        monkeypatch.setattr(cli, 'DEFAULT_PATH', path)
+
+        def broken(*args):
+            raise sqlite3.DatabaseError('database disk image is malformed')
+
+        monkeypatch.setattr(FileIndex, 'query', broken)
+        assert run('find', tree, 'report*', '--index') == 1
+        assert 'malformed' in capsys.readouterr().err
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from diskusage import DiskUsage
+
+
+def wait(usage, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while usage.busy() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not usage.busy()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    # 3 files of 100 bytes at every level of a 3 levels deep tree
+    dir = tmp_path / 'tree'
+    for level in range(3):
+        dir.mkdir()
+        for i in range(3):
+            (dir / f'file-{i}').write_bytes(b'x' * 100)
+        dir = dir / 'sub'
+    return tmp_path / 'tree'
+
+
+def test_totals(tree):
+    usage = DiskUsage()
+    usage.request([str(tree), str(tree / 'sub')])
+    wait(usage)
+    total = usage.get(str(tree))
+    assert (total.bytes, total.files, total.done) == (900, 9, True)
+    assert total.errors == ()
+    assert usage.get(str(tree / 'sub')).bytes == 600
+    assert set(usage.drain()) == {str(tree), str(tree / 'sub')}
+    assert usage.drain() == {}
+
+
+def test_fresh_totals_are_not_walked_again(tree):
+    usage = DiskUsage()
+    usage.request([str(tree)])
+    wait(usage)
+    assert usage.known(str(tree))
+    usage.request([str(tree)])
+    assert not usage.busy()
+
+
+def test_changed_directory_is_rescanned(tree, monkeypatch):
+    monkeypatch.setattr(DiskUsage, 'FRESH_SECONDS', 0)
+    usage = DiskUsage()
+    usage.request([str(tree)])
+    wait(usage)
+    (tree / 'sub' / 'more').write_bytes(b'x' * 50)
+    stat = os.stat(tree / 'sub')
+    os.utime(tree / 'sub', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    usage.request([str(tree)])
+    wait(usage)
+    assert usage.get(str(tree)).bytes == 950
+
+
+def test_unreadable_directories_are_reported(tree, monkeypatch):
+    scandir = os.scandir
+
+    def refuse_sub(path):
+        if path == str(tree / 'sub'):
+            raise PermissionError(13, 'Permission denied', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', refuse_sub)
+    usage = DiskUsage()
+    usage.request([str(tree)])
+    wait(usage)
+    total = usage.get(str(tree))
+    assert total.bytes == 300
+    assert [dir for dir, _ in total.errors] == [str(tree / 'sub')]
+
+
+def test_finished_totals_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(DiskUsage, 'MAX_TOTALS', 2)
+    usage = DiskUsage()
+    for i in range(4):
+        (tmp_path / str(i)).mkdir()
+        usage.request([str(tmp_path / str(i))])
+        wait(usage)
+    assert list(usage.complete) == [str(tmp_path / '2'), str(tmp_path / '3')]
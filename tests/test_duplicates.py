@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from duplicates import EDGE, DuplicateFinder, hash_edges, hash_full
+from operations import Cancelled
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def big(middle):
+    # same size and same ends, different contents in between
+    return b'a' * EDGE + middle * 1024 + b'z' * EDGE
+
+
+@pytest.fixture
+def tree(tmp_path):
+    write(tmp_path / 'keep.txt', b'same small')
+    write(tmp_path / 'sub' / 'copy.txt', b'same small')
+    write(tmp_path / 'sub' / 'deeper' / 'copy.txt', b'same small')
+    write(tmp_path / 'other.txt', b'diff small') # same size only
+    write(tmp_path / 'big-1', big(b'1'))
+    write(tmp_path / 'sub' / 'big-1', big(b'1'))
+    write(tmp_path / 'big-2', big(b'2')) # same ends as big-1
+    write(tmp_path / 'unique', b'no other file is this long')
+    write(tmp_path / 'empty-1', b'')
+    write(tmp_path / 'empty-2', b'')
+    return tmp_path
+
+
+def find(root, **kwargs):
+    finder = DuplicateFinder(str(root), workers=2, **kwargs)
+    finder.run()
+    return finder
+
+
+def relative(groups, root):
+    return [[os.path.relpath(path, root) for path in group.paths]
+            for group in groups]
+
+
+def test_groups(tree):
+    finder = find(tree)
+    assert finder.done and finder.stage is None
+    assert relative(finder.groups, tree) == [
+        ['big-1', os.path.join('sub', 'big-1')],
+        ['keep.txt', os.path.join('sub', 'copy.txt'),
+         os.path.join('sub', 'deeper', 'copy.txt')],
+    ]
+    big_size = len(big(b'1'))
+    assert [group.reclaimable for group in finder.groups] == \
+        [big_size, 2 * len(b'same small')]
+    assert finder.reclaimable == big_size + 20
+
+
+def test_results_and_extras(tree):
+    finder = find(tree)
+    labels = [finder.labels[file] for file in finder.results]
+    assert labels == ['#1 keep', '#1 extra', '#2 keep', '#2 extra',
+                      '#2 extra']
+    assert [file.fulldir for file in finder.results] == \
+        [path for group in finder.groups for path in group.paths]
+    assert sorted(os.path.relpath(path, tree) for path in finder.extras()) \
+        == sorted([os.path.join('sub', 'big-1'),
+                   os.path.join('sub', 'copy.txt'),
+                   os.path.join('sub', 'deeper', 'copy.txt')])
+
+
+def test_hard_links_are_one_file(tmp_path):
+    path = write(tmp_path / 'a', b'contents')
+    os.link(path, tmp_path / 'b')
+    assert find(tmp_path).groups == []
+    write(tmp_path / 'c', b'contents')
+    assert len(find(tmp_path).groups[0].paths) == 2
+
+
+def test_min_size(tree):
+    finder = find(tree, min_size=EDGE)
+    assert relative(finder.groups, tree) == [
+        ['big-1', os.path.join('sub', 'big-1')]]
+    assert len(find(tree, min_size=0).groups) == 3 # the empty files too
+
+
+def test_cancel(tree):
+    finder = DuplicateFinder(str(tree), workers=1)
+    finder.cancel()
+    with pytest.raises(Cancelled):
+        finder.run()
+    assert not finder.done
+    finder.resume()
+    assert finder.done and len(finder.groups) == 2
+
+
+def test_hashes(tmp_path):
+    path = write(tmp_path / 'big-1', big(b'1'))
+    other = write(tmp_path / 'big-2', big(b'2'))
+    size = os.path.getsize(path)
+    assert hash_edges(path, size) == hash_edges(other, size)
+    assert hash_full(path, size) != hash_full(other, size)
+    assert hash_edges(str(tmp_path / 'missing'), 1) is None
+    assert hash_full(str(tmp_path / 'missing'), 1) is None
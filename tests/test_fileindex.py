@@ -0,0 +1,115 @@
+import os
+import shutil
+
+import pytest
+
+from fileindex import FileIndex, IndexSearch, literal
+from search import parse_query
+
+
+def touch(path, size=0):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def bump(dir):
+    # a new mtime, even where the clock is coarser than the test
+    stat = os.stat(dir)
+    os.utime(dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / 'root'
+    (root / 'docs' / 'old').mkdir(parents=True)
+    (root / 'src').mkdir()
+    touch(root / 'readme.txt', 10)
+    touch(root / 'docs' / 'report.pdf', 2048)
+    touch(root / 'docs' / 'old' / 'report-2019.pdf', 4096)
+    touch(root / 'src' / 'main.py', 100)
+    return root
+
+
+@pytest.fixture
+def index(tmp_path):
+    return FileIndex(str(tmp_path / 'cache' / 'index.sqlite3'))
+
+
+def paths(rows, root):
+    return sorted(os.path.relpath(row[0], root) for row in rows)
+
+
+class TestRefresh:
+    def test_first_refresh_lists_everything(self, index, root):
+        timing = index.refresh(str(root))
+        assert (timing.dirs, timing.rescanned, timing.entries) == (4, 4, 7)
+        assert index.roots()[str(root)].entries == 7
+        assert index.root_of(str(root / 'docs' / 'old')) == str(root)
+        assert index.root_of(str(root) + '-other') is None
+
+    def test_unchanged_tree_is_not_relisted(self, index, root):
+        index.refresh(str(root))
+        timing = index.refresh(str(root))
+        assert (timing.dirs, timing.rescanned, timing.entries) == (4, 0, 7)
+
+    def test_only_changed_dirs_are_relisted(self, index, root):
+        index.refresh(str(root))
+        touch(root / 'docs' / 'old' / 'notes.txt')
+        bump(root / 'docs' / 'old')
+        timing = index.refresh(str(root))
+        assert (timing.dirs, timing.rescanned, timing.entries) == (4, 1, 8)
+        rows = index.query(parse_query('notes*'), str(root))
+        assert paths(rows, root) == [os.path.join('docs', 'old', 'notes.txt')]
+
+    def test_removed_subtree_is_forgotten(self, index, root):
+        index.refresh(str(root))
+        shutil.rmtree(root / 'docs')
+        bump(root)
+        timing = index.refresh(str(root))
+        assert (timing.dirs, timing.entries) == (2, 3)
+        assert index.query(parse_query('report'), str(root)) == []
+
+    def test_remove_root(self, index, root):
+        index.refresh(str(root))
+        index.remove_root(str(root))
+        assert index.roots() == {}
+        assert index.query(parse_query('*'), str(root)) == []
+
+
+class TestQuery:
+    @pytest.mark.parametrize('text, expected', [
+        ('report', ['docs/old/report-2019.pdf', 'docs/report.pdf']),
+        ('*.pdf size>3k', ['docs/old/report-2019.pdf']),
+        ('type:d', ['docs', 'docs/old', 'src']),
+        ('re:^main\\.', ['src/main.py']),
+        ('ma', ['src/main.py']), # shorter than a trigram, scanned
+    ])
+    def test_matches(self, index, root, text, expected):
+        index.refresh(str(root))
+        rows = index.query(parse_query(text), str(root))
+        assert paths(rows, root) == [os.path.normpath(path)
+                                     for path in expected]
+
+    def test_below_root_only(self, index, root):
+        index.refresh(str(root))
+        rows = index.query(parse_query('report'), str(root / 'docs' / 'old'))
+        assert paths(rows, root) == [os.path.join('docs', 'old',
+                                                  'report-2019.pdf')]
+
+    def test_literal(self):
+        assert literal(parse_query('*report*.pdf')) == 'report'
+        assert literal(parse_query('[ab]c*')) is None
+        assert literal(parse_query('re:report')) is None
+
+
+def test_index_search(index, root):
+    index.refresh(str(root))
+    search = IndexSearch(index, str(root), parse_query('*.pdf'),
+                         max_results=1)
+    search.start()
+    search.threads[0].join()
+    search.drain()
+    assert search.finished and search.error is None
+    assert search.truncated
+    assert len(search.results) == 1
+    assert search.results[0].name.endswith('.pdf')
@@ -0,0 +1,207 @@
+import os
+
+import pytest
+
+from manager import File, ListingCache, Manager
+
+
+NAMES = ['b.txt', 'a.py', 'part-10', 'part-2', 'C.md', 'zeta']
+DIRS = ['docs', 'Build']
+
+
+def touch(path, size=0):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for size, name in enumerate(NAMES):
+        touch(tmp_path / name, size * 10)
+    for name in DIRS:
+        (tmp_path / name).mkdir()
+    return tmp_path
+
+
+def names(files):
+    return [file.name for file in files]
+
+
+def assert_sorted(manager):
+    # same entries, in the same order, as a fresh listing sorted alike
+    # (ties are broken by name, so there is only one right order)
+    manager.cache.invalidate()
+    fresh = Manager(manager.current_dir)
+    fresh.set_sorting(manager.sorting_by, manager.sorting_ascending,
+                      manager.dirs_first)
+    assert names(manager.files) == names(fresh.files)
+
+
+SORTINGS = [('name', True, False), ('name', False, False),
+            ('natural', True, True), ('size', False, False),
+            ('ext', True, True), (('type', 'name'), False, False)]
+
+
+@pytest.mark.parametrize('sorting', SORTINGS)
+class TestSortedMutations:
+    def test_position(self, tree, sorting):
+        manager = Manager(str(tree))
+        manager.set_sorting(*sorting)
+        for i, file in enumerate(manager.files):
+            assert manager.position(file.name) == i
+        assert manager.position('missing') is None
+
+    def test_equal_keys_break_ties_by_name(self, tree, sorting):
+        for i in range(50):
+            touch(tree / f'same-{i}')
+        manager = Manager(str(tree))
+        manager.set_sorting(*sorting)
+        for i, file in enumerate(manager.files):
+            assert manager.position(file.name) == i
+        touch(tree / 'same-25b')
+        position = manager.insert(File(str(tree / 'same-25b')))
+        assert manager.files[position].name == 'same-25b'
+        assert_sorted(manager)
+
+    def test_insert(self, tree, sorting):
+        manager = Manager(str(tree))
+        manager.set_sorting(*sorting)
+        for name, size in (('part-3', 25), ('0.txt', 1), ('new', 100)):
+            touch(tree / name, size)
+            position = manager.insert(File(str(tree / name)))
+            assert manager.files[position].name == name
+            assert manager.index[name] is manager.files[position]
+        (tree / 'aaa').mkdir()
+        manager.insert(File(str(tree / 'aaa')))
+        assert_sorted(manager)
+
+    def test_remove(self, tree, sorting):
+        manager = Manager(str(tree))
+        manager.set_sorting(*sorting)
+        version = manager.version
+        for name in ('part-2', 'docs', 'zeta'):
+            manager.remove(manager.index[name])
+            assert name not in manager.index
+        assert manager.version > version
+        for name in ('part-2', 'zeta'):
+            os.unlink(tree / name)
+        (tree / 'docs').rmdir()
+        assert_sorted(manager)
+
+    def test_update_entries_batched(self, tree, sorting, monkeypatch):
+        # more changes than MUTATION_LIMIT are merged by re-sorting
+        monkeypatch.setattr(Manager, 'MUTATION_LIMIT', 1)
+        manager = Manager(str(tree))
+        manager.set_sorting(*sorting)
+        touch(tree / 'added', 5)
+        os.unlink(tree / 'a.py')
+        manager.update_entries([manager.index['a.py']],
+                               [File(str(tree / 'added'))])
+        assert_sorted(manager)
+        for i, file in enumerate(manager.files):
+            assert manager.position(file.name) == i
+
+
+
+def test_natural_order(tree):
+    manager = Manager(str(tree))
+    manager.set_sorting('natural')
+    assert names(manager.files).index('part-2') < \
+        names(manager.files).index('part-10')
+
+
+def test_dirs_first(tree):
+    manager = Manager(str(tree))
+    manager.set_sorting('name', dirs_first=True)
+    assert names(manager.files[:2]) == ['Build', 'docs']
+
+
+
+class TestListingCache:
+    def test_hit(self, tree):
+        cache = ListingCache()
+        first = cache.get(str(tree))
+        second = cache.get(str(tree))
+        assert second == first and second is not first
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['entries'] == len(NAMES) + len(DIRS)
+
+    def test_edits_do_not_reach_the_cache(self, tree):
+        cache = ListingCache()
+        files = cache.get(str(tree))
+        files.pop()
+        assert len(cache.get(str(tree))) == len(NAMES) + len(DIRS)
+        assert cache.stats()['entries'] == len(NAMES) + len(DIRS)
+
+    def test_directory_change_invalidates(self, tree):
+        cache = ListingCache()
+        first = cache.get(str(tree))
+        touch(tree / 'new')
+        stat = os.stat(tree)
+        os.utime(tree, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        second = cache.get(str(tree))
+        assert second is not first
+        assert 'new' in names(second)
+        assert cache.stats()['entries'] == len(second)
+
+    def test_invalidate(self, tree):
+        cache = ListingCache()
+        first = cache.get(str(tree))
+        cache.invalidate(str(tree))
+        assert cache.stats() == {'hits': 0, 'misses': 1, 'dirs': 0,
+                                 'entries': 0}
+        assert cache.get(str(tree)) is not first
+        cache.invalidate()
+        assert cache.stats()['dirs'] == 0
+
+    def test_evicts_least_recently_used_dirs(self, tmp_path):
+        dirs = []
+        for i in range(3):
+            dir = tmp_path / str(i)
+            dir.mkdir()
+            touch(dir / 'file')
+            dirs.append(str(dir))
+        cache = ListingCache(max_dirs=2)
+        cache.get(dirs[0])
+        cache.get(dirs[1])
+        cache.get(dirs[0]) # most recently used now
+        cache.get(dirs[2])
+        assert cache.stats()['dirs'] == 2
+        hits = cache.stats()['hits']
+        cache.get(dirs[0])
+        assert cache.stats()['hits'] == hits + 1
+        misses = cache.stats()['misses']
+        cache.get(dirs[1])
+        assert cache.stats()['misses'] == misses + 1
+
+    def test_evicts_by_entries(self, tree, tmp_path):
+        other = tmp_path / 'docs'
+        touch(other / 'file')
+        cache = ListingCache(max_entries=len(NAMES) + len(DIRS))
+        cache.get(str(other))
+        cache.get(str(tree))
+        assert cache.stats() == {'hits': 0, 'misses': 2, 'dirs': 1,
+                                 'entries': len(NAMES) + len(DIRS)}
+
+    def test_huge_listings_are_not_cached(self, tree):
+        cache = ListingCache(max_entries=2)
+        cache.get(str(tree))
+        assert cache.stats()['dirs'] == 0
+
+    def test_manager_edits_do_not_reach_the_cache(self, tree):
+        manager = Manager(str(tree))
+        touch(tree / 'new')
+        manager.insert(File(str(tree / 'new')))
+        manager.remove(manager.index['a.py'])
+        manager.remove(manager.index['zeta'])
+        assert manager.cache.stats()['entries'] == len(NAMES) + len(DIRS)
+
+    def test_revisit_keeps_the_sort(self, tree):
+        manager = Manager(str(tree))
+        manager.set_sorting('size', False, False)
+        manager.update_files(str(tree))
+        assert manager.cache.stats()['hits'] == 1
+        expected = names(manager.files)
+        manager.update_files(str(tree))
+        assert manager.columns == {} # no keys computed, so no sort
+        assert names(manager.files) == expected
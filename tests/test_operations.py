@@ -0,0 +1,405 @@
+import errno
+import os
+import shutil
+
+import pytest
+
+import operations
+from operations import (BatchJob, Cancelled, CopyJob, DeleteJob, MoveJob,
+                        copy_data, part_path)
+
+
+def write(path, data=b'data'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def make_tree(root, subtrees=3, files=4):
+    for i in range(subtrees):
+        for j in range(files):
+            write(os.path.join(root, f'sub-{i}', 'deep', f'file-{j}'),
+                  b'x' * (i + j))
+
+
+def listing(root):
+    # {relative path: content} of every file under root
+    files = {}
+    for dir, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dir, name)
+            files[os.path.relpath(path, root)] = read(path)
+    return files
+
+
+@pytest.fixture
+def src(tmp_path):
+    root = tmp_path / 'src'
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def dst(tmp_path):
+    root = tmp_path / 'dst'
+    root.mkdir()
+    return root
+
+
+class TestCopyData:
+    def copy(self, src, dst, size):
+        infd = os.open(src, os.O_RDONLY)
+        outfd = os.open(dst, os.O_WRONLY | os.O_CREAT)
+        try:
+            copy_data(infd, outfd, 0, size, lambda n: None)
+        finally:
+            os.close(infd)
+            os.close(outfd)
+
+    def test_short_kernel_copies_fall_back(self, src, monkeypatch):
+        # copy_file_range and sendfile give up at once, as on some FUSE
+        # filesystems
+        monkeypatch.setattr(os, 'copy_file_range', lambda *args: 0,
+                            raising=False)
+        monkeypatch.setattr(os, 'sendfile', lambda *args: 0, raising=False)
+        data = os.urandom(10_000)
+        write(src / 'a', data)
+        self.copy(src / 'a', src / 'b', len(data))
+        assert read(src / 'b') == data
+
+    def test_shrunk_source_raises(self, src):
+        write(src / 'a', b'x' * 100)
+        with pytest.raises(OSError):
+            self.copy(src / 'a', src / 'b', 200)
+
+
+class TestCopyJob:
+    def test_copies_a_tree(self, src, dst):
+        make_tree(src / 'tree')
+        job = CopyJob(src / 'tree', dst)
+        job.run()
+        assert listing(dst / 'tree') == listing(src / 'tree')
+        assert job.files_done == job.files_total == 12
+        assert job.bytes_done == job.bytes_total
+        assert job.paths == [str(src / 'tree'), str(dst / 'tree')]
+        assert not [name for name in listing(dst) if name.endswith('.part')]
+
+    def test_rename_policy(self, src, dst):
+        write(src / 'a.txt', b'new')
+        write(dst / 'a.txt', b'old')
+        job = CopyJob(src / 'a.txt', dst, policy='rename')
+        job.run()
+        assert job.names == ['a.txt (1)']
+        assert read(dst / 'a.txt') == b'old'
+        assert read(dst / 'a.txt (1)') == b'new'
+
+    def test_skip_policy(self, src, dst):
+        write(src / 'a.txt', b'new')
+        write(dst / 'a.txt', b'old')
+        job = CopyJob(src / 'a.txt', dst, policy='skip')
+        job.run()
+        assert job.names == []
+        assert os.listdir(dst) == ['a.txt']
+        assert read(dst / 'a.txt') == b'old'
+
+    def test_error_policy(self, src, dst):
+        write(src / 'a.txt', b'new')
+        write(dst / 'a.txt', b'old')
+        with pytest.raises(FileExistsError):
+            CopyJob(src / 'a.txt', dst, policy='error').run()
+        assert read(dst / 'a.txt') == b'old'
+
+    def test_overwrite_policy_merges_directories(self, src, dst):
+        write(src / 'dir' / 'a', b'newer')
+        write(dst / 'dir' / 'a', b'old')
+        write(dst / 'dir' / 'b', b'kept')
+        CopyJob(src / 'dir', dst, policy='overwrite').run()
+        assert listing(dst / 'dir') == {'a': b'newer', 'b': b'kept'}
+
+    def test_overwrite_refuses_file_onto_directory(self, src, dst):
+        write(src / 'x', b'new')
+        (dst / 'x').mkdir()
+        with pytest.raises(OSError) as info:
+            CopyJob(src / 'x', dst, policy='overwrite').run()
+        assert info.value.errno == errno.EISDIR
+        assert os.listdir(dst) == ['x']
+
+    def test_overwrite_mismatch_inside_tree_leaves_no_part(self, src, dst):
+        write(src / 'dir' / 'x', b'new')
+        (dst / 'dir' / 'x').mkdir(parents=True)
+        with pytest.raises(OSError):
+            CopyJob(src / 'dir', dst, policy='overwrite').run()
+        assert os.listdir(dst / 'dir') == ['x']
+
+    def test_unknown_policy(self, src, dst):
+        with pytest.raises(ValueError):
+            CopyJob(src, dst, policy='merge')
+
+    def test_copy_into_itself(self, src):
+        make_tree(src / 'tree')
+        with pytest.raises(OSError) as info:
+            CopyJob(src / 'tree', src / 'tree' / 'sub-0').run()
+        assert info.value.errno == errno.EINVAL
+
+    def test_resume_continues_partial_files(self, src, dst, monkeypatch):
+        monkeypatch.setattr(operations, 'BLOCK', 16 * 1024)
+        data = os.urandom(64 * 1024)
+        write(src / 'big', data)
+        job = CopyJob(src / 'big', dst)
+        progress = job.progress
+
+        def cancel_after_a_block(n):
+            job.cancelled = job.bytes_done + n >= 16 * 1024
+            progress(n)
+
+        job.progress = cancel_after_a_block
+        with pytest.raises(Cancelled):
+            job.run()
+        part = part_path(str(dst / 'big'))
+        assert os.path.getsize(part) == 16 * 1024
+
+        offsets = []
+        monkeypatch.setattr(operations, 'copy_data', lambda *args:
+                            offsets.append(args[2]) or copy_data(*args))
+        job.progress = progress
+        job.resume()
+        assert offsets == [16 * 1024]
+        assert read(dst / 'big') == data
+        assert not os.path.exists(part)
+        assert job.bytes_done == len(data)
+
+    def test_stale_part_is_not_resumed(self, src, dst):
+        # a .part file this job did not write is rewritten from the start
+        write(src / 'a', b'new data')
+        write(part_path(str(dst / 'a')), b'old')
+        CopyJob(src / 'a', dst).run()
+        assert read(dst / 'a') == b'new data'
+
+    def test_overwrite_does_not_trust_size_and_mtime(self, src, dst):
+        write(src / 'a', b'AAAA')
+        write(dst / 'a', b'BBBB')
+        stat = os.stat(src / 'a')
+        os.utime(dst / 'a', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        CopyJob(src / 'a', dst, policy='overwrite').run()
+        assert read(dst / 'a') == b'AAAA'
+
+    def test_resume_skips_finished_files(self, src, dst):
+        make_tree(src / 'tree', subtrees=1, files=2)
+        job = CopyJob(src / 'tree', dst)
+        job.run()
+        finished = dst / 'tree' / 'sub-0' / 'deep' / 'file-0'
+        inode = os.stat(finished).st_ino
+        job.resume()
+        assert os.stat(finished).st_ino == inode
+        assert job.files_done == 2
+
+
+class TestMoveJob:
+    def test_moves_a_tree(self, src, dst):
+        make_tree(src / 'tree')
+        before = listing(src / 'tree')
+        job = MoveJob(src / 'tree', dst)
+        job.run()
+        assert not os.path.exists(src / 'tree')
+        assert listing(dst / 'tree') == before
+        assert job.paths == [str(src / 'tree'), str(dst / 'tree')]
+
+    def test_rename_policy(self, src, dst):
+        write(src / 'a.txt', b'new')
+        write(dst / 'a.txt', b'old')
+        MoveJob(src / 'a.txt', dst).run()
+        assert not os.path.exists(src / 'a.txt')
+        assert read(dst / 'a.txt') == b'old'
+        assert read(dst / 'a.txt (1)') == b'new'
+
+    def test_overwrite_policy(self, src, dst):
+        write(src / 'a.txt', b'new')
+        write(dst / 'a.txt', b'old')
+        MoveJob(src / 'a.txt', dst, policy='overwrite').run()
+        assert os.listdir(dst) == ['a.txt']
+        assert read(dst / 'a.txt') == b'new'
+
+    def test_overwrite_refuses_file_onto_directory(self, src, dst):
+        write(src / 'x', b'new')
+        (dst / 'x').mkdir()
+        with pytest.raises(OSError) as info:
+            MoveJob(src / 'x', dst, policy='overwrite').run()
+        assert info.value.errno == errno.EISDIR
+        assert read(src / 'x') == b'new'
+
+    def test_move_into_itself(self, src):
+        make_tree(src / 'tree')
+        with pytest.raises(OSError):
+            MoveJob(src / 'tree', src / 'tree' / 'sub-0').run()
+        assert os.path.isdir(src / 'tree' / 'sub-0')
+
+    def test_missing_source(self, src, dst):
+        with pytest.raises(FileNotFoundError):
+            MoveJob(src / 'missing', dst).run()
+
+    def test_resume_after_the_move(self, src, dst):
+        write(src / 'a.txt')
+        job = MoveJob(src / 'a.txt', dst)
+        job.run()
+        job.resume()
+        assert os.listdir(dst) == ['a.txt']
+
+    def test_move_to_the_same_directory(self, src):
+        write(src / 'a.txt')
+        MoveJob(src / 'a.txt', src).run()
+        assert os.listdir(src) == ['a.txt']
+
+    def test_rename_refused_across_mounts(self, src, dst, monkeypatch):
+        # a bind mount: same st_dev, but rename fails with EXDEV
+        def rename(src, dst):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        monkeypatch.setattr(os, 'rename', rename)
+        make_tree(src / 'tree')
+        before = listing(src / 'tree')
+        job = MoveJob(src / 'tree', dst)
+        job.run()
+        assert job.same_device is False
+        assert not os.path.exists(src / 'tree')
+        assert listing(dst / 'tree') == before
+
+    def test_cross_device_overwrite_keeps_the_source_data(self, src, dst):
+        write(src / 'f', b'AAAA')
+        write(dst / 'f', b'BBBB')
+        stat = os.stat(src / 'f')
+        os.utime(dst / 'f', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        job = MoveJob(src / 'f', dst, policy='overwrite')
+        job.same_device = False
+        job.run()
+        assert not os.path.exists(src / 'f')
+        assert read(dst / 'f') == b'AAAA'
+
+    def test_cross_device_mode(self, src, dst):
+        # the streaming mode, forced on one filesystem
+        make_tree(src / 'tree')
+        before = listing(src / 'tree')
+        job = MoveJob(src / 'tree', dst)
+        job.same_device = False
+        job.run()
+        assert not os.path.exists(src / 'tree')
+        assert listing(dst / 'tree') == before
+
+
+class TestBatchJob:
+    def test_sources_with_the_same_name(self, src, dst):
+        write(src / 'one' / 'a.txt', b'1')
+        write(src / 'two' / 'a.txt', b'2')
+        job = BatchJob([src / 'one' / 'a.txt', src / 'two' / 'a.txt'], dst)
+        job.run()
+        assert job.names == ['a.txt', 'a.txt (1)']
+        assert listing(dst) == {'a.txt': b'1', 'a.txt (1)': b'2'}
+
+
+class TestDeleteJob:
+    def test_deletes_files_and_trees(self, src):
+        make_tree(src / 'tree')
+        write(src / 'file')
+        job = DeleteJob([src / 'tree', src / 'file'])
+        job.run()
+        assert os.listdir(src) == []
+        assert sorted(job.drain()) == [str(src / 'file'), str(src / 'tree')]
+        assert job.files_done == 13
+        assert job.dirs_done == 7
+
+    def test_failed_paths_are_not_reported_removed(self, src):
+        write(src / 'file')
+        job = DeleteJob([src / 'missing', src / 'file'])
+        with pytest.raises(shutil.Error):
+            job.run()
+        assert job.drain() == [str(src / 'file')]
+
+    def test_one_tree_uses_the_whole_pool(self, src, monkeypatch):
+        make_tree(src / 'tree', subtrees=40, files=1)
+        calls = []
+        work = DeleteJob.work
+        monkeypatch.setattr(DeleteJob, 'work',
+                            lambda self, tasks: calls.append(1)
+                            or work(self, tasks))
+        DeleteJob([src / 'tree'], workers=8).run()
+        assert len(calls) == 8
+        assert not os.path.exists(src / 'tree')
+
+    def test_flat_directory_uses_the_whole_pool(self, src, monkeypatch):
+        for i in range(100):
+            write(src / 'flat' / f'file-{i}')
+        monkeypatch.setattr(DeleteJob, 'BATCH', 10)
+        calls = []
+        work = DeleteJob.work
+        monkeypatch.setattr(DeleteJob, 'work',
+                            lambda self, tasks: calls.append(1)
+                            or work(self, tasks))
+        job = DeleteJob([src / 'flat'], workers=8)
+        job.run()
+        assert len(calls) == 8
+        assert job.files_done == 100
+        assert os.listdir(src) == []
+
+    def test_cancel_stops_the_scan(self, src, monkeypatch):
+        for i in range(1000):
+            write(src / 'flat' / f'file-{i}')
+        monkeypatch.setattr(DeleteJob, 'BATCH', 1)
+        delete_file = DeleteJob.delete_file
+
+        def cancel_after_one(self, *args, **kwargs):
+            self.cancel()
+            return delete_file(self, *args, **kwargs)
+
+        monkeypatch.setattr(DeleteJob, 'delete_file', cancel_after_one)
+        job = DeleteJob([src / 'flat'])
+        with pytest.raises(Cancelled):
+            job.run()
+        assert len(os.listdir(src / 'flat')) > 900
+
+    def test_tree_goes_on_after_a_failed_rmdir(self, src, monkeypatch):
+        for name in ('a', 'b', 'c'):
+            write(src / 'tree' / name / 'file')
+        rmdir = os.rmdir
+
+        def refuse_b(path, *args, **kwargs):
+            if path == 'b':
+                raise PermissionError(errno.EACCES, 'Permission denied')
+            return rmdir(path, *args, **kwargs)
+
+        monkeypatch.setattr(os, 'rmdir', refuse_b)
+        job = DeleteJob([src / 'tree'])
+        job.delete_tree(str(src / 'tree'))
+        assert os.listdir(src / 'tree') == ['b']
+        assert os.listdir(src / 'tree' / 'b') == []
+        assert [path for path, _ in job.errors] == [
+            str(src / 'tree' / 'b'), str(src / 'tree')]
+
+    def test_deep_tree(self, src):
+        path = src / 'tree'
+        for i in range(200):
+            path = path / 'd'
+        write(path / 'file')
+        DeleteJob([src / 'tree']).run()
+        assert os.listdir(src) == []
+
+    def test_does_not_follow_links(self, src, dst):
+        write(dst / 'kept')
+        (src / 'tree').mkdir()
+        os.symlink(dst, src / 'tree' / 'link')
+        DeleteJob([src / 'tree']).run()
+        assert os.listdir(src) == []
+        assert os.listdir(dst) == ['kept']
+
+    def test_resume(self, src):
+        make_tree(src / 'tree')
+        job = DeleteJob([src / 'tree', src / 'gone'])
+        job.cancel()
+        with pytest.raises(Cancelled):
+            job.run()
+        job.resume()
+        assert os.listdir(src) == []
+        assert job.paths == [str(src / 'tree')]
@@ -0,0 +1,68 @@
+import time
+from threading import Event
+
+from previews import PreviewPool
+
+
+def wait_result(pool, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = pool.poll()
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    raise AssertionError('no result')
+
+
+def blocker(pool):
+    # keeps pool's only worker busy until the returned event is set
+    started, release = Event(), Event()
+
+    def block():
+        started.set()
+        release.wait()
+        return 'old'
+
+    pool.request(block)
+    assert started.wait(5)
+    return release
+
+
+def test_result():
+    pool = PreviewPool(workers=1)
+    pool.request(lambda: 'preview')
+    assert wait_result(pool) == 'preview'
+    assert pool.poll() is None
+
+
+def test_errors_are_results():
+    pool = PreviewPool(workers=1)
+    pool.request(lambda: 1 / 0)
+    assert isinstance(wait_result(pool), ZeroDivisionError)
+
+
+def test_newer_request_supersedes():
+    pool = PreviewPool(workers=1)
+    release = blocker(pool)
+    ran = []
+    pool.request(lambda: ran.append('skipped'),
+                 prefetch=[lambda: ran.append('prefetch')])
+    generation = pool.request(lambda: 'new')
+    release.set()
+    assert wait_result(pool) == 'new'
+    assert pool.generation == generation
+    assert ran == [] # queued work of older requests is dropped
+
+
+def test_prefetch_runs_after_the_request():
+    pool = PreviewPool(workers=1)
+    release = blocker(pool)
+    ran = []
+    pool.request(lambda: ran.append('current') or 'shown',
+                 prefetch=[lambda: ran.append('next')])
+    release.set()
+    assert wait_result(pool) == 'shown'
+    deadline = time.monotonic() + 5
+    while len(ran) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ran == ['current', 'next']
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from manager import File
+from quickfilter import QuickFilter
+
+
+NAMES = ['Alpha.txt', 'alphabet', 'beta.py', 'gamma.txt', 'delta', 'ALP']
+
+
+def run(filter):
+    while not filter.step():
+        pass
+    return [file.name for file in filter]
+
+
+@pytest.fixture
+def filter():
+    filter = QuickFilter()
+    filter.set_listing([File(os.path.join('/', name)) for name in NAMES], 1)
+    return filter
+
+
+class TestQuickFilter:
+    @pytest.mark.parametrize('mode, query, expected', [
+        ('substring', 'alp', ['Alpha.txt', 'alphabet', 'ALP']),
+        ('substring', 'TXT', ['Alpha.txt', 'gamma.txt']),
+        ('prefix', 'al', ['Alpha.txt', 'alphabet', 'ALP']),
+        ('prefix', 'lph', []),
+        ('glob', '*.txt', ['Alpha.txt', 'gamma.txt']),
+        ('fuzzy', 'apt', ['Alpha.txt', 'alphabet']),
+    ])
+    def test_modes(self, filter, mode, query, expected):
+        filter.set_query(query, mode)
+        assert run(filter) == expected
+
+    def test_empty_query_shows_everything(self, filter):
+        filter.set_query('')
+        assert run(filter) == NAMES
+        assert filter.row_of(3) == 3
+
+    def test_narrowing_rescans_earlier_matches(self, filter):
+        filter.set_query('al')
+        run(filter)
+        filter.set_query('alph')
+        assert filter.candidates == [0, 1, 5]
+        assert run(filter) == ['Alpha.txt', 'alphabet']
+        filter.set_query('al')
+        assert filter.done # kept from the first scan
+        assert run(filter) == ['Alpha.txt', 'alphabet', 'ALP']
+
+    def test_row_of(self, filter):
+        filter.set_query('txt')
+        run(filter)
+        assert filter.row_of(0) == 0
+        assert filter.row_of(3) == 1
+        assert filter.row_of(1) is None
+
+    def test_new_listing_starts_over(self, filter):
+        filter.set_query('alp')
+        run(filter)
+        assert not filter.set_listing(filter.files, 1)
+        assert filter.set_listing([File('/alpine')], 2)
+        assert run(filter) == ['alpine']
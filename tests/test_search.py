@@ -0,0 +1,93 @@
+import pytest
+
+from search import Query, Search, grep, parse_query
+
+
+NOW = 1_000_000_000.0
+
+
+class TestParseQuery:
+    def test_plain_word_is_a_substring(self):
+        query = parse_query('report', now=NOW)
+        assert query.pattern == '*report*'
+        assert query.name('Annual-REPORT.pdf')
+        assert not query.name('repo.pdf')
+
+    def test_glob(self):
+        query = parse_query('*.pdf', now=NOW)
+        assert query.name('a.PDF')
+        assert not query.name('a.pdf.bak')
+
+    def test_regex(self):
+        query = parse_query(r're:^\d+$', now=NOW)
+        assert query.regex
+        assert query.name('2024')
+        assert not query.name('v2024')
+
+    @pytest.mark.parametrize('word, field, value', [
+        ('size>1M', 'min_size', 1024 ** 2),
+        ('size<10k', 'max_size', 10 * 1024),
+        ('size>1.5KiB', 'min_size', 1536),
+        ('size>100', 'min_size', 100),
+        ('size<2GB', 'max_size', 2 * 1024 ** 3),
+        ('Size>10k', 'min_size', 10 * 1024),
+        ('SIZE<1m', 'max_size', 1024 ** 2),
+    ])
+    def test_sizes(self, word, field, value):
+        query = parse_query(word, now=NOW)
+        assert getattr(query, field) == value
+        assert query.sized and not query.timed
+
+    def test_ages(self):
+        query = parse_query('mtime<7d MTime>2H', now=NOW)
+        assert query.newer == NOW - 7 * 86400
+        assert query.older == NOW - 2 * 3600
+        assert query.timed
+
+    @pytest.mark.parametrize('word, type', [
+        ('type:f', 'file'), ('type:file', 'file'),
+        ('type:d', 'directory'), ('type:dir', 'directory'),
+    ])
+    def test_types(self, word, type):
+        assert parse_query(word, now=NOW).type == type
+
+    def test_content_and_quoting(self):
+        query = parse_query('"grep:two words" *.txt', now=NOW)
+        assert query.content == b'two words'
+        assert query.pattern == '*.txt'
+        assert parse_query('content:x', now=NOW).content == b'x'
+
+    @pytest.mark.parametrize('text', [
+        '', 'size>1q', 'mtime<3y', 'type:socket', 'one two', 're:(',
+    ])
+    def test_errors(self, text):
+        with pytest.raises(ValueError):
+            parse_query(text, now=NOW)
+
+
+def test_grep_across_blocks(tmp_path):
+    path = tmp_path / 'data'
+    path.write_bytes(b'a' * 6 + b'needle' + b'a' * 6)
+    assert grep(path, b'needle', block=8)
+    assert not grep(path, b'needles', block=8)
+    assert not grep(tmp_path / 'missing', b'needle')
+
+
+def test_search_matches(tmp_path):
+    (tmp_path / 'sub' / 'deeper').mkdir(parents=True)
+    (tmp_path / 'sub' / 'deeper' / 'report.txt').write_bytes(b'invoice')
+    (tmp_path / 'sub' / 'report.pdf').write_bytes(b'x' * 2048)
+    (tmp_path / 'report-dir').mkdir()
+    search = Search(str(tmp_path), parse_query('report* size>1k'))
+    search.start()
+    while not search.finished:
+        search.drain()
+    search.drain()
+    assert [file.name for file in search.results] == ['report.pdf']
+
+    search = Search(str(tmp_path), Query(name='report*', content='invoice'))
+    search.start()
+    while not search.finished:
+        search.drain()
+    search.drain()
+    assert [file.name for file in search.results] == ['report.txt']
@@ -0,0 +1,82 @@
+import os
+from collections import namedtuple
+
+import pytest
+
+from thumbnails import ThumbnailCache
+
+
+Image = namedtuple('Image', ['width', 'height']) # what put() looks at
+
+
+@pytest.mark.parametrize('img_size, height, expected', [
+    ((800, 600), 100, (133, 100)),
+    ((100, 1000), 100, (10, 100)),
+    ((5000, 100), 100, (200, 100)), # width capped at twice the height
+    ((1, 5000), 100, (1, 100)),
+])
+def test_target_size(img_size, height, expected):
+    assert ThumbnailCache.target_size(img_size, height) == expected
+
+
+@pytest.mark.parametrize('size, bucket', [
+    (100, 'normal'), (128, 'normal'), (129, 'large'), (1024, 'xx-large'),
+    (5000, 'xx-large'),
+])
+def test_bucket(size, bucket):
+    assert ThumbnailCache.bucket(size)[0] == bucket
+
+
+def test_disk_path(tmp_path):
+    cache = ThumbnailCache(root=str(tmp_path))
+    uri, path = cache.disk_path('/tmp/a b.png', 'large')
+    assert uri == 'file:///tmp/a%20b.png'
+    assert os.path.dirname(path) == str(tmp_path / 'large')
+    assert path.endswith('.png')
+
+
+def test_memory_lru(tmp_path):
+    cache = ThumbnailCache(max_items=2, max_bytes=10_000,
+                           root=str(tmp_path))
+    cache.put('a', Image(10, 10))
+    cache.put('b', Image(10, 10))
+    cache.put('a', Image(10, 10)) # already there
+    assert cache.stats()['items'] == 2 and cache.bytes == 800
+    cache.put('c', Image(10, 10))
+    assert list(cache._images) == ['b', 'c']
+    cache.put('huge', Image(100, 100)) # alone over max_bytes, still kept
+    assert list(cache._images) == ['huge']
+    assert cache.bytes == 40_000
+
+
+@pytest.fixture
+def picture(tmp_path):
+    PIL = pytest.importorskip('PIL.Image')
+    path = tmp_path / 'pictures' / 'big.png'
+    path.parent.mkdir()
+    PIL.new('RGB', (1200, 600), 'red').save(path)
+    return str(path)
+
+
+def test_tiers(tmp_path, picture):
+    root = str(tmp_path / 'thumbnails')
+    cache = ThumbnailCache(root=root)
+    img = cache.get(picture, 100)
+    assert img.size == (200, 100)
+    assert cache.get(picture, 100) is img
+    assert os.listdir(os.path.join(root, 'large')) # twice the height
+
+    restarted = ThumbnailCache(root=root)
+    assert restarted.get(picture, 100).size == (200, 100)
+    assert (cache.stats()['misses'], cache.stats()['memory_hits']) == (1, 1)
+    assert restarted.stats()['disk_hits'] == 1
+
+
+def test_changed_file_is_decoded_again(tmp_path, picture):
+    root = str(tmp_path / 'thumbnails')
+    ThumbnailCache(root=root).get(picture, 100)
+    stat = os.stat(picture)
+    os.utime(picture, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    cache = ThumbnailCache(root=root)
+    cache.get(picture, 100)
+    assert (cache.stats()['disk_hits'], cache.stats()['misses']) == (0, 1)
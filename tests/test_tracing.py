@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    monkeypatch.setattr(tracing, 'tracer', None)
+    return tracing.enable()
+
+
+def test_off_costs_nothing(monkeypatch):
+    monkeypatch.setattr(tracing, 'tracer', None)
+
+    def func():
+        return 1
+
+    assert tracing.traced('name')(func) is func
+    assert tracing.span('name') is tracing.NULL_SPAN
+    assert not tracing.enabled()
+
+
+def test_traced_and_span(tracer):
+    @tracing.traced('work')
+    def work(fail=False):
+        if fail:
+            raise ValueError
+        return 42
+
+    assert work() == 42
+    with pytest.raises(ValueError):
+        work(fail=True)
+    with tracing.span('block'):
+        pass
+    assert tracing.enabled() and tracing.enable() is tracer
+    counts = {name: count for name, count, *_ in tracer.stats()}
+    assert counts == {'work': 2, 'block': 1}
+
+
+def test_stats_percentiles(tracer):
+    for ms in range(1, 101):
+        tracer.record('op', 0, ms * 1_000_000)
+    tracer.record('slow', 0, 500 * 1_000_000)
+    (name, count, p50, p99, worst), (other, *_) = tracer.stats()
+    assert (name, count, worst) == ('slow', 1, 500)
+    assert other == 'op'
+    assert tracer.stats()[1][2:] == (51, 100, 100)
+
+
+def test_dump(tracer, tmp_path):
+    start = tracer.origin
+    tracer.record('op', start + 1000, start + 3000, 'tk')
+    path = tracing.dump(str(tmp_path / 'trace.json'))
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    span, thread = events
+    assert (span['name'], span['cat'], span['ph']) == ('op', 'tk', 'X')
+    assert (span['ts'], span['dur']) == (1, 2)
+    assert thread['ph'] == 'M' and thread['tid'] == span['tid']
@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+from watcher import InotifyWatcher, PollingWatcher
+
+
+def wait_for(watcher, timeout=5.0):
+    # changes seen within timeout, merged over several drains
+    names, reload = set(), False
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        drained, drained_reload = watcher.drain()
+        names |= drained
+        reload |= drained_reload
+        if names or reload:
+            # let the rest of a burst arrive
+            time.sleep(0.2)
+            drained, drained_reload = watcher.drain()
+            return names | drained, reload or drained_reload
+        time.sleep(0.02)
+    return names, reload
+
+
+def bump_mtime(path):
+    # the polling watcher only looks at the directory's mtime
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def polling(tmp_path):
+    (tmp_path / 'old').touch()
+    watcher = PollingWatcher(str(tmp_path), interval=0.05)
+    yield watcher
+    watcher.close()
+
+
+class TestPollingWatcher:
+    def test_creations_and_deletions(self, tmp_path, polling):
+        (tmp_path / 'new').touch()
+        os.unlink(tmp_path / 'old')
+        bump_mtime(tmp_path)
+        assert wait_for(polling) == ({'new', 'old'}, False)
+
+    def test_rename(self, tmp_path, polling):
+        os.rename(tmp_path / 'old', tmp_path / 'renamed')
+        bump_mtime(tmp_path)
+        assert wait_for(polling) == ({'old', 'renamed'}, False)
+
+    def test_unchanged_directory(self, polling):
+        assert wait_for(polling, timeout=0.3) == (set(), False)
+
+    def test_close_stops_the_thread(self, polling):
+        polling.close()
+        polling.thread.join(timeout=1.0)
+        assert not polling.thread.is_alive()
+
+
+@pytest.fixture
+def inotify(tmp_path):
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except (OSError, AttributeError):
+        pytest.skip('inotify is not available')
+    yield watcher
+    watcher.close()
+
+
+class TestInotifyWatcher:
+    def test_changes(self, tmp_path, inotify):
+        (tmp_path / 'new').write_bytes(b'data')
+        assert wait_for(inotify) == ({'new'}, False)
+
+    def test_directory_removed(self, tmp_path, inotify):
+        os.rmdir(tmp_path)
+        assert wait_for(inotify)[1]
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+from tracing import traced
+
+
+def cache_home():
+    return os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+
+
+class ThumbnailCache():
+    # Two tiers: an in-memory LRU of ready-to-show images keyed by
+    # (path, size, mtime, target height), and an on-disk store following the
+    # freedesktop thumbnail layout (~/.cache/thumbnails/<bucket>/<md5>.png
+    # with Thumb::URI / Thumb::MTime / Thumb::Size), which survives restarts.
+    # PIL is imported by the first preview, not at startup.
+    BUCKETS = (('normal', 128), ('large', 256),
+               ('x-large', 512), ('xx-large', 1024))
+
+    def __init__(self, max_items=256, max_bytes=64 * 2**20, root=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.root = root or os.path.join(cache_home(), 'thumbnails')
+        self.bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def target_size(img_size, height):
+        # same geometry InfoWindow always used: fixed height, width capped
+        # at twice the height
+        width = min(int(img_size[0] * height / img_size[1]), height * 2)
+        return max(width, 1), height
+
+    @classmethod
+    def bucket(cls, size):
+        for name, bucket_size in cls.BUCKETS:
+            if size <= bucket_size:
+                return name, bucket_size
+        return cls.BUCKETS[-1]
+
+    @traced('preview.thumbnail')
+    def get(self, path, height, stat=None):
+        from PIL import Image
+        stat = stat or os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns, height)
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                self.memory_hits += 1
+                return img
+
+        img = self.load_disk(path, height, stat)
+        if img is None:
+            self.misses += 1
+            img = self.make_thumbnail(path, height, stat)
+        else:
+            self.disk_hits += 1
+        img = img.resize(self.target_size(img.size, height),
+                         Image.Resampling.LANCZOS)
+        self.put(key, img)
+        return img
+
+    def put(self, key, img):
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = img
+            self.bytes += img.width * img.height * 4
+            while (len(self._images) > self.max_items
+                   or self.bytes > self.max_bytes) and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self.bytes -= evicted.width * evicted.height * 4
+
+    def disk_path(self, path, bucket):
+        uri = Path(os.path.abspath(path)).as_uri()
+        name = hashlib.md5(uri.encode()).hexdigest() + '.png'
+        return uri, os.path.join(self.root, bucket, name)
+
+    def load_disk(self, path, height, stat):
+        from PIL import Image
+        bucket, _ = self.bucket(height * 2)
+        _, thumb_path = self.disk_path(path, bucket)
+        try:
+            img = Image.open(thumb_path)
+            img.load()
+        except (OSError, ValueError):
+            return None
+        if (img.info.get('Thumb::MTime') != str(int(stat.st_mtime))
+                or img.info.get('Thumb::Size') != str(stat.st_size)):
+            return None
+        return img
+
+    @traced('preview.decode')
+    def make_thumbnail(self, path, height, stat):
+        from PIL import Image
+        bucket, bucket_size = self.bucket(height * 2)
+        img = Image.open(path)
+        source_size = img.size
+        if img.format == 'JPEG':
+            # reduced-resolution decode, no full-size pixels in memory
+            img.draft('RGB', (bucket_size, bucket_size))
+        img.thumbnail((bucket_size, bucket_size), Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        if max(source_size) > bucket_size:
+            self.save_disk(img, path, bucket, stat)
+        return img
+
+    def save_disk(self, img, path, bucket, stat):
+        from PIL import PngImagePlugin
+        uri, thumb_path = self.disk_path(path, bucket)
+        if os.path.abspath(path).startswith(self.root + os.path.sep):
+            return
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Thumb::URI', uri)
+        info.add_text('Thumb::MTime', str(int(stat.st_mtime)))
+        info.add_text('Thumb::Size', str(stat.st_size))
+        try:
+            os.makedirs(os.path.dirname(thumb_path), mode=0o700,
+                        exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix='.png',
+                                       dir=os.path.dirname(thumb_path))
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, 'PNG', pnginfo=info)
+            os.replace(tmp, thumb_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': ((self.memory_hits + self.disk_hits) / lookups
+                             if lookups else 0.0),
+                'items': len(self._images),
+                'bytes': self.bytes}
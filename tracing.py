@@ -0,0 +1,202 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from functools import wraps
+
+
+ENV = 'PYMANAGER_TRACE' # set to anything to trace from the start
+MAX_SAMPLES = 2048 # latest durations kept per span, for percentiles
+MAX_EVENTS = 500_000 # latest spans kept for the Chrome trace
+STALL_MS = 50 # event loop delays longer than this are stalls
+
+
+def percentile(ordered, q):
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Tracer():
+    # Collects timing spans from any thread: per name the latest durations
+    # (for p50/p99) and a total count, plus a bounded log of every span for
+    # the Chrome trace-event dump. Times are perf_counter_ns.
+    def __init__(self):
+        self.samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+        self.counts = defaultdict(int)
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.threads = {} # ident -> name, for the dump
+        self.origin = time.perf_counter_ns()
+
+    def record(self, name, start, end, category='span'):
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        self.samples[name].append(end - start)
+        self.counts[name] += 1
+        self.events.append((name, category, start, end - start, tid))
+
+    def stats(self):
+        # [(name, count, p50, p99, max)], times in ms, worst p99 first
+        rows = []
+        for name, samples in list(self.samples.items()):
+            ordered = sorted(samples.copy())
+            if not ordered:
+                continue
+            rows.append((name, self.counts[name],
+                         percentile(ordered, 0.5) / 1e6,
+                         percentile(ordered, 0.99) / 1e6,
+                         ordered[-1] / 1e6))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
+
+    def dump(self, path):
+        # Chrome trace-event format, for chrome://tracing or Perfetto
+        pid = os.getpid()
+        events = [{'name': name, 'cat': category, 'ph': 'X', 'pid': pid,
+                   'tid': tid, 'ts': (start - self.origin) / 1000,
+                   'dur': duration / 1000}
+                  for name, category, start, duration, tid
+                  in list(self.events)]
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                    'args': {'name': name}}
+                   for tid, name in list(self.threads.items())]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+
+tracer = None # the Tracer while tracing is on
+
+
+def enable():
+    # only functions decorated after this are traced: call it before
+    # importing the modules to trace
+    global tracer
+    if tracer is None:
+        tracer = Tracer()
+    return tracer
+
+
+if os.environ.get(ENV):
+    enable()
+
+
+def enabled():
+    return tracer is not None
+
+
+def traced(name):
+    # decorator timing every call as a span; with tracing off the function
+    # is returned as it is, so it costs nothing
+    def decorate(func):
+        if tracer is None:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.record(name, start, time.perf_counter_ns())
+        return wrapper
+    return decorate
+
+
+def untraced(func):
+    # Tk callbacks that should not show up, like the overlay's own refresh
+    func.untraced = True
+    return func
+
+
+class Span():
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        tracer.record(self.name, self.start, time.perf_counter_ns())
+
+
+NULL_SPAN = nullcontext()
+
+
+def span(name):
+    # 'with span(name):' around a block; a shared no-op with tracing off
+    return NULL_SPAN if tracer is None else Span(name)
+
+
+def callback_of(func):
+    # the function Misc.after() wraps in its 'callit' closure
+    code = getattr(func, '__code__', None)
+    if (code is not None and code.co_name == 'callit'
+            and 'func' in code.co_freevars):
+        return func.__closure__[code.co_freevars.index('func')].cell_contents
+    return func
+
+
+def trace_tk():
+    # times every Tk callback (event handlers, after() calls and widget
+    # commands) from then on, named after the Python function
+    import tkinter
+    base = tkinter.CallWrapper
+    if tracer is None or getattr(base, 'traced', False):
+        return
+
+    class CallWrapper(base):
+        traced = True
+
+        def __init__(self, func, subst, widget):
+            base.__init__(self, func, subst, widget)
+            target = callback_of(func)
+            self.name = None
+            if not getattr(target, 'untraced', False):
+                self.name = 'tk ' + getattr(target, '__qualname__',
+                                            type(target).__name__)
+
+        def __call__(self, *args):
+            if self.name is None:
+                return base.__call__(self, *args)
+            start = time.perf_counter_ns()
+            try:
+                return base.__call__(self, *args)
+            finally:
+                tracer.record(self.name, start, time.perf_counter_ns(),
+                              'tk')
+
+    tkinter.CallWrapper = CallWrapper
+
+
+class LoopMonitor():
+    # Event loop stalls: a heartbeat runs every interval_ms, when it comes
+    # more than STALL_MS late the loop was blocked and the delay is
+    # recorded as an 'event loop stall' span.
+    def __init__(self, root, interval_ms=20):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.expected = time.perf_counter_ns() + interval_ms * 1_000_000
+        self.root.after(interval_ms, self.beat)
+
+    @untraced
+    def beat(self):
+        now = time.perf_counter_ns()
+        if now - self.expected > STALL_MS * 1_000_000:
+            tracer.record('event loop stall', self.expected, now, 'stall')
+        self.expected = now + self.interval_ms * 1_000_000
+        self.root.after(self.interval_ms, self.beat)
+
+
+def default_path():
+    return os.path.join(tempfile.gettempdir(),
+                        f'pymanager-trace-{os.getpid()}.json')
+
+
+def dump(path=None):
+    # writes the Chrome trace, returns its path
+    return tracer.dump(path or default_path())
@@ -0,0 +1,160 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from threading import Event, Lock, Thread
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+              | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT = struct.Struct('iIII')
+
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                            use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                            ctypes.c_uint32]
+    return _libc
+
+
+class Watcher():
+    # Collects names of entries of one directory that changed. Bursts are
+    # coalesced: drain() returns each changed name once, the caller looks
+    # at the filesystem to see what the name is now. reload is set when
+    # events were lost and the directory has to be listed again.
+    def __init__(self, path):
+        self.path = path
+        self.names = set()
+        self.reload = False
+        self.closed = False
+        self._lock = Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.names.add(name)
+
+    def drain(self):
+        with self._lock:
+            names, self.names = self.names, set()
+            reload, self.reload = self.reload, False
+        return names, reload
+
+    def close(self):
+        self.closed = True
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, path):
+        Watcher.__init__(self, path)
+        lib = libc()
+        self.fd = lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed', path)
+        if lib.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed', path)
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.closed:
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                self.parse(data)
+        finally:
+            os.close(self.fd)
+
+    def parse(self, data):
+        pos = 0
+        while pos + EVENT.size <= len(data):
+            _, mask, _, length = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF
+                       | IN_IGNORED):
+                self.reload = True
+            elif name:
+                self.add(os.fsdecode(name))
+
+
+class PollingWatcher(Watcher):
+    # Fallback: compares the directory's mtime every interval and diffs the
+    # set of names when it changed. Sees creations, deletions and renames,
+    # not writes to existing files.
+    def __init__(self, path, interval=1.0):
+        Watcher.__init__(self, path)
+        self.interval = interval
+        self._stop = Event()
+        self.signature = self.stat()
+        self.entries = self.list()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def list(self):
+        try:
+            with os.scandir(self.path) as entries:
+                return {entry.name for entry in entries}
+        except OSError:
+            return set()
+
+    def close(self):
+        Watcher.close(self)
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            signature = self.stat()
+            if signature == self.signature:
+                continue
+            self.signature = signature
+            entries = self.list()
+            for name in entries ^ self.entries:
+                self.add(name)
+            self.entries = entries
+
+
+def watch(path):
+    # inotify where available (Linux), mtime polling elsewhere
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError):
+        return PollingWatcher(path)